@@ -0,0 +1,56 @@
+"""Per-block cost of the engine callbacks at different voice counts and block sizes.
+
+Covers `AudioEngineSD.audio_callback` and, if the extension is built,
+`CppAudioEngine::process` (through its offline `render` entry point).
+"""
+import tempfile
+from common import make_config, time_us
+import numpy as np
+import soundfile as sf
+from audio_sd import AudioEngineSD
+try:
+    import groovebox_audio_cpp
+except ImportError:
+    groovebox_audio_cpp = None
+
+VOICE_COUNTS = [0, 1, 8, 32, 64, 128]
+BLOCK_SIZES = [128, 256, 512, 1024]
+
+def bench_sd(cfg, repeats):
+    engine = AudioEngineSD(cfg, start_stream=False)
+    results = []
+    for block_size in BLOCK_SIZES:
+        out = np.zeros((block_size, 2), dtype=np.float32)
+        for voices in VOICE_COUNTS:
+            engine.reset()
+            for v in range(voices):
+                engine.play_sound_at(v % len(cfg.pads), v * 7, velocity=0.5, reverb_send=0.2, delay_send=0.1)
+            engine.audio_callback(out, block_size, None, None)
+            timing = time_us(lambda: engine.audio_callback(out, block_size, None, None), repeats)
+            results.append({'block_size': block_size, 'voices': voices, 'us_per_block': timing})
+    return results
+
+def bench_cpp(cfg, repeats):
+    if groovebox_audio_cpp is None:
+        return {'skipped': 'groovebox_audio_cpp not built'}
+    samples = [sf.read(pad.sample, always_2d=True, dtype='float32')[0] for pad in cfg.pads]
+    results = []
+    for block_size in BLOCK_SIZES:
+        out = np.zeros((block_size, 2), dtype=np.float32)
+        for voices in VOICE_COUNTS:
+            # Fresh engine so the clock and voice pool start empty
+            engine = groovebox_audio_cpp.CppAudioEngine(44100, max(VOICE_COUNTS))
+            for pad, data in zip(cfg.pads, samples):
+                engine.load_sample(pad.id, data)
+            for v in range(voices):
+                engine.play_sound_at(cfg.pads[v % len(cfg.pads)].id, v * 7, 0.5, 0.2, 0.1)
+            engine.render(out)
+            timing = time_us(lambda: engine.render(out), repeats)
+            results.append({'block_size': block_size, 'voices': voices, 'us_per_block': timing})
+    return results
+
+def run(repeats=200):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Long samples so every voice sounds for the whole measurement
+        cfg = make_config(tmpdir, seconds=10.0, polyphony=max(VOICE_COUNTS))
+        return {'sd_callback': bench_sd(cfg, repeats), 'cpp_process': bench_cpp(cfg, repeats)}
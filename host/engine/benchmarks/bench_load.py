@@ -0,0 +1,45 @@
+"""Sample load times through each engine's `load_sample`, and the cost of a trim edit after it.
+
+Each load gets a fresh SampleStore, so nothing is served from a previous
+iteration's in-process cache: `cold_us` starts from an empty cache directory
+(decode, resample, analyse), `hit_us` from one the file is already cached in.
+"""
+import os
+import tempfile
+from common import make_config, write_noise, time_us
+from sample_store import SampleStore
+from audio_sd import AudioEngineSD
+from audio_cpp import AudioEngineCpp, AVAILABLE as CPP_AVAILABLE
+
+LENGTHS_SECONDS = [0.5, 5.0, 30.0]
+
+def run(repeats=10):
+    results = []
+    previous_cache = os.environ.get("GROOVEBOX_SAMPLE_CACHE")
+    with tempfile.TemporaryDirectory() as tmpdir, tempfile.TemporaryDirectory() as cache_root:
+        # Keep the engines' default store, and everything below, out of the user's cache
+        os.environ["GROOVEBOX_SAMPLE_CACHE"] = cache_root
+        try:
+            cfg = make_config(tmpdir, pads=1, seconds=0.1)
+            engines = {'sd': AudioEngineSD(cfg, start_stream=False)}
+            if CPP_AVAILABLE:
+                engines['cpp'] = AudioEngineCpp(cfg, start_stream=False)
+            for seconds in LENGTHS_SECONDS:
+                path = write_noise(os.path.join(tmpdir, f"load_{seconds}.wav"), seconds)
+                for name, engine in engines.items():
+                    def cold_store():
+                        engine.store = SampleStore(tempfile.mkdtemp(dir=cache_root))
+                    hit_dir = tempfile.mkdtemp(dir=cache_root)
+                    SampleStore(hit_dir).peaks(path, engine.sample_rate)
+                    def hit_store():
+                        engine.store = SampleStore(hit_dir)
+                    cold = time_us(lambda: engine.load_sample(0, path), repeats, setup=cold_store)
+                    hit = time_us(lambda: engine.load_sample(0, path), repeats, setup=hit_store)
+                    edit = time_us(lambda: engine.set_trim(0, 0.1, 0.9), repeats)
+                    results.append({'engine': name, 'seconds': seconds, 'cold_us': cold, 'hit_us': hit, 'trim_us': edit})
+        finally:
+            if previous_cache is None:
+                del os.environ["GROOVEBOX_SAMPLE_CACHE"]
+            else:
+                os.environ["GROOVEBOX_SAMPLE_CACHE"] = previous_cache
+    return results
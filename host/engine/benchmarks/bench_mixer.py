@@ -0,0 +1,62 @@
+"""Voices-per-block benchmark for the sounddevice engine's mixers.
+
+Times `AudioEngineSD.render_block` with the per-voice (serial) mixer and the
+batched mixer at increasing voice counts, and reports how many voices each
+path can mix within a fraction of the block's realtime budget.
+
+    python host/engine/benchmarks/bench_mixer.py [--block-sizes 256 512] [--budget 0.5]
+"""
+import argparse
+import tempfile
+from common import make_config, time_us
+import numpy as np
+from audio_sd import AudioEngineSD
+
+VOICE_COUNTS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512]
+
+def time_block(engine, mixer, voices, block_size, repeats):
+    """Median microseconds per render_block with `voices` voices sounding throughout."""
+    engine.mixer = mixer
+    engine.reset()
+    for v in range(voices):
+        # Staggered starts so every block has voices starting mid-block and playing through
+        engine.play_sound_at(v % 8, v * 7, velocity=0.5, reverb_send=0.2, delay_send=0.1)
+    out = np.zeros((block_size, 2), dtype=np.float32)
+    engine.render_block(out, block_size) # warm up and start the voices
+    return time_us(lambda: engine.render_block(out, block_size), repeats)['median']
+
+def run(block_sizes, budget, repeats=50):
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        engine = AudioEngineSD(make_config(tmpdir, polyphony=max(VOICE_COUNTS)), start_stream=False)
+        for block_size in block_sizes:
+            budget_us = block_size / engine.sample_rate * 1e6 * budget
+            row = {'block_size': block_size, 'budget_us': budget_us, 'us_per_block': {}, 'max_voices': {}}
+            for mixer in ('serial', 'batched'):
+                timings = {n: time_block(engine, mixer, n, block_size, repeats) for n in VOICE_COUNTS}
+                row['us_per_block'][mixer] = timings
+                fits = [n for n, us in timings.items() if us <= budget_us]
+                row['max_voices'][mixer] = max(fits) if fits else 0
+            results.append(row)
+    return results
+
+def print_table(results):
+    for row in results:
+        print(f"block {row['block_size']} frames, budget {row['budget_us']:.0f} us")
+        print(f"  {'voices':>6} {'serial us':>10} {'batched us':>11}")
+        for n in VOICE_COUNTS:
+            serial = row['us_per_block']['serial'][n]
+            batched = row['us_per_block']['batched'][n]
+            print(f"  {n:>6} {serial:>10.1f} {batched:>11.1f}")
+        print(f"  voices within budget: serial {row['max_voices']['serial']}, batched {row['max_voices']['batched']}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--block-sizes", type=int, nargs='+', default=[256, 512, 1024])
+    parser.add_argument("--budget", type=float, default=0.5, help="Fraction of the block duration the mixer may use")
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+    print_table(run(args.block_sizes, args.budget, args.repeats))
+
+if __name__ == "__main__":
+    main()
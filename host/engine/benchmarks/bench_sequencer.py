@@ -0,0 +1,114 @@
+"""Step-timing jitter of the sequencer under a simulated 60 FPS UI loop.
+
+Compares the sample-clock scheduler (`play_sound_at` with lookahead) to the
+`time.monotonic()` polling fallback, with increasing simulated draw cost.
+Onsets are measured against an ideal grid anchored at the first step.
+
+`run_step_eval` times one step of the packed patterns at large track and
+step counts.
+"""
+import random
+import time
+import common # noqa: F401, puts groovebox on sys.path
+import numpy as np
+from config import GrooveboxConfig, PadConfig
+from sequencer import Sequencer, Track, Step, make_empty_pattern
+
+DRAW_MS = [0, 10, 30]
+SAMPLE_RATE = 44100
+
+class PollingEngine:
+    """Stand-in backend without a sample clock, so the sequencer polls time.monotonic()."""
+    sample_rate = SAMPLE_RATE
+
+    def __init__(self):
+        self.t0 = time.monotonic()
+        self.onsets = []
+
+    def now_frame(self):
+        return int((time.monotonic() - self.t0) * self.sample_rate)
+
+    def play_sound(self, pad_id, velocity=1.0, reverb_send=0.0, delay_send=0.0, sample_offset=0.0, pitch=0.0):
+        self.onsets.append(self.now_frame() + int(sample_offset * self.sample_rate))
+
+class ClockedEngine(PollingEngine):
+    """Stand-in backend whose sample clock follows wall time."""
+
+    def get_frame_position(self):
+        return self.now_frame()
+
+    def play_sound_at(self, pad_id, frame, velocity=1.0, reverb_send=0.0, delay_send=0.0, pitch=0.0):
+        # A voice queued for the past starts as soon as the engine sees it
+        self.onsets.append(max(frame, self.now_frame()))
+
+def measure(engine, draw_ms, seconds, rng):
+    cfg = GrooveboxConfig(bpm=120, beats_per_bar=16, pads=[])
+    seq = Sequencer(make_empty_pattern(cfg), make_empty_pattern(cfg), make_empty_pattern(cfg), engine)
+    # One track, every step on
+    for pattern in seq.patterns.values():
+        pattern.tracks = [Track(pad_id=0, steps=[Step(state=1) for _ in range(16)])]
+    seq.toggle_play()
+
+    frame_time = 1.0 / 60
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        t0 = time.monotonic()
+        seq.tick()
+        time.sleep(rng.uniform(0, draw_ms) / 1000.0) # draw()
+        time.sleep(max(0.0, frame_time - (time.monotonic() - t0)))
+
+    onsets = np.array(engine.onsets, dtype=np.float64)
+    step_frames = seq._step_duration_seconds() * engine.sample_rate
+    ideal = onsets[0] + np.arange(len(onsets)) * step_frames
+    error_ms = (onsets - ideal) / engine.sample_rate * 1000.0
+    # Drift from the grid accumulates in the polling path; report deviation per step as well
+    step_error_ms = np.abs(np.diff(onsets) - step_frames) / engine.sample_rate * 1000.0
+    return {
+        'steps': len(onsets),
+        'drift_ms_max': float(np.abs(error_ms).max()),
+        'jitter_ms_mean': float(step_error_ms.mean()),
+        'jitter_ms_max': float(step_error_ms.max()),
+    }
+
+def run(seconds=2.0, seed=0):
+    rng = random.Random(seed)
+    results = []
+    for draw_ms in DRAW_MS:
+        results.append({'mode': 'sample_clock', 'draw_ms': draw_ms, **measure(ClockedEngine(), draw_ms, seconds, rng)})
+        results.append({'mode': 'polling', 'draw_ms': draw_ms, **measure(PollingEngine(), draw_ms, seconds, rng)})
+    return results
+
+class NullEngine:
+    sample_rate = SAMPLE_RATE
+
+    def play_sound(self, pad_id, velocity=1.0, reverb_send=0.0, delay_send=0.0, sample_offset=0.0, pitch=0.0):
+        pass
+
+    def play_sound_at(self, pad_id, frame, velocity=1.0, reverb_send=0.0, delay_send=0.0, pitch=0.0):
+        pass
+
+def measure_step_eval(tracks, steps, repeats, seed=0):
+    """us per `_play_step` + `_advance_step` with a quarter of the steps on."""
+    pads = [PadConfig(id=i, name=f"pad{i}", sample='', key=str(i)) for i in range(tracks)]
+    cfg = GrooveboxConfig(bpm=120, beats_per_bar=16, pads=pads)
+    seq = Sequencer(make_empty_pattern(cfg), make_empty_pattern(cfg), make_empty_pattern(cfg), NullEngine())
+    rng = np.random.default_rng(seed)
+    for pattern in seq.patterns.values():
+        for track in pattern.tracks:
+            track.resize(steps)
+            track.step_array['state'] = rng.choice([0, 0, 0, 1], steps)
+    # Half the pads play pattern B, so two patterns are gathered per step
+    for pad_id in range(0, tracks, 2):
+        seq.queue_pattern_switch('B', pad_id)
+    seq.current_step = cfg.beats_per_bar - 1
+    seq._advance_step()
+
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        seq._play_step(at_frame=0.0, sample_rate=SAMPLE_RATE)
+        seq._advance_step()
+    return (time.perf_counter() - t0) / repeats * 1e6
+
+def run_step_eval(sizes=((8, 16), (64, 64), (64, 256), (128, 256)), repeats=2000):
+    return [{'tracks': tracks, 'steps': steps, 'us_per_step': measure_step_eval(tracks, steps, repeats)}
+            for tracks, steps in sizes]
@@ -0,0 +1,36 @@
+"""Shared helpers for the benchmark scripts (headless, no sound card needed)."""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'groovebox'))
+
+import numpy as np
+import soundfile as sf
+from config import GrooveboxConfig, PadConfig
+
+def write_noise(path, seconds, channels=2, sample_rate=44100, seed=0):
+    rng = np.random.default_rng(seed)
+    sf.write(path, rng.uniform(-0.5, 0.5, (int(sample_rate * seconds), channels)).astype(np.float32), sample_rate)
+    return path
+
+def make_config(tmpdir, pads=8, seconds=2.0, polyphony=128):
+    """Config whose pads point at freshly written noise samples in `tmpdir`."""
+    pad_cfgs = []
+    for pad_id in range(pads):
+        path = write_noise(os.path.join(tmpdir, f"pad{pad_id}.wav"), seconds, seed=pad_id)
+        pad_cfgs.append(PadConfig(id=pad_id, key=str(pad_id), name=f"Pad {pad_id}", sample=path))
+    return GrooveboxConfig(bpm=120, beats_per_bar=16, pads=pad_cfgs, polyphony=polyphony)
+
+def time_us(fn, repeats, setup=None):
+    """Median and 99th percentile wall time of `fn()` in microseconds. `setup()`,
+    if given, runs untimed before each call."""
+    timings = np.empty(repeats)
+    for i in range(repeats):
+        if setup is not None:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        timings[i] = time.perf_counter() - t0
+    timings *= 1e6
+    return {'median': float(np.median(timings)), 'p99': float(np.percentile(timings, 99))}
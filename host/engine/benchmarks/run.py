@@ -0,0 +1,64 @@
+"""Headless benchmark suite for the engine hot paths.
+
+Writes one JSON document so results can be diffed between releases:
+
+    python host/engine/benchmarks/run.py --output bench.json
+    python host/engine/benchmarks/run.py --only engines sequencer --quick
+
+Sections:
+    engines    us per block of AudioEngineSD.audio_callback and CppAudioEngine::process
+               at several voice counts and block sizes
+    mixer      serial vs batched SD mixer, voices that fit in the block budget
+    sequencer  step-timing jitter, sample-clock scheduler vs polling, under UI load
+    steps      us to evaluate one sequencer step, up to 128 tracks x 256 steps
+    load       cold and disk-cached load_sample, and set_trim, for short to long samples
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import bench_engines
+import bench_load
+import bench_mixer
+import bench_sequencer
+import numpy as np
+
+SECTIONS = {
+    'engines': lambda quick: bench_engines.run(repeats=50 if quick else 200),
+    'mixer': lambda quick: bench_mixer.run([512] if quick else [256, 512, 1024], budget=0.5, repeats=10 if quick else 50),
+    'sequencer': lambda quick: bench_sequencer.run(seconds=1.0 if quick else 3.0),
+    'steps': lambda quick: bench_sequencer.run_step_eval(repeats=200 if quick else 2000),
+    'load': lambda quick: bench_load.run(repeats=3 if quick else 10),
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Groovebox engine benchmarks (JSON output)")
+    parser.add_argument("--output", help="Write JSON here instead of stdout")
+    parser.add_argument("--only", nargs='+', choices=list(SECTIONS), help="Run only these sections")
+    parser.add_argument("--quick", action="store_true", help="Fewer repeats, for a smoke run")
+    args = parser.parse_args()
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': sys.version.split()[0],
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'quick': args.quick,
+        },
+    }
+    for name in args.only or SECTIONS:
+        print(f"Running {name}...", file=sys.stderr)
+        report[name] = SECTIONS[name](args.quick)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,12 @@
 #include <portaudio.h>
 #include <vector>
-#include <mutex>
+#include <array>
+#include <atomic>
+#include <cstddef>
+#include <cstdint>
+#include <chrono>
+#include <thread>
+#include <stdexcept>
 #include <cmath>
 #include <algorithm>
 #include <iostream>
@@ -10,64 +16,682 @@
 
 namespace py = pybind11;
 
+constexpr int kMaxPads = 128;
+constexpr size_t kMaxVoices = 256;
+constexpr size_t kCommandQueueSize = 1024;
+constexpr unsigned long kMaxBlockFrames = 1024;
+// Callback time histogram: bin 0 is < 1 us, bin i covers [2^(i-1), 2^i) us, the last bin is open
+constexpr int kHistogramBins = 20;
+
+struct SampleBuffer {
+    std::vector<float> data; // one float per frame when mono, interleaved L/R when stereo
+    int channels;            // 1 or 2; mono is panned at mix time
+    size_t frames() const { return data.size() / channels; }
+};
+
+// Non-destructive edits, applied when a voice starts. Frames are clamped to
+// the buffer; an empty range plays the whole sample.
+struct PadParams {
+    uint64_t start = 0;
+    uint64_t end = UINT64_MAX;
+    bool reverse = false;
+    float gain = 1.0f;
+};
+
 struct Voice {
     int pad_id;
-    size_t pos;
-    float velocity;
+    const SampleBuffer* buffer;
+    double pos;           // frame of buffer to play next, fractional when pitched
+    double rate;          // frames per output frame, negative when reversed
+    size_t first;         // trimmed range [first, last) of buffer
+    size_t last;
+    float velocity;       // includes the pad gain
     float reverb_send;
     float delay_send;
     bool active;
-    int start_delay_frames; // New: frames to wait before playing
+    uint64_t start_frame; // absolute position on the sample clock
+    uint64_t end_frame;   // cut-off frame when choked, UINT64_MAX otherwise
+    uint64_t serial;      // trigger order, for stealing the oldest voice
+    int choke_group;
+};
+
+// Written by the audio thread only, read from Python without locking
+struct EngineMetrics {
+    std::atomic<uint64_t> blocks{0};
+    std::atomic<float> callback_us{0.0f};
+    std::atomic<float> callback_us_max{0.0f};
+    std::atomic<float> dsp_load{0.0f}; // smoothed, percent of the block duration
+    std::atomic<uint64_t> underruns{0};
+    std::atomic<int> active_voices{0};
+    std::atomic<float> peak{0.0f};
+    std::array<std::atomic<uint64_t>, kHistogramBins> histogram;
+};
+
+enum class StealMode : uint8_t {
+    Oldest,
+    Quietest,
+};
+
+enum class Interpolation : uint8_t {
+    Linear,
+    Cubic,
+};
+
+enum class FilterMode : uint8_t {
+    Off,
+    Lowpass,
+    Highpass,
+    Bandpass,
+};
+
+// A pad's channel strip settings
+struct StripParams {
+    float gain = 1.0f;
+    float pan = 0.0f;        // -1 (left) .. 1 (right)
+    FilterMode filter = FilterMode::Off;
+    float cutoff = 1000.0f;  // Hz
+    float resonance = 0.0f;  // 0..1
+};
+
+enum class CommandType : uint8_t {
+    Trigger,
+    SwapSample,
+    SetDelayTime,
+    SetDelayFeedback,
+    SetDelayLowpass,
+    SetDelayHighpass,
+    SetReverbSize,
+    SetReverbDamping,
+    SetReverbWet,
+    SetPadParams,
+    SetChokeGroup,
+    SetPolyphony,
+    SetStealMode,
+    SetInterpolation,
+    SetStrip,
+    Reset,
+};
+
+struct Command {
+    CommandType type;
+    int pad_id;
+    float velocity;
+    float reverb;
+    float delay;
+    float pitch;          // Trigger: semitones
+    uint64_t frame;       // Trigger: absolute start frame
+    SampleBuffer* buffer; // SwapSample: new buffer (may be null to unload)
+    PadParams params;     // SetPadParams
+    StripParams strip;    // SetStrip
+    float value;          // Set*: parameter value
+    int int_value;        // Set*: integer parameter value
+};
+
+// Bounded single-producer/single-consumer queue. Never blocks or allocates.
+// Capacity must be a power of two.
+template <typename T, size_t Capacity>
+class SpscRing {
+    static_assert((Capacity & (Capacity - 1)) == 0, "Capacity must be a power of two");
+public:
+    bool push(const T& item) {
+        size_t head = head_.load(std::memory_order_relaxed);
+        if (head - tail_.load(std::memory_order_acquire) == Capacity) return false;
+        items_[head & (Capacity - 1)] = item;
+        head_.store(head + 1, std::memory_order_release);
+        return true;
+    }
+
+    bool pop(T& item) {
+        size_t tail = tail_.load(std::memory_order_relaxed);
+        if (tail == head_.load(std::memory_order_acquire)) return false;
+        item = items_[tail & (Capacity - 1)];
+        tail_.store(tail + 1, std::memory_order_release);
+        return true;
+    }
+
+private:
+    std::array<T, Capacity> items_{};
+    alignas(64) std::atomic<size_t> head_{0};
+    alignas(64) std::atomic<size_t> tail_{0};
+};
+
+// Freeverb (Jezar at Dreampoint): 8 damped feedback combs in parallel into
+// 4 allpasses in series, per channel. Each filter runs over a whole block at
+// a time. Delay lengths are fixed at construction, so the only index
+// bookkeeping is splitting a block where a buffer wraps.
+class CombFilter {
+public:
+    void init(size_t length) {
+        buffer_.assign(length, 0.0f);
+        idx_ = 0;
+        filterstore_ = 0.0f;
+    }
+
+    void clear() {
+        std::fill(buffer_.begin(), buffer_.end(), 0.0f);
+        filterstore_ = 0.0f;
+    }
+
+    void set(float feedback, float damp) {
+        feedback_ = feedback;
+        damp1_ = damp;
+        damp2_ = 1.0f - damp;
+    }
+
+    // out[i] += comb(in[i])
+    void process(const float* in, float* out, unsigned long frames) {
+        unsigned long done = 0;
+        while (done < frames) {
+            unsigned long run = std::min(frames - done, (unsigned long)(buffer_.size() - idx_));
+            float* buf = buffer_.data() + idx_;
+            float store = filterstore_;
+            for (unsigned long i = 0; i < run; ++i) {
+                float y = buf[i];
+                store = y * damp2_ + store * damp1_;
+                buf[i] = in[done + i] + store * feedback_;
+                out[done + i] += y;
+            }
+            filterstore_ = store;
+            done += run;
+            idx_ += run;
+            if (idx_ == buffer_.size()) idx_ = 0;
+        }
+    }
+
+private:
+    std::vector<float> buffer_;
+    size_t idx_ = 0;
+    float filterstore_ = 0.0f;
+    float feedback_ = 0.0f;
+    float damp1_ = 0.0f;
+    float damp2_ = 1.0f;
+};
+
+class AllpassFilter {
+public:
+    void init(size_t length) {
+        buffer_.assign(length, 0.0f);
+        idx_ = 0;
+    }
+
+    void clear() { std::fill(buffer_.begin(), buffer_.end(), 0.0f); }
+
+    // In place
+    void process(float* io, unsigned long frames) {
+        unsigned long done = 0;
+        while (done < frames) {
+            unsigned long run = std::min(frames - done, (unsigned long)(buffer_.size() - idx_));
+            float* buf = buffer_.data() + idx_;
+            for (unsigned long i = 0; i < run; ++i) {
+                float bufout = buf[i];
+                float x = io[done + i];
+                buf[i] = x + bufout * kFeedback;
+                io[done + i] = bufout - x;
+            }
+            done += run;
+            idx_ += run;
+            if (idx_ == buffer_.size()) idx_ = 0;
+        }
+    }
+
+private:
+    static constexpr float kFeedback = 0.5f;
+    std::vector<float> buffer_;
+    size_t idx_ = 0;
+};
+
+class Freeverb {
+public:
+    static constexpr int kCombs = 8;
+    static constexpr int kAllpasses = 4;
+
+    void init(int sample_rate) {
+        // Tunings are in samples at 44.1 kHz
+        static const int comb_tuning[kCombs] = {1116, 1188, 1277, 1356, 1422, 1491, 1557, 1617};
+        static const int allpass_tuning[kAllpasses] = {556, 441, 341, 225};
+        const int stereo_spread = 23;
+        float scale = sample_rate / 44100.0f;
+        for (int c = 0; c < kCombs; ++c) {
+            comb_l_[c].init((size_t)(comb_tuning[c] * scale));
+            comb_r_[c].init((size_t)((comb_tuning[c] + stereo_spread) * scale));
+        }
+        for (int a = 0; a < kAllpasses; ++a) {
+            allpass_l_[a].init((size_t)(allpass_tuning[a] * scale));
+            allpass_r_[a].init((size_t)((allpass_tuning[a] + stereo_spread) * scale));
+        }
+        update();
+    }
+
+    void clear() {
+        for (int c = 0; c < kCombs; ++c) {
+            comb_l_[c].clear();
+            comb_r_[c].clear();
+        }
+        for (int a = 0; a < kAllpasses; ++a) {
+            allpass_l_[a].clear();
+            allpass_r_[a].clear();
+        }
+    }
+
+    // All parameters 0..1
+    void set_size(float size) { size_ = std::clamp(size, 0.0f, 1.0f); update(); }
+    void set_damping(float damping) { damping_ = std::clamp(damping, 0.0f, 1.0f); update(); }
+    void set_wet(float wet) { wet_ = std::clamp(wet, 0.0f, 1.0f); }
+
+    // out_* += reverb of the (summed to mono) send bus. frames <= kMaxBlockFrames
+    void process(const float* in_l, const float* in_r, float* out_l, float* out_r, unsigned long frames) {
+        for (unsigned long i = 0; i < frames; ++i) {
+            // Tiny offset keeps the recirculating buffers out of denormals
+            input_[i] = (in_l[i] + in_r[i]) * kFixedGain + 1e-18f;
+        }
+        std::fill(acc_l_, acc_l_ + frames, 0.0f);
+        std::fill(acc_r_, acc_r_ + frames, 0.0f);
+
+        for (int c = 0; c < kCombs; ++c) {
+            comb_l_[c].process(input_, acc_l_, frames);
+            comb_r_[c].process(input_, acc_r_, frames);
+        }
+        for (int a = 0; a < kAllpasses; ++a) {
+            allpass_l_[a].process(acc_l_, frames);
+            allpass_r_[a].process(acc_r_, frames);
+        }
+
+        float wet = wet_ * kScaleWet;
+        for (unsigned long i = 0; i < frames; ++i) {
+            out_l[i] += acc_l_[i] * wet;
+            out_r[i] += acc_r_[i] * wet;
+        }
+    }
+
+private:
+    static constexpr float kFixedGain = 0.015f;
+    static constexpr float kScaleWet = 3.0f;
+    static constexpr float kScaleDamp = 0.4f;
+    static constexpr float kScaleRoom = 0.28f;
+    static constexpr float kOffsetRoom = 0.7f;
+
+    void update() {
+        float feedback = size_ * kScaleRoom + kOffsetRoom;
+        float damp = damping_ * kScaleDamp;
+        for (int c = 0; c < kCombs; ++c) {
+            comb_l_[c].set(feedback, damp);
+            comb_r_[c].set(feedback, damp);
+        }
+    }
+
+    CombFilter comb_l_[kCombs];
+    CombFilter comb_r_[kCombs];
+    AllpassFilter allpass_l_[kAllpasses];
+    AllpassFilter allpass_r_[kAllpasses];
+    float size_ = 0.5f;
+    float damping_ = 0.5f;
+    float wet_ = 1.0f / kScaleWet;
+    float input_[kMaxBlockFrames];
+    float acc_l_[kMaxBlockFrames];
+    float acc_r_[kMaxBlockFrames];
+};
+
+// Stereo feedback delay. The ring length is a power of two so read/write
+// positions wrap with a mask, and the delay time glides towards its target
+// (read with linear interpolation) so tempo changes bend rather than click.
+// The feedback path runs through a one-pole lowpass and highpass.
+class TempoDelay {
+public:
+    static constexpr float kMaxSeconds = 4.0f;
+
+    void init(int sample_rate) {
+        sample_rate_ = (float)sample_rate;
+        uint32_t len = 1;
+        while (len < (uint32_t)(kMaxSeconds * sample_rate) + 2) len <<= 1;
+        buffer_.assign((size_t)len * 2, 0.0f);
+        mask_ = len - 1;
+        write_pos_ = 0;
+        // ~50 ms glide
+        glide_ = 1.0f - std::exp(-1.0f / (0.05f * sample_rate_));
+        set_time(0.375f);
+        time_ = target_;
+        set_lowpass(12000.0f);
+        set_highpass(40.0f);
+    }
+
+    void set_time(float seconds) {
+        target_ = std::clamp(seconds, 0.0f, kMaxSeconds) * sample_rate_;
+        target_ = std::max(target_, 1.0f);
+    }
+
+    // Silence the ring and jump straight to the target time
+    void clear() {
+        std::fill(buffer_.begin(), buffer_.end(), 0.0f);
+        time_ = target_;
+        lp_l_ = lp_r_ = hp_l_ = hp_r_ = 0.0f;
+    }
+
+    void set_feedback(float value) { feedback_ = std::clamp(value, 0.0f, 0.99f); }
+    void set_lowpass(float hz) { lp_coef_ = one_pole_coef(hz); }
+    void set_highpass(float hz) { hp_coef_ = one_pole_coef(hz); }
+
+    // out_* += delayed send bus
+    void process(const float* in_l, const float* in_r, float* out_l, float* out_r, unsigned long frames) {
+        float* buf = buffer_.data();
+        float t = time_;
+        float lp_l = lp_l_, lp_r = lp_r_, hp_l = hp_l_, hp_r = hp_r_;
+        uint32_t w = write_pos_;
+        for (unsigned long i = 0; i < frames; ++i) {
+            t += (target_ - t) * glide_;
+            uint32_t whole = (uint32_t)t;
+            float frac = t - (float)whole;
+            uint32_t r0 = (w - whole) & mask_;
+            uint32_t r1 = (r0 - 1) & mask_;
+            float d_l = buf[r0 * 2] + (buf[r1 * 2] - buf[r0 * 2]) * frac;
+            float d_r = buf[r0 * 2 + 1] + (buf[r1 * 2 + 1] - buf[r0 * 2 + 1]) * frac;
+
+            // Tiny offset keeps the filter state out of denormals; the highpass removes it
+            lp_l += (d_l + 1e-18f - lp_l) * lp_coef_;
+            lp_r += (d_r + 1e-18f - lp_r) * lp_coef_;
+            hp_l += (lp_l - hp_l) * hp_coef_;
+            hp_r += (lp_r - hp_r) * hp_coef_;
+
+            buf[w * 2] = in_l[i] + (lp_l - hp_l) * feedback_;
+            buf[w * 2 + 1] = in_r[i] + (lp_r - hp_r) * feedback_;
+            w = (w + 1) & mask_;
+
+            out_l[i] += d_l;
+            out_r[i] += d_r;
+        }
+        time_ = t;
+        lp_l_ = lp_l; lp_r_ = lp_r; hp_l_ = hp_l; hp_r_ = hp_r;
+        write_pos_ = w;
+    }
+
+private:
+    float one_pole_coef(float hz) const {
+        hz = std::clamp(hz, 1.0f, sample_rate_ * 0.45f);
+        return 1.0f - std::exp(-2.0f * (float)M_PI * hz / sample_rate_);
+    }
+
+    std::vector<float> buffer_; // interleaved stereo
+    uint32_t mask_ = 0;
+    uint32_t write_pos_ = 0;
+    float sample_rate_ = 44100.0f;
+    float time_ = 1.0f;   // current delay in samples
+    float target_ = 1.0f;
+    float glide_ = 0.0f;
+    float feedback_ = 0.5f;
+    float lp_coef_ = 1.0f;
+    float hp_coef_ = 0.0f;
+    float lp_l_ = 0.0f, lp_r_ = 0.0f, hp_l_ = 0.0f, hp_r_ = 0.0f;
+};
+
+// A pad's channel strip: a state-variable filter (trapezoidal, after Simper),
+// then gain and balance pan. It runs once per block over the pad's bus, no
+// matter how many voices fed it. Gain changes ramp across the next block so
+// mixer moves don't zipper.
+class ChannelStrip {
+public:
+    void init(int sample_rate) {
+        sample_rate_ = (float)sample_rate;
+        set(StripParams{});
+        reset();
+    }
+
+    void set(const StripParams& params) {
+        filter_ = params.filter;
+        float gain = std::max(params.gain, 0.0f);
+        float pan = std::clamp(params.pan, -1.0f, 1.0f);
+        // Balance law: the centre leaves both sides at unity, like the unmixed engine
+        target_l_ = gain * std::min(1.0f, 1.0f - pan);
+        target_r_ = gain * std::min(1.0f, 1.0f + pan);
+
+        float hz = std::clamp(params.cutoff, 20.0f, sample_rate_ * 0.45f);
+        float g = std::tan((float)M_PI * hz / sample_rate_);
+        k_ = 2.0f - 1.96f * std::clamp(params.resonance, 0.0f, 1.0f); // 1/Q, from 0.5 to 25
+        a1_ = 1.0f / (1.0f + g * (g + k_));
+        a2_ = g * a1_;
+        a3_ = g * a2_;
+    }
+
+    // Forget the filter state and any gain ramp, once the bus has gone quiet
+    void reset() {
+        ic1_l_ = ic2_l_ = ic1_r_ = ic2_r_ = 0.0f;
+        gain_l_ = target_l_;
+        gain_r_ = target_r_;
+    }
+
+    bool filtering() const { return filter_ != FilterMode::Off; }
+
+    // In place over a planar stereo bus
+    void process(float* l, float* r, unsigned long frames) {
+        if (filtering()) {
+            filter(l, frames, ic1_l_, ic2_l_);
+            filter(r, frames, ic1_r_, ic2_r_);
+        }
+        apply_gain(l, frames, gain_l_, target_l_);
+        apply_gain(r, frames, gain_r_, target_r_);
+    }
+
+private:
+    void filter(float* io, unsigned long frames, float& ic1, float& ic2) const {
+        float s1 = ic1, s2 = ic2;
+        for (unsigned long i = 0; i < frames; ++i) {
+            float x = io[i];
+            float v3 = x - s2;
+            float v1 = a1_ * s1 + a2_ * v3; // bandpass
+            float v2 = s2 + a2_ * s1 + a3_ * v3; // lowpass
+            s1 = 2.0f * v1 - s1;
+            s2 = 2.0f * v2 - s2;
+            switch (filter_) {
+            case FilterMode::Lowpass: io[i] = v2; break;
+            case FilterMode::Highpass: io[i] = x - k_ * v1 - v2; break;
+            default: io[i] = v1; break;
+            }
+        }
+        ic1 = s1;
+        ic2 = s2;
+    }
+
+    static void apply_gain(float* io, unsigned long frames, float& gain, float target) {
+        if (gain == target) {
+            for (unsigned long i = 0; i < frames; ++i) io[i] *= gain;
+            return;
+        }
+        float step = (target - gain) / (float)frames;
+        for (unsigned long i = 0; i < frames; ++i) io[i] *= gain + step * (float)(i + 1);
+        gain = target;
+    }
+
+    float sample_rate_ = 44100.0f;
+    FilterMode filter_ = FilterMode::Off;
+    float target_l_ = 1.0f, target_r_ = 1.0f;
+    float gain_l_ = 1.0f, gain_r_ = 1.0f;
+    float k_ = 2.0f, a1_ = 1.0f, a2_ = 0.0f, a3_ = 0.0f;
+    float ic1_l_ = 0.0f, ic2_l_ = 0.0f, ic1_r_ = 0.0f, ic2_r_ = 0.0f;
 };
 
 class CppAudioEngine {
 public:
-    CppAudioEngine(int sample_rate = 44100) : sample_rate_(sample_rate), stream_(nullptr) {
+    CppAudioEngine(int sample_rate = 44100, int polyphony = 32)
+        : sample_rate_(sample_rate), stream_(nullptr),
+          polyphony_(std::clamp(polyphony, 1, (int)kMaxVoices)) {
         // Initialize PortAudio
         Pa_Initialize();
         
         // Initialize Effects Buffers
-        delay_len_ = sample_rate * 2; // 2 seconds
-        delay_buffer_.resize(delay_len_ * 2, 0.0f); // Stereo
-        delay_write_pos_ = 0;
-        delay_time_samples_ = (int)(sample_rate * 0.375);
-        delay_feedback_ = 0.5f;
+        delay_.init(sample_rate);
+        reverb_.init(sample_rate);
+        for (auto& strip : strips_) strip.init(sample_rate);
+        bus_.assign((size_t)kMaxPads * kMaxBlockFrames * 2, 0.0f);
+        bus_used_.fill(false);
+        bus_tail_.fill(0);
+        stem_rows_.fill(-1);
 
-        reverb_len_ = sample_rate * 3; // 3 seconds
-        reverb_buffer_.resize(reverb_len_ * 2, 0.0f);
-        reverb_write_pos_ = 0;
-        reverb_feedback_ = 0.8f;
+        pads_.fill(nullptr);
+        loaded_.fill(false);
+        choke_groups_.fill(0);
+        for (auto& voice : voices_) voice.active = false;
+        reset_metrics();
     }
 
     ~CppAudioEngine() {
         stop();
         Pa_Terminate();
+
+        // No audio thread any more; free everything still in flight
+        Command cmd;
+        while (commands_.pop(cmd)) {
+            if (cmd.type == CommandType::SwapSample) delete cmd.buffer;
+        }
+        collect_garbage();
+        for (auto* buffer : pads_) delete buffer;
     }
 
-    void load_sample(int pad_id, py::array_t<float> data) {
+    // Python-facing calls are the single producer of the command ring (they all
+    // run under the GIL). The audio thread is the single consumer.
+
+    void load_sample(int pad_id, py::array_t<float, py::array::c_style | py::array::forcecast> data) {
+        check_pad(pad_id);
+        collect_garbage();
+
+        // (frames,) or (frames, 1) is mono, (frames, 2) stereo; further
+        // channels are dropped, as in the Python engines
         py::buffer_info buf = data.request();
-        float* ptr = static_cast<float*>(buf.ptr);
-        size_t size = buf.size; // Total number of floats
-        
-        // Assume stereo (interleaved) or mono. 
-        // If 2D array (N, 2), size is N*2.
-        
-        std::lock_guard<std::mutex> lock(mutex_);
-        samples_[pad_id] = std::vector<float>(ptr, ptr + size);
+        if (buf.ndim != 1 && buf.ndim != 2) {
+            throw std::invalid_argument("sample data must be (frames,) or (frames, channels)");
+        }
+        size_t frames = (size_t)buf.shape[0];
+        size_t in_channels = buf.ndim == 2 ? (size_t)buf.shape[1] : 1;
+        if (in_channels == 0) {
+            throw std::invalid_argument("sample data has no channels");
+        }
+        const float* ptr = static_cast<const float*>(buf.ptr);
+        int channels = in_channels == 1 ? 1 : 2;
+
+        // Allocated here, swapped in by the audio thread at the next block
+        auto* buffer = new SampleBuffer{std::vector<float>(frames * channels), channels};
+        if ((size_t)channels == in_channels) {
+            std::copy(ptr, ptr + frames * channels, buffer->data.begin());
+        } else {
+            for (size_t i = 0; i < frames; ++i) {
+                buffer->data[i * 2] = ptr[i * in_channels];
+                buffer->data[i * 2 + 1] = ptr[i * in_channels + 1];
+            }
+        }
+        Command cmd{};
+        cmd.type = CommandType::SwapSample;
+        cmd.pad_id = pad_id;
+        cmd.buffer = buffer;
+        push_blocking(cmd);
+        loaded_[pad_id] = true;
+    }
+
+    bool play_sound(int pad_id, float velocity, float reverb, float delay, float start_offset_seconds, float pitch) {
+        uint64_t delay_frames = (uint64_t)std::lround(std::max(0.0f, start_offset_seconds) * sample_rate_);
+        return play_sound_at(pad_id, frame_pos_.load() + delay_frames, velocity, reverb, delay, pitch);
     }
 
-    void play_sound(int pad_id, float velocity, float reverb, float delay, float start_offset_seconds) {
-        std::lock_guard<std::mutex> lock(mutex_);
-        if (samples_.find(pad_id) == samples_.end()) return;
+    // Start a voice at an absolute frame of the sample clock (see frame_position).
+    // `pitch` is in semitones and sets the voice's playback rate.
+    // Returns false if the command queue is full and the trigger was dropped.
+    bool play_sound_at(int pad_id, uint64_t frame, float velocity, float reverb, float delay, float pitch) {
+        if (pad_id < 0 || pad_id >= kMaxPads || !loaded_[pad_id]) return false;
         
-        int delay_frames = (int)(start_offset_seconds * sample_rate_);
-        pending_voices_.push_back({pad_id, 0, velocity, reverb, delay, true, delay_frames});
+        Command cmd{};
+        cmd.type = CommandType::Trigger;
+        cmd.pad_id = pad_id;
+        cmd.velocity = velocity;
+        cmd.reverb = reverb;
+        cmd.delay = delay;
+        cmd.pitch = pitch;
+        cmd.frame = frame;
+        return commands_.push(cmd);
+    }
+
+    // Delay parameters. Tempo sync is done by the caller: the time is
+    // beats * 60 / bpm, and changing it glides rather than jumps.
+    void set_delay_time(float seconds) { push_param(CommandType::SetDelayTime, seconds); }
+    void set_delay_feedback(float value) { push_param(CommandType::SetDelayFeedback, value); }
+    void set_delay_lowpass(float hz) { push_param(CommandType::SetDelayLowpass, hz); }
+    void set_delay_highpass(float hz) { push_param(CommandType::SetDelayHighpass, hz); }
+
+    // Reverb parameters, all 0..1
+    void set_reverb_size(float value) { push_param(CommandType::SetReverbSize, value); }
+    void set_reverb_damping(float value) { push_param(CommandType::SetReverbDamping, value); }
+    void set_reverb_wet(float value) { push_param(CommandType::SetReverbWet, value); }
+
+    // Trim (in frames), reverse and gain for future triggers of a pad; O(1),
+    // the sample itself is not touched
+    void set_pad_params(int pad_id, uint64_t start, uint64_t end, bool reverse, float gain) {
+        check_pad(pad_id);
+        Command cmd{};
+        cmd.type = CommandType::SetPadParams;
+        cmd.pad_id = pad_id;
+        cmd.params = {start, end, reverse, gain};
+        push_blocking(cmd);
+    }
+
+    // Gain, pan and filter of a pad's channel strip. Voices of a pad sum
+    // into its bus, which the strip processes once per block; the reverb
+    // and delay sends are taken from the voices, before the strip.
+    void set_strip(int pad_id, float gain, float pan, FilterMode filter, float cutoff, float resonance) {
+        check_pad(pad_id);
+        Command cmd{};
+        cmd.type = CommandType::SetStrip;
+        cmd.pad_id = pad_id;
+        cmd.strip = {gain, pan, filter, cutoff, resonance};
+        push_blocking(cmd);
+    }
+
+    // Drop all voices, silence the effect and filter tails and restart the
+    // sample clock at 0, e.g. before an offline render
+    void reset() {
+        Command cmd{};
+        cmd.type = CommandType::Reset;
+        push_blocking(cmd);
+    }
+
+    // Pads sharing a non-zero choke group cut each other off
+    void set_choke_group(int pad_id, int group) {
+        check_pad(pad_id);
+        Command cmd{};
+        cmd.type = CommandType::SetChokeGroup;
+        cmd.pad_id = pad_id;
+        cmd.int_value = group;
+        push_blocking(cmd);
+    }
+
+    void set_polyphony(int voices) {
+        Command cmd{};
+        cmd.type = CommandType::SetPolyphony;
+        cmd.int_value = std::clamp(voices, 1, (int)kMaxVoices);
+        push_blocking(cmd);
+    }
+
+    void set_interpolation(Interpolation mode) {
+        Command cmd{};
+        cmd.type = CommandType::SetInterpolation;
+        cmd.int_value = (int)mode;
+        push_blocking(cmd);
+    }
+
+    void set_steal_mode(StealMode mode) {
+        Command cmd{};
+        cmd.type = CommandType::SetStealMode;
+        cmd.int_value = (int)mode;
+        push_blocking(cmd);
+    }
+
+    // Frames rendered so far
+    uint64_t frame_position() const {
+        return frame_pos_.load();
+    }
+
+    bool is_running() const {
+        return stream_ != nullptr;
     }
 
     void start() {
         if (stream_) return;
 
-        Pa_OpenDefaultStream(&stream_,
+        PaError err = Pa_OpenDefaultStream(&stream_,
                              0,          // no input channels
                              2,          // stereo output
                              paFloat32,  // 32-bit floating point output
@@ -75,8 +699,18 @@ public:
                              256,        // frames per buffer (low latency)
                              &CppAudioEngine::paCallback,
                              this);
+        if (err != paNoError) {
+            std::cerr << "Failed to open audio stream: " << Pa_GetErrorText(err) << std::endl;
+            stream_ = nullptr;
+            return;
+        }
 
-        Pa_StartStream(stream_);
+        err = Pa_StartStream(stream_);
+        if (err != paNoError) {
+            std::cerr << "Failed to start audio stream: " << Pa_GetErrorText(err) << std::endl;
+            Pa_CloseStream(stream_);
+            stream_ = nullptr;
+        }
     }
 
     void stop() {
@@ -87,6 +721,82 @@ public:
         }
     }
 
+    void reset_metrics() {
+        metrics_.blocks.store(0);
+        metrics_.callback_us.store(0.0f);
+        metrics_.callback_us_max.store(0.0f);
+        metrics_.dsp_load.store(0.0f);
+        metrics_.underruns.store(0);
+        metrics_.active_voices.store(0);
+        metrics_.peak.store(0.0f);
+        for (auto& bin : metrics_.histogram) bin.store(0);
+    }
+
+    py::dict get_metrics() const {
+        py::list histogram;
+        for (const auto& bin : metrics_.histogram) histogram.append(bin.load(std::memory_order_relaxed));
+        py::dict d;
+        d["blocks"] = metrics_.blocks.load(std::memory_order_relaxed);
+        d["callback_us"] = metrics_.callback_us.load(std::memory_order_relaxed);
+        d["callback_us_max"] = metrics_.callback_us_max.load(std::memory_order_relaxed);
+        d["dsp_load"] = metrics_.dsp_load.load(std::memory_order_relaxed);
+        d["underruns"] = metrics_.underruns.load(std::memory_order_relaxed);
+        d["active_voices"] = metrics_.active_voices.load(std::memory_order_relaxed);
+        d["peak"] = metrics_.peak.load(std::memory_order_relaxed);
+        d["histogram"] = histogram;
+        return d;
+    }
+
+    // Render into a (frames, 2) float32 array without a stream, for offline
+    // bounces and benchmarks. The engine must not be running: the command ring
+    // has a single consumer.
+    void render(py::array_t<float, py::array::c_style> out) {
+        if (stream_) {
+            throw std::runtime_error("render() can't be used while the stream is running");
+        }
+        py::buffer_info buf = out.request(true);
+        if (buf.ndim != 2 || buf.shape[1] != 2) {
+            throw std::invalid_argument("render() expects a (frames, 2) array");
+        }
+        float* ptr = static_cast<float*>(buf.ptr);
+        unsigned long frames = (unsigned long)buf.shape[0];
+        while (frames > 0) {
+            unsigned long chunk = std::min(frames, kMaxBlockFrames);
+            process(ptr, chunk);
+            ptr += chunk * 2;
+            stems_ptr_ += stems_ptr_ ? chunk * 2 : 0;
+            frames -= chunk;
+        }
+    }
+
+    // As render(), also writing stems into a (len(pad_ids) + 2, frames, 2)
+    // array: the output of each pad's strip, then the reverb and delay
+    // returns. Stems are taken before the master soft clip, so they sum to
+    // the mix as it goes into it.
+    void render_stems(py::array_t<float, py::array::c_style> out, const std::vector<int>& pad_ids,
+                      py::array_t<float, py::array::c_style> stems) {
+        py::buffer_info sbuf = stems.request(true);
+        py::buffer_info obuf = out.request();
+        if (sbuf.ndim != 3 || sbuf.shape[0] != (py::ssize_t)pad_ids.size() + 2
+            || sbuf.shape[1] != (obuf.ndim ? obuf.shape[0] : -1) || sbuf.shape[2] != 2) {
+            throw std::invalid_argument("render_stems() expects stems of shape (len(pad_ids) + 2, frames, 2)");
+        }
+        for (int pad_id : pad_ids) check_pad(pad_id);
+        float* base = static_cast<float*>(sbuf.ptr);
+        std::fill(base, base + sbuf.size, 0.0f);
+        for (size_t row = 0; row < pad_ids.size(); ++row) stem_rows_[pad_ids[row]] = (int)row;
+        stems_ptr_ = base;
+        stems_stride_ = (size_t)sbuf.shape[1] * 2;
+        stems_fx_row_ = (int)pad_ids.size();
+        try {
+            render(out);
+        } catch (...) {
+            stop_stems();
+            throw;
+        }
+        stop_stems();
+    }
+
     // PortAudio Callback
     static int paCallback(const void *inputBuffer, void *outputBuffer,
                           unsigned long framesPerBuffer,
@@ -94,31 +804,38 @@ public:
                           PaStreamCallbackFlags statusFlags,
                           void *userData) {
         CppAudioEngine* engine = static_cast<CppAudioEngine*>(userData);
-        return engine->process(static_cast<float*>(outputBuffer), framesPerBuffer);
+        auto t0 = std::chrono::steady_clock::now();
+        if (statusFlags & paOutputUnderflow) {
+            engine->metrics_.underruns.fetch_add(1, std::memory_order_relaxed);
+        }
+
+        float* out = static_cast<float*>(outputBuffer);
+        int result = engine->process(out, framesPerBuffer);
+
+        float elapsed_us = std::chrono::duration<float, std::micro>(std::chrono::steady_clock::now() - t0).count();
+        engine->record_block(elapsed_us, out, framesPerBuffer);
+        return result;
     }
 
     int process(float* out, unsigned long frames) {
         // Clear output buffer
         std::fill(out, out + frames * 2, 0.0f);
 
-        // Move pending voices to active voices
-        {
-            std::lock_guard<std::mutex> lock(mutex_);
-            if (!pending_voices_.empty()) {
-                voices_.insert(voices_.end(), pending_voices_.begin(), pending_voices_.end());
-                pending_voices_.clear();
-            }
-        }
+        apply_commands();
         
         // Reset mix buffers
-        static float mix_l[1024];
-        static float mix_r[1024];
-        static float rev_l[1024];
-        static float rev_r[1024];
-        static float dly_l[1024];
-        static float dly_r[1024];
+        static float mix_l[kMaxBlockFrames];
+        static float mix_r[kMaxBlockFrames];
+        static float rev_l[kMaxBlockFrames];
+        static float rev_r[kMaxBlockFrames];
+        static float dly_l[kMaxBlockFrames];
+        static float dly_r[kMaxBlockFrames];
+        static float voice_l[kMaxBlockFrames];
+        static float voice_r[kMaxBlockFrames];
+        static float fx_l[kMaxBlockFrames];
+        static float fx_r[kMaxBlockFrames];
         
-        unsigned long safe_frames = (frames > 1024) ? 1024 : frames;
+        unsigned long safe_frames = (frames > kMaxBlockFrames) ? kMaxBlockFrames : frames;
         
         std::fill(mix_l, mix_l + safe_frames, 0.0f);
         std::fill(mix_r, mix_r + safe_frames, 0.0f);
@@ -127,92 +844,97 @@ public:
         std::fill(dly_l, dly_l + safe_frames, 0.0f);
         std::fill(dly_r, dly_r + safe_frames, 0.0f);
 
-        for (auto& voice : voices_) {
+        uint64_t block_start = frame_pos_.load(std::memory_order_relaxed);
+
+        uint64_t block_end = block_start + safe_frames;
+
+        for (int v_idx = 0; v_idx < polyphony_; ++v_idx) {
+            Voice& voice = voices_[v_idx];
             if (!voice.active) continue;
             
-            // Handle start delay
-            if (voice.start_delay_frames > 0) {
-                if (voice.start_delay_frames >= (int)safe_frames) {
-                    voice.start_delay_frames -= safe_frames;
-                    continue; // Skip this entire block
-                }
-                // Partial delay handled below
-            }
+            // Voices start at an absolute frame, which may be inside or after this block
+            if (voice.start_frame >= block_end) continue;
 
-            auto& sample = samples_[voice.pad_id];
-            size_t sample_len = sample.size();
-            
             unsigned long start_idx = 0;
-            if (voice.start_delay_frames > 0) {
-                start_idx = voice.start_delay_frames;
-                voice.start_delay_frames = 0;
+            if (voice.start_frame > block_start) {
+                start_idx = (unsigned long)(voice.start_frame - block_start);
+            }
+            unsigned long end_idx = safe_frames;
+            if (voice.end_frame < block_end) {
+                end_idx = voice.end_frame > block_start ? (unsigned long)(voice.end_frame - block_start) : 0;
+                voice.active = false; // choked inside this block
+            }
+
+            if (end_idx <= start_idx) continue;
+            unsigned long count = end_idx - start_idx;
+            uint64_t left = frames_left(voice);
+            if (count >= left) {
+                count = (unsigned long)left;
+                voice.active = false; // runs out inside this block
             }
 
-            for (unsigned long i = start_idx; i < safe_frames; ++i) {
-                if (voice.pos >= sample_len - 1) {
-                    voice.active = false;
-                    break;
+            // Read the voice into scratch, then mix it in with plain loops the
+            // compiler vectorises. A mono voice fills only voice_l and is
+            // mixed (centred) into both sides.
+            bool mono = voice.buffer->channels == 1;
+            if (mono) {
+                read_voice_mono(voice, voice_l, count);
+            } else {
+                read_voice(voice, voice_l, voice_r, count);
+            }
+
+            // Dry signal goes to the pad's bus, cleared by its first voice this block
+            float* bus_l = bus_.data() + (size_t)voice.pad_id * kMaxBlockFrames * 2;
+            float* bus_r = bus_l + kMaxBlockFrames;
+            if (!bus_used_[voice.pad_id]) {
+                std::fill(bus_l, bus_l + safe_frames, 0.0f);
+                std::fill(bus_r, bus_r + safe_frames, 0.0f);
+                bus_used_[voice.pad_id] = true;
+            }
+
+            float g_dry = voice.velocity;
+            float g_rev = voice.velocity * voice.reverb_send;
+            float g_dly = voice.velocity * voice.delay_send;
+            float* ml = bus_l + start_idx;
+            float* mr = bus_r + start_idx;
+            float* rl = rev_l + start_idx;
+            float* rr = rev_r + start_idx;
+            float* dl = dly_l + start_idx;
+            float* dr = dly_r + start_idx;
+            if (mono) {
+                for (unsigned long k = 0; k < count; ++k) {
+                    ml[k] += voice_l[k] * g_dry;
+                    mr[k] += voice_l[k] * g_dry;
+                    rl[k] += voice_l[k] * g_rev;
+                    rr[k] += voice_l[k] * g_rev;
+                    dl[k] += voice_l[k] * g_dly;
+                    dr[k] += voice_l[k] * g_dly;
                 }
-                
-                float s_l = sample[voice.pos];
-                float s_r = sample[voice.pos+1];
-                
-                float v = voice.velocity;
-                
-                mix_l[i] += s_l * v;
-                mix_r[i] += s_r * v;
-                
-                rev_l[i] += s_l * v * voice.reverb_send;
-                rev_r[i] += s_r * v * voice.reverb_send;
-                
-                dly_l[i] += s_l * v * voice.delay_send;
-                dly_r[i] += s_r * v * voice.delay_send;
-                
-                voice.pos += 2;
+                continue;
+            }
+            for (unsigned long k = 0; k < count; ++k) {
+                ml[k] += voice_l[k] * g_dry;
+                mr[k] += voice_r[k] * g_dry;
+                rl[k] += voice_l[k] * g_rev;
+                rr[k] += voice_r[k] * g_rev;
+                dl[k] += voice_l[k] * g_dly;
+                dr[k] += voice_r[k] * g_dly;
             }
         }
-        
-        voices_.erase(std::remove_if(voices_.begin(), voices_.end(), 
-            [](const Voice& v){ return !v.active; }), voices_.end());
 
-        // Apply Effects (Delay)
-        for (unsigned long i = 0; i < safe_frames; ++i) {
-            // Read Delay
-            int read_pos = (delay_write_pos_ - delay_time_samples_ + delay_len_) % delay_len_;
-            float d_l = delay_buffer_[read_pos * 2];
-            float d_r = delay_buffer_[read_pos * 2 + 1];
-            
-            // Write Delay
-            float in_l = dly_l[i] + d_l * delay_feedback_;
-            float in_r = dly_r[i] + d_r * delay_feedback_;
-            
-            delay_buffer_[delay_write_pos_ * 2] = in_l;
-            delay_buffer_[delay_write_pos_ * 2 + 1] = in_r;
-            
-            delay_write_pos_ = (delay_write_pos_ + 1) % delay_len_;
-            
-            // Add to mix
-            mix_l[i] += d_l;
-            mix_r[i] += d_r;
-        }
+        mix_strips(mix_l, mix_r, safe_frames);
 
-        // Apply Effects (Reverb)
-        for (unsigned long i = 0; i < safe_frames; ++i) {
-            int read_pos = (reverb_write_pos_ - (int)(sample_rate_ * 0.1) + reverb_len_) % reverb_len_;
-            float r_l = reverb_buffer_[read_pos * 2];
-            float r_r = reverb_buffer_[read_pos * 2 + 1];
-            
-            float in_l = rev_l[i] + r_l * reverb_feedback_;
-            float in_r = rev_r[i] + r_r * reverb_feedback_;
-            
-            reverb_buffer_[reverb_write_pos_ * 2] = in_l;
-            reverb_buffer_[reverb_write_pos_ * 2 + 1] = in_r;
-            
-            reverb_write_pos_ = (reverb_write_pos_ + 1) % reverb_len_;
-            
-            mix_l[i] += r_l * 0.5f;
-            mix_r[i] += r_r * 0.5f;
-        }
+        // Apply Effects (Delay, then Reverb). Each return is rendered on its
+        // own so it can be written out as a stem.
+        std::fill(fx_l, fx_l + safe_frames, 0.0f);
+        std::fill(fx_r, fx_r + safe_frames, 0.0f);
+        delay_.process(dly_l, dly_r, fx_l, fx_r, safe_frames);
+        add_return(fx_l, fx_r, mix_l, mix_r, safe_frames, stems_fx_row_ + 1);
+
+        std::fill(fx_l, fx_l + safe_frames, 0.0f);
+        std::fill(fx_r, fx_r + safe_frames, 0.0f);
+        reverb_.process(rev_l, rev_r, fx_l, fx_r, safe_frames);
+        add_return(fx_l, fx_r, mix_l, mix_r, safe_frames, stems_fx_row_);
 
         // Interleave to output with Soft Clipping
         for (unsigned long i = 0; i < safe_frames; ++i) {
@@ -220,38 +942,403 @@ public:
             out[i*2+1] = std::tanh(mix_r[i]);
         }
 
+        frame_pos_.fetch_add(frames, std::memory_order_relaxed);
         return paContinue;
     }
 
 private:
+    void check_pad(int pad_id) const {
+        if (pad_id < 0 || pad_id >= kMaxPads) {
+            throw std::out_of_range("pad_id out of range");
+        }
+    }
+
+    // Audio thread: update metrics after a callback
+    void record_block(float elapsed_us, const float* out, unsigned long frames) {
+        auto relaxed = std::memory_order_relaxed;
+        float load = elapsed_us / ((float)frames * 1e6f / (float)sample_rate_) * 100.0f;
+        float smoothed = metrics_.dsp_load.load(relaxed);
+        metrics_.dsp_load.store(smoothed + 0.1f * (load - smoothed), relaxed);
+        metrics_.callback_us.store(elapsed_us, relaxed);
+        if (elapsed_us > metrics_.callback_us_max.load(relaxed)) metrics_.callback_us_max.store(elapsed_us, relaxed);
+        metrics_.blocks.fetch_add(1, relaxed);
+
+        int bin = 0;
+        for (uint64_t us = (uint64_t)elapsed_us; us && bin < kHistogramBins - 1; us >>= 1) ++bin;
+        metrics_.histogram[bin].fetch_add(1, relaxed);
+
+        float peak = 0.0f;
+        for (unsigned long i = 0; i < frames * 2; ++i) peak = std::max(peak, std::fabs(out[i]));
+        metrics_.peak.store(peak, relaxed);
+
+        int active = 0;
+        for (int i = 0; i < polyphony_; ++i) active += voices_[i].active ? 1 : 0;
+        metrics_.active_voices.store(active, relaxed);
+    }
+
+    void push_param(CommandType type, float value) {
+        Command cmd{};
+        cmd.type = type;
+        cmd.value = value;
+        push_blocking(cmd);
+    }
+
+    // Producer side: commands that must not be dropped wait for space
+    void push_blocking(const Command& cmd) {
+        while (!commands_.push(cmd)) {
+            if (!stream_) {
+                // No audio thread to drain the queue, so do it ourselves
+                apply_commands();
+            } else {
+                std::this_thread::sleep_for(std::chrono::milliseconds(1));
+            }
+        }
+    }
+
+    // Producer side: free sample buffers the audio thread has finished with
+    void collect_garbage() {
+        SampleBuffer* buffer;
+        while (retired_.pop(buffer)) delete buffer;
+    }
+
+    // Consumer side (audio thread). Never blocks or allocates.
+    void apply_commands() {
+        Command cmd;
+        while (commands_.pop(cmd)) {
+            switch (cmd.type) {
+            case CommandType::Trigger:
+                start_voice(cmd);
+                break;
+            case CommandType::SwapSample: {
+                SampleBuffer* old = pads_[cmd.pad_id];
+                pads_[cmd.pad_id] = cmd.buffer;
+                if (old) {
+                    // Cut voices still reading the old buffer before handing it back
+                    for (auto& voice : voices_) {
+                        if (voice.buffer == old) voice.active = false;
+                    }
+                    // Can't fail: the producer empties retired_ before every swap,
+                    // so it never holds more than one queue's worth of swaps
+                    retired_.push(old);
+                }
+                break;
+            }
+            case CommandType::SetDelayTime:
+                delay_.set_time(cmd.value);
+                break;
+            case CommandType::SetDelayFeedback:
+                delay_.set_feedback(cmd.value);
+                break;
+            case CommandType::SetDelayLowpass:
+                delay_.set_lowpass(cmd.value);
+                break;
+            case CommandType::SetDelayHighpass:
+                delay_.set_highpass(cmd.value);
+                break;
+            case CommandType::SetReverbSize:
+                reverb_.set_size(cmd.value);
+                break;
+            case CommandType::SetReverbDamping:
+                reverb_.set_damping(cmd.value);
+                break;
+            case CommandType::SetReverbWet:
+                reverb_.set_wet(cmd.value);
+                break;
+            case CommandType::SetPadParams:
+                pad_params_[cmd.pad_id] = cmd.params;
+                break;
+            case CommandType::SetChokeGroup:
+                choke_groups_[cmd.pad_id] = cmd.int_value;
+                break;
+            case CommandType::SetPolyphony:
+                // Voices above the new limit are dropped
+                for (int i = cmd.int_value; i < polyphony_; ++i) voices_[i].active = false;
+                polyphony_ = cmd.int_value;
+                break;
+            case CommandType::SetStealMode:
+                steal_mode_ = (StealMode)cmd.int_value;
+                break;
+            case CommandType::SetInterpolation:
+                interpolation_ = (Interpolation)cmd.int_value;
+                break;
+            case CommandType::SetStrip:
+                strips_[cmd.pad_id].set(cmd.strip);
+                // A quiet bus takes the new settings at once rather than ramping
+                if (bus_tail_[cmd.pad_id] == 0) strips_[cmd.pad_id].reset();
+                break;
+            case CommandType::Reset:
+                for (auto& voice : voices_) voice.active = false;
+                for (auto& strip : strips_) strip.reset();
+                bus_tail_.fill(0);
+                delay_.clear();
+                reverb_.clear();
+                next_serial_ = 0;
+                frame_pos_.store(0, std::memory_order_relaxed);
+                break;
+            }
+        }
+    }
+
+    void start_voice(const Command& cmd) {
+        const SampleBuffer* buffer = pads_[cmd.pad_id];
+        if (!buffer) return;
+        const PadParams& params = pad_params_[cmd.pad_id];
+        size_t first = (size_t)std::min<uint64_t>(params.start, buffer->frames());
+        size_t last = (size_t)std::min<uint64_t>(params.end, buffer->frames());
+        if (first >= last) {
+            first = 0;
+            last = buffer->frames();
+        }
+        if (last == 0) return;
+
+        int choke = choke_groups_[cmd.pad_id];
+        Voice* slot = nullptr;
+        Voice* oldest = nullptr;
+        Voice* quietest = nullptr;
+        float quietest_level = 0.0f;
+
+        for (int i = 0; i < polyphony_; ++i) {
+            Voice& voice = voices_[i];
+            if (!voice.active) {
+                if (!slot) slot = &voice;
+                continue;
+            }
+            // Cut earlier voices in the same group where the new one starts
+            if (choke && voice.choke_group == choke && voice.start_frame <= cmd.frame) {
+                voice.end_frame = std::min(voice.end_frame, cmd.frame);
+            }
+            if (!oldest || voice.serial < oldest->serial) oldest = &voice;
+            // Approximate loudness as velocity scaled by how much of the sample is left
+            float level = voice.velocity * (float)frames_left(voice) * (float)std::abs(voice.rate)
+                          / (float)(voice.last - voice.first);
+            if (!quietest || level < quietest_level) {
+                quietest = &voice;
+                quietest_level = level;
+            }
+        }
+
+        if (!slot) slot = (steal_mode_ == StealMode::Quietest) ? quietest : oldest;
+        double rate = std::exp2((double)cmd.pitch / 12.0);
+        double pos = params.reverse ? (double)(last - 1) : (double)first;
+        *slot = {cmd.pad_id, buffer, pos, params.reverse ? -rate : rate, first, last,
+                 cmd.velocity * params.gain, cmd.reverb, cmd.delay, true,
+                 cmd.frame, UINT64_MAX, next_serial_++, choke};
+    }
+
+    // Run every bus that had voices this block (or has a filter still ringing
+    // out) through its strip and into the mix
+    void mix_strips(float* mix_l, float* mix_r, unsigned long frames) {
+        for (int pad = 0; pad < kMaxPads; ++pad) {
+            bool used = bus_used_[pad];
+            if (!used && bus_tail_[pad] == 0) continue;
+            float* bus_l = bus_.data() + (size_t)pad * kMaxBlockFrames * 2;
+            float* bus_r = bus_l + kMaxBlockFrames;
+            ChannelStrip& strip = strips_[pad];
+            if (used) {
+                // Stay live at least one more block, so parameter moves
+                // while it plays are ramped (see SetStrip)
+                bus_tail_[pad] = strip.filtering() ? (uint32_t)(sample_rate_ / 10) : 1;
+            } else {
+                std::fill(bus_l, bus_l + frames, 0.0f);
+                std::fill(bus_r, bus_r + frames, 0.0f);
+                bus_tail_[pad] -= std::min<uint32_t>(bus_tail_[pad], (uint32_t)frames);
+            }
+            strip.process(bus_l, bus_r, frames);
+            for (unsigned long i = 0; i < frames; ++i) {
+                mix_l[i] += bus_l[i];
+                mix_r[i] += bus_r[i];
+            }
+            write_stem(stem_rows_[pad], bus_l, bus_r, frames);
+            bus_used_[pad] = false;
+            if (!used && bus_tail_[pad] == 0) strip.reset();
+        }
+    }
+
+    void add_return(const float* fx_l, const float* fx_r, float* mix_l, float* mix_r,
+                    unsigned long frames, int stem_row) {
+        for (unsigned long i = 0; i < frames; ++i) {
+            mix_l[i] += fx_l[i];
+            mix_r[i] += fx_r[i];
+        }
+        write_stem(stem_row, fx_l, fx_r, frames);
+    }
+
+    void write_stem(int row, const float* l, const float* r, unsigned long frames) {
+        if (!stems_ptr_ || row < 0) return;
+        float* dst = stems_ptr_ + (size_t)row * stems_stride_;
+        for (unsigned long i = 0; i < frames; ++i) {
+            dst[i * 2] = l[i];
+            dst[i * 2 + 1] = r[i];
+        }
+    }
+
+    void stop_stems() {
+        stem_rows_.fill(-1);
+        stems_ptr_ = nullptr;
+        stems_fx_row_ = -2;
+    }
+
+    // Output frames until the voice leaves its range
+    static uint64_t frames_left(const Voice& voice) {
+        double span = voice.rate > 0.0 ? (double)(voice.last - 1) - voice.pos : voice.pos - (double)voice.first;
+        if (span < 0.0) return 0;
+        return (uint64_t)std::floor(span / std::abs(voice.rate)) + 1;
+    }
+
+    // Deinterleave the next `count` output frames of a voice and advance it.
+    // The caller guarantees they lie inside [first, last).
+    void read_voice(Voice& voice, float* out_l, float* out_r, unsigned long count) const {
+        const float* sample = voice.buffer->data.data();
+        if (voice.rate == 1.0 || voice.rate == -1.0) {
+            // Unpitched: whole frames, no interpolation
+            ptrdiff_t p = (ptrdiff_t)voice.pos * 2;
+            ptrdiff_t step = voice.rate > 0.0 ? 2 : -2;
+            for (unsigned long k = 0; k < count; ++k, p += step) {
+                out_l[k] = sample[p];
+                out_r[k] = sample[p + 1];
+            }
+        } else {
+            // Neighbours are clamped to the range, so edges don't read past a trim
+            ptrdiff_t lo = (ptrdiff_t)voice.first;
+            ptrdiff_t hi = (ptrdiff_t)voice.last - 1;
+            for (unsigned long k = 0; k < count; ++k) {
+                double pos = voice.pos + voice.rate * (double)k;
+                ptrdiff_t i0 = (ptrdiff_t)pos; // pos >= first >= 0, so this floors
+                float f = (float)(pos - (double)i0);
+                ptrdiff_t i1 = std::min(i0 + 1, hi);
+                if (interpolation_ == Interpolation::Linear) {
+                    out_l[k] = sample[i0 * 2] + (sample[i1 * 2] - sample[i0 * 2]) * f;
+                    out_r[k] = sample[i0 * 2 + 1] + (sample[i1 * 2 + 1] - sample[i0 * 2 + 1]) * f;
+                } else {
+                    ptrdiff_t im1 = std::max(i0 - 1, lo);
+                    ptrdiff_t i2 = std::min(i0 + 2, hi);
+                    out_l[k] = hermite(sample[im1 * 2], sample[i0 * 2], sample[i1 * 2], sample[i2 * 2], f);
+                    out_r[k] = hermite(sample[im1 * 2 + 1], sample[i0 * 2 + 1], sample[i1 * 2 + 1], sample[i2 * 2 + 1], f);
+                }
+            }
+        }
+        voice.pos += voice.rate * (double)count;
+    }
+
+    // As read_voice, for a single-channel buffer
+    void read_voice_mono(Voice& voice, float* out, unsigned long count) const {
+        const float* sample = voice.buffer->data.data();
+        if (voice.rate == 1.0 || voice.rate == -1.0) {
+            ptrdiff_t p = (ptrdiff_t)voice.pos;
+            ptrdiff_t step = voice.rate > 0.0 ? 1 : -1;
+            for (unsigned long k = 0; k < count; ++k, p += step) {
+                out[k] = sample[p];
+            }
+        } else {
+            ptrdiff_t lo = (ptrdiff_t)voice.first;
+            ptrdiff_t hi = (ptrdiff_t)voice.last - 1;
+            for (unsigned long k = 0; k < count; ++k) {
+                double pos = voice.pos + voice.rate * (double)k;
+                ptrdiff_t i0 = (ptrdiff_t)pos;
+                float f = (float)(pos - (double)i0);
+                ptrdiff_t i1 = std::min(i0 + 1, hi);
+                if (interpolation_ == Interpolation::Linear) {
+                    out[k] = sample[i0] + (sample[i1] - sample[i0]) * f;
+                } else {
+                    out[k] = hermite(sample[std::max(i0 - 1, lo)], sample[i0], sample[i1],
+                                     sample[std::min(i0 + 2, hi)], f);
+                }
+            }
+        }
+        voice.pos += voice.rate * (double)count;
+    }
+
+    // 4-point, 3rd-order Hermite (Catmull-Rom) between x0 and x1
+    static float hermite(float xm1, float x0, float x1, float x2, float f) {
+        float c1 = 0.5f * (x1 - xm1);
+        float c2 = xm1 - 2.5f * x0 + 2.0f * x1 - 0.5f * x2;
+        float c3 = 0.5f * (x2 - xm1) + 1.5f * (x0 - x1);
+        return ((c3 * f + c2) * f + c1) * f + x0;
+    }
+
     int sample_rate_;
     PaStream* stream_;
-    std::mutex mutex_;
+    std::atomic<uint64_t> frame_pos_{0};
+    EngineMetrics metrics_;
     
-    std::map<int, std::vector<float>> samples_;
-    std::vector<Voice> voices_;
-    std::vector<Voice> pending_voices_;
+    SpscRing<Command, kCommandQueueSize> commands_;   // Python -> audio
+    SpscRing<SampleBuffer*, kCommandQueueSize * 2> retired_; // audio -> Python
+    std::array<SampleBuffer*, kMaxPads> pads_;        // owned by the audio thread
+    std::array<bool, kMaxPads> loaded_;               // producer's view of pads_
+    std::array<PadParams, kMaxPads> pad_params_;     // audio thread
+    std::array<int, kMaxPads> choke_groups_;
+    std::array<Voice, kMaxVoices> voices_;            // fixed pool, first polyphony_ in use
+    int polyphony_;
+    StealMode steal_mode_ = StealMode::Oldest;
+    Interpolation interpolation_ = Interpolation::Cubic;
+    uint64_t next_serial_ = 0;
     
+    // Per-pad buses: planar stereo, kMaxBlockFrames per side
+    std::array<ChannelStrip, kMaxPads> strips_;
+    std::vector<float> bus_;
+    std::array<bool, kMaxPads> bus_used_;   // had a voice this block
+    std::array<uint32_t, kMaxPads> bus_tail_; // frames left for a filter to ring out
+
+    // render_stems() only: where each pad's strip output is written
+    std::array<int, kMaxPads> stem_rows_;
+    float* stems_ptr_ = nullptr;
+    size_t stems_stride_ = 0;
+    int stems_fx_row_ = -2;
+
     // Delay
-    std::vector<float> delay_buffer_;
-    int delay_len_;
-    int delay_write_pos_;
-    int delay_time_samples_;
-    float delay_feedback_;
+    TempoDelay delay_;
     
     // Reverb
-    std::vector<float> reverb_buffer_;
-    int reverb_len_;
-    int reverb_write_pos_;
-    float reverb_feedback_;
+    Freeverb reverb_;
 };
 
 PYBIND11_MODULE(groovebox_audio_cpp, m) {
+    py::enum_<StealMode>(m, "StealMode")
+        .value("OLDEST", StealMode::Oldest)
+        .value("QUIETEST", StealMode::Quietest);
+
+    py::enum_<Interpolation>(m, "Interpolation")
+        .value("LINEAR", Interpolation::Linear)
+        .value("CUBIC", Interpolation::Cubic);
+
+    py::enum_<FilterMode>(m, "FilterMode")
+        .value("OFF", FilterMode::Off)
+        .value("LOWPASS", FilterMode::Lowpass)
+        .value("HIGHPASS", FilterMode::Highpass)
+        .value("BANDPASS", FilterMode::Bandpass);
+
     py::class_<CppAudioEngine>(m, "CppAudioEngine")
-        .def(py::init<int>(), py::arg("sample_rate") = 44100)
+        .def(py::init<int, int>(), py::arg("sample_rate") = 44100, py::arg("polyphony") = 32)
         .def("start", &CppAudioEngine::start)
         .def("stop", &CppAudioEngine::stop)
         .def("load_sample", &CppAudioEngine::load_sample)
         .def("play_sound", &CppAudioEngine::play_sound, 
-             py::arg("pad_id"), py::arg("velocity"), py::arg("reverb"), py::arg("delay"), py::arg("start_offset_seconds") = 0.0f);
+             py::arg("pad_id"), py::arg("velocity"), py::arg("reverb"), py::arg("delay"), py::arg("start_offset_seconds") = 0.0f,
+             py::arg("pitch") = 0.0f)
+        .def("play_sound_at", &CppAudioEngine::play_sound_at,
+             py::arg("pad_id"), py::arg("frame"), py::arg("velocity"), py::arg("reverb"), py::arg("delay"),
+             py::arg("pitch") = 0.0f)
+        .def("set_delay_time", &CppAudioEngine::set_delay_time, py::arg("seconds"))
+        .def("set_delay_feedback", &CppAudioEngine::set_delay_feedback)
+        .def("set_delay_lowpass", &CppAudioEngine::set_delay_lowpass, py::arg("hz"))
+        .def("set_delay_highpass", &CppAudioEngine::set_delay_highpass, py::arg("hz"))
+        .def("set_reverb_size", &CppAudioEngine::set_reverb_size)
+        .def("set_reverb_damping", &CppAudioEngine::set_reverb_damping)
+        .def("set_reverb_wet", &CppAudioEngine::set_reverb_wet)
+        .def("set_pad_params", &CppAudioEngine::set_pad_params,
+             py::arg("pad_id"), py::arg("start"), py::arg("end"), py::arg("reverse"), py::arg("gain"))
+        .def("set_strip", &CppAudioEngine::set_strip, py::arg("pad_id"), py::arg("gain") = 1.0f,
+             py::arg("pan") = 0.0f, py::arg("filter") = FilterMode::Off, py::arg("cutoff") = 1000.0f,
+             py::arg("resonance") = 0.0f)
+        .def("set_choke_group", &CppAudioEngine::set_choke_group, py::arg("pad_id"), py::arg("group"))
+        .def("set_polyphony", &CppAudioEngine::set_polyphony)
+        .def("set_steal_mode", &CppAudioEngine::set_steal_mode)
+        .def("set_interpolation", &CppAudioEngine::set_interpolation)
+        .def("frame_position", &CppAudioEngine::frame_position)
+        .def("render", &CppAudioEngine::render, py::arg("out"))
+        .def("render_stems", &CppAudioEngine::render_stems, py::arg("out"), py::arg("pad_ids"), py::arg("stems"))
+        .def("reset", &CppAudioEngine::reset)
+        .def("get_metrics", &CppAudioEngine::get_metrics)
+        .def("reset_metrics", &CppAudioEngine::reset_metrics)
+        .def("is_running", &CppAudioEngine::is_running);
 }
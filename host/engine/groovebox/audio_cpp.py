@@ -1,7 +1,8 @@
-import soundfile as sf
 import numpy as np
-import os
 from config import GrooveboxConfig
+from sample_store import get_store
+from sample_loader import SampleLoader
+from sample_library import get_library
 try:
     import groovebox_audio_cpp
 except ImportError:
@@ -9,40 +10,70 @@ except ImportError:
 
 AVAILABLE = groovebox_audio_cpp is not None
 
+FILTER_MODES = ('off', 'lowpass', 'highpass', 'bandpass')
+DEFAULT_STRIP = {'gain': 1.0, 'pan': 0.0, 'filter': 'off', 'cutoff': 1000.0, 'resonance': 0.0}
+
 class AudioEngineCpp:
-    def __init__(self, config: GrooveboxConfig):
+    def __init__(self, config: GrooveboxConfig, start_stream: bool = True):
         if not AVAILABLE:
             raise ImportError("C++ Audio Engine extension not found")
             
-        self.engine = groovebox_audio_cpp.CppAudioEngine(44100)
+        self.sample_rate = config.sample_rate
+        self.block_size = 256 # frames per stream callback, and per offline render block
+        self.engine = groovebox_audio_cpp.CppAudioEngine(self.sample_rate, config.polyphony)
+        if config.voice_steal == 'quietest':
+            self.engine.set_steal_mode(groovebox_audio_cpp.StealMode.QUIETEST)
+        self.bpm = config.bpm
+        self.delay_division = config.delay_division
+        self._update_delay_time()
         self.pad_states = {}
         self.pad_paths = {}
+        self.store = get_store()
         self.raw_samples = {} # Keep raw numpy data for UI waveform
-        self.processed_samples = {} # Keep processed for UI
+        self.processed_samples = {} # Views of raw_samples as played, for the UI
+        self.peak_tables = {} # pad_id -> PeakTable, for normalize
+        self.peak_pyramids = {} # pad_id -> PeakPyramid, for the UI
+        self.waveform_views = {} # pad_id -> (start, end, reverse, gain) of the raw sample as played
+        self.pad_gains = {}
+        self.strips = {} # pad_id -> channel strip settings, see set_strip
+        # Prefetched neighbours only need the store's data and peaks, not a full prepare
+        self.loader = SampleLoader(self._prepare_sample, self._install_sample, library=get_library(),
+                                   warm=lambda path: self.store.peaks(path, self.sample_rate))
         
         for pad in config.pads:
+            self.engine.set_choke_group(pad.id, pad.choke_group)
             self.load_sample(pad.id, pad.sample, pad.name)
-            
-        self.engine.start()
+        
+        if start_stream:
+            self.engine.start()
 
     def load_sample(self, pad_id, file_path, pad_name="Unknown"):
         try:
-            data, fs = sf.read(file_path, always_2d=True, dtype='float32')
-            # Store raw for UI
-            self.raw_samples[pad_id] = data
-            self.pad_states[pad_id] = { 'trim_start': 0.0, 'trim_end': 1.0, 'reverse': False, 'normalized': False }
-            self.pad_paths[pad_id] = file_path
-            
-            # Send to C++
-            # We need to process it first based on state? 
-            # The C++ engine I wrote takes the buffer and plays it.
-            # It doesn't implement trim/reverse/normalize internally yet.
-            # So I should process it in Python and send the processed buffer to C++.
-            self.update_sound(pad_id)
-            
+            self._install_sample(pad_id, file_path, self._prepare_sample(file_path))
         except Exception as e:
             print(f"Warning: Could not load sample for pad '{pad_name}' ({file_path}): {e}")
 
+    def _prepare_sample(self, file_path):
+        # Memory-mapped, shared with the UI and other engines, resampled to
+        # the engine rate. Safe on a loader thread.
+        data = self.store.load(file_path, self.sample_rate)
+        peak_table, pyramid = self.store.peaks(file_path, self.sample_rate) # cached beside the data
+        return data, peak_table, pyramid
+
+    def _install_sample(self, pad_id, file_path, prepared):
+        data, peak_table, pyramid = prepared
+        self.raw_samples[pad_id] = data
+        self.peak_tables[pad_id] = peak_table
+        self.peak_pyramids[pad_id] = pyramid
+        self.pad_states[pad_id] = { 'trim_start': 0.0, 'trim_end': 1.0, 'reverse': False, 'normalized': False }
+        self.pad_paths[pad_id] = file_path
+        
+        # The raw sample is uploaded once, mono as a single channel;
+        # trim/reverse/normalize are playback parameters on the C++ side
+        # (see update_sound)
+        self.engine.load_sample(pad_id, data)
+        self.update_sound(pad_id)
+
     def update_sound(self, pad_id):
         if pad_id not in self.raw_samples:
             return
@@ -61,18 +92,36 @@ class AudioEngineCpp:
         
         if state['reverse']:
             sliced = sliced[::-1]
-            
+        
+        gain = 1.0
         if state['normalized']:
-            max_val = np.max(np.abs(sliced))
+            max_val = self.peak_tables[pad_id].peak(start_idx, end_idx)
             if max_val > 0:
-                sliced = sliced / max_val * 0.95
-        
-        # Ensure contiguous C-order float32
-        processed = np.ascontiguousarray(sliced, dtype=np.float32)
-        self.processed_samples[pad_id] = processed
+                gain = 0.95 / max_val
         
-        # Send to C++
-        self.engine.load_sample(pad_id, processed)
+        # Views only; the UI applies the gain when it asks for the waveform
+        self.processed_samples[pad_id] = sliced
+        self.pad_gains[pad_id] = gain
+        self.waveform_views[pad_id] = (start_idx, end_idx, state['reverse'], gain)
+        self.engine.set_pad_params(pad_id, start_idx, end_idx, state['reverse'], gain)
+
+    def set_strip(self, pad_id, gain=None, pan=None, filter=None, cutoff=None, resonance=None):
+        """Update a pad's channel strip: gain, pan (-1..1) and a filter
+        ('off', 'lowpass', 'highpass' or 'bandpass') with its cutoff in Hz and
+        resonance (0..1). Settings left as None keep their current value."""
+        strip = self.strips.setdefault(pad_id, dict(DEFAULT_STRIP))
+        for key, value in (('gain', gain), ('pan', pan), ('filter', filter),
+                           ('cutoff', cutoff), ('resonance', resonance)):
+            if value is not None:
+                strip[key] = value
+        if strip['filter'] not in FILTER_MODES:
+            raise ValueError(f"Unknown filter mode {strip['filter']!r}")
+        self.engine.set_strip(pad_id, strip['gain'], strip['pan'],
+                              groovebox_audio_cpp.FilterMode.__members__[strip['filter'].upper()],
+                              strip['cutoff'], strip['resonance'])
+
+    def get_strip(self, pad_id):
+        return self.strips.get(pad_id, DEFAULT_STRIP)
 
     def set_trim(self, pad_id, start, end):
         if pad_id in self.pad_states:
@@ -90,13 +139,76 @@ class AudioEngineCpp:
             self.pad_states[pad_id]['normalized'] = not self.pad_states[pad_id]['normalized']
             self.update_sound(pad_id)
 
+    def get_waveform_envelope(self, pad_id, width):
+        """`(mins, maxs)` of the pad's sample as it plays, in `width` columns, or None."""
+        if pad_id not in self.waveform_views:
+            return None
+        start, end, reverse, gain = self.waveform_views[pad_id]
+        mins, maxs = self.peak_pyramids[pad_id].envelope(start, end, width, reverse)
+        return mins * gain, maxs * gain
+
     def get_waveform(self, pad_id):
         if pad_id in self.processed_samples:
-            return (self.processed_samples[pad_id] * 32767).astype(np.int16)
+            return (self.processed_samples[pad_id] * (self.pad_gains[pad_id] * 32767)).astype(np.int16)
         return None
 
-    def play_sound(self, pad_id: int, velocity: float = 1.0, reverb_send: float = 0.0, delay_send: float = 0.0, sample_offset: float = 0.0):
-        self.engine.play_sound(pad_id, velocity, reverb_send, delay_send, sample_offset)
+    def play_sound(self, pad_id: int, velocity: float = 1.0, reverb_send: float = 0.0, delay_send: float = 0.0, sample_offset: float = 0.0, pitch: float = 0.0):
+        self.engine.play_sound(pad_id, velocity, reverb_send, delay_send, sample_offset, pitch)
+
+    def play_sound_at(self, pad_id: int, frame: int, velocity: float = 1.0, reverb_send: float = 0.0, delay_send: float = 0.0, pitch: float = 0.0):
+        """`pitch` is in semitones; the engine reads pitched voices with cubic interpolation."""
+        self.engine.play_sound_at(pad_id, max(0, int(frame)), velocity, reverb_send, delay_send, pitch)
+
+    def set_tempo(self, bpm: float):
+        """Follow the sequencer tempo; the delay time glides to the new length."""
+        self.bpm = bpm
+        self._update_delay_time()
+
+    def set_delay_params(self, division: float = None, feedback: float = None,
+                         lowpass_hz: float = None, highpass_hz: float = None):
+        """Set the delay length in beats (0.75 = dotted eighth), feedback (0..0.99)
+        and the cutoffs of the filters in its feedback path."""
+        if division is not None:
+            self.delay_division = division
+            self._update_delay_time()
+        if feedback is not None:
+            self.engine.set_delay_feedback(feedback)
+        if lowpass_hz is not None:
+            self.engine.set_delay_lowpass(lowpass_hz)
+        if highpass_hz is not None:
+            self.engine.set_delay_highpass(highpass_hz)
+
+    def _update_delay_time(self):
+        self.engine.set_delay_time(self.delay_division * 60.0 / self.bpm)
+
+    def get_frame_position(self):
+        """Frames rendered so far, or None if no stream is driving the clock."""
+        if not self.engine.is_running():
+            return None
+        return self.engine.frame_position()
+
+    def reset(self):
+        """Drop all voices and clear effect tails, e.g. before an offline render."""
+        self.engine.reset()
+
+    def render_block(self, out, frames, stems=None):
+        """Render `frames` frames into `out` without a stream. With `stems`, a
+        `(len(stem_names()), frames, 2)` array, also write each pad's strip
+        output and the effect returns."""
+        if stems is None:
+            self.engine.render(out[:frames])
+        else:
+            self.engine.render_stems(out[:frames], self.stem_pads(), stems)
+
+    def stem_pads(self):
+        return sorted(self.raw_samples)
+
+    def stem_names(self):
+        return [f"pad{pad_id}" for pad_id in self.stem_pads()] + ['reverb', 'delay']
+
+    def get_metrics(self):
+        """Snapshot of the engine's realtime counters (lock-free on the C++ side)."""
+        return self.engine.get_metrics()
 
     def get_pad_state(self, pad_id):
         return self.pad_states.get(pad_id, None)
@@ -104,16 +216,31 @@ class AudioEngineCpp:
     def get_state(self):
         return {
             'paths': self.pad_paths,
-            'states': self.pad_states
+            'states': self.pad_states,
+            'strips': self.strips
         }
 
-    def load_state(self, state):
+    def prepare_state(self, state):
+        """Decode the samples `state` names, for `load_state`. Safe without the core lock."""
+        prepared = {}
+        for pad_id_str, path in state.get('paths', {}).items():
+            try:
+                prepared[int(pad_id_str)] = self._prepare_sample(path)
+            except Exception:
+                pass # load_state loads it again and reports the error
+        return prepared
+
+    def load_state(self, state, prepared=None):
         paths = state.get('paths', {})
         states = state.get('states', {})
+        prepared = prepared or {}
         
         for pad_id_str, path in paths.items():
             pad_id = int(pad_id_str)
-            self.load_sample(pad_id, path)
+            if pad_id in prepared:
+                self._install_sample(pad_id, path, prepared[pad_id])
+            else:
+                self.load_sample(pad_id, path)
             
         for pad_id_str, pad_state in states.items():
             pad_id = int(pad_id_str)
@@ -121,27 +248,25 @@ class AudioEngineCpp:
                 self.pad_states[pad_id] = pad_state
                 self.update_sound(pad_id)
 
+        for pad_id_str, strip in state.get('strips', {}).items():
+            self.set_strip(int(pad_id_str), **strip)
+
     def cycle_sample(self, pad_id, direction):
         if pad_id not in self.pad_paths:
             return
-        
-        current_path = self.pad_paths[pad_id]
-        directory = os.path.dirname(current_path)
-        filename = os.path.basename(current_path)
-        
+        # Step on from a load still in flight, so repeated presses keep moving
+        current_path = self.loader.requested_path(pad_id) or self.pad_paths[pad_id]
         try:
-            files = sorted([f for f in os.listdir(directory) if f.lower().endswith('.wav')])
-            if not files:
-                return
-                
-            if filename in files:
-                idx = files.index(filename)
-                new_idx = (idx + direction) % len(files)
-            else:
-                new_idx = 0
-                
-            new_path = os.path.join(directory, files[new_idx])
-            self.load_sample(pad_id, new_path)
-            
+            new_path = self.loader.neighbour(current_path, direction)
         except OSError as e:
             print(f"Error cycling samples: {e}")
+            return
+        if new_path is not None:
+            self.loader.request(pad_id, new_path)
+
+    def poll_loads(self):
+        """Install samples the background loader has finished. Call from the core thread."""
+        self.loader.poll()
+
+    def is_loading(self, pad_id):
+        return self.loader.is_loading(pad_id)
@@ -1,31 +1,53 @@
 import pygame.mixer
 import pygame.sndarray
 import numpy as np
-import os
 from config import GrooveboxConfig, PadConfig
+from sample_store import get_store
+from sample_loader import SampleLoader
+from sample_library import get_library
 
 class AudioEngine:
     def __init__(self, config: GrooveboxConfig):
-        pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=512)
+        pygame.mixer.init(frequency=config.sample_rate, size=-16, channels=2, buffer=512)
+        # SDL may not give us the rate we asked for
+        self.sample_rate = pygame.mixer.get_init()[0]
+        pygame.mixer.set_num_channels(config.polyphony)
+        self.choke_groups = {pad.id: pad.choke_group for pad in config.pads}
+        self.choke_channels = {} # group -> channel last used by that group
+        self.store = get_store()
         self.sounds = {}
-        self.raw_data = {}
+        self.raw_data = {} # pad_id -> float32 memmap from the store
+        self.peak_pyramids = {} # pad_id -> PeakPyramid of the raw sample, for the UI
+        self.waveform_views = {} # pad_id -> (start, end, reverse, gain) of the raw sample as played
         self.pad_states = {}
         self.pad_paths = {}
+        # Prefetched neighbours only need the store's data and peaks, not a full prepare
+        self.loader = SampleLoader(self._prepare_sample, self._install_sample, library=get_library(),
+                                   warm=lambda path: self.store.peaks(path, self.sample_rate))
         
         for pad in config.pads:
             self.load_sample(pad.id, pad.sample, pad.name)
 
     def load_sample(self, pad_id, file_path, pad_name="Unknown"):
         try:
-            sound = pygame.mixer.Sound(file_path)
-            self.sounds[pad_id] = sound
-            self.raw_data[pad_id] = pygame.sndarray.array(sound)
-            self.pad_states[pad_id] = { 'trim_start': 0.0, 'trim_end': 1.0, 'reverse': False, 'normalized': False }
-            self.pad_paths[pad_id] = file_path
-        except (FileNotFoundError, pygame.error) as e:
+            self._install_sample(pad_id, file_path, self._prepare_sample(file_path))
+        except (OSError, RuntimeError, pygame.error) as e:
             print(f"Warning: Could not load sample for pad '{pad_name}' ({file_path}): {e}")
             pass
 
+    def _prepare_sample(self, file_path):
+        data = self.store.load(file_path, self.sample_rate)
+        _, pyramid = self.store.peaks(file_path, self.sample_rate) # cached beside the data
+        return data, pyramid
+
+    def _install_sample(self, pad_id, file_path, prepared):
+        data, pyramid = prepared
+        self.raw_data[pad_id] = data
+        self.peak_pyramids[pad_id] = pyramid
+        self.pad_states[pad_id] = { 'trim_start': 0.0, 'trim_end': 1.0, 'reverse': False, 'normalized': False }
+        self.pad_paths[pad_id] = file_path
+        self.update_sound(pad_id)
+
     def update_sound(self, pad_id):
         if pad_id not in self.raw_data:
             return
@@ -48,14 +70,18 @@ class AudioEngine:
             sliced = sliced[::-1]
             
         # Normalize
+        scale = 32767.0
         if state['normalized']:
             max_val = np.max(np.abs(sliced))
             if max_val > 0:
-                float_data = sliced.astype(np.float32)
-                float_data = float_data * (32767.0 / max_val)
-                sliced = float_data.astype(np.int16)
+                scale /= max_val
         
-        self.sounds[pad_id] = pygame.sndarray.make_sound(np.ascontiguousarray(sliced))
+        self.waveform_views[pad_id] = (start_idx, end_idx, state['reverse'], scale / 32767.0)
+
+        # The mixer is 16-bit stereo; SDL keeps its own copy of the converted data
+        pcm = np.empty((len(sliced), 2), dtype=np.int16)
+        pcm[:] = np.clip(sliced[:, :2] * scale, -32768, 32767) # mono broadcasts to both channels
+        self.sounds[pad_id] = pygame.sndarray.make_sound(pcm)
 
     def set_trim(self, pad_id, start, end):
         if pad_id in self.pad_states:
@@ -73,22 +99,48 @@ class AudioEngine:
             self.pad_states[pad_id]['normalized'] = not self.pad_states[pad_id]['normalized']
             self.update_sound(pad_id)
 
+    def get_waveform_envelope(self, pad_id, width):
+        """`(mins, maxs)` of the pad's sample as it plays, in `width` columns, or None."""
+        if pad_id not in self.waveform_views:
+            return None
+        start, end, reverse, gain = self.waveform_views[pad_id]
+        mins, maxs = self.peak_pyramids[pad_id].envelope(start, end, width, reverse)
+        return mins * gain, maxs * gain
+
     def get_waveform(self, pad_id):
         if pad_id in self.sounds:
             return pygame.sndarray.array(self.sounds[pad_id])
         return None
 
-    def play_sound(self, pad_id: int, velocity: float = 1.0, reverb_send: float = 0.0, delay_send: float = 0.0, sample_offset: float = 0.0):
+    def play_sound(self, pad_id: int, velocity: float = 1.0, reverb_send: float = 0.0, delay_send: float = 0.0, sample_offset: float = 0.0, pitch: float = 0.0):
         if pad_id not in self.sounds:
             return
         
         # Pygame backend doesn't support sample-accurate offset easily without blocking
-        # Just ignore offset for now
+        # Just ignore offset for now. Pitch would need a resampled Sound per note, so it is ignored too.
         
         volume = max(0.0, min(1.0, velocity))  # clamp between 0.0 and 1.0
         sound = self.sounds[pad_id]
         sound.set_volume(volume)
-        sound.play()
+        
+        choke = self.choke_groups.get(pad_id, 0)
+        if choke and choke in self.choke_channels:
+            # Stealing may have given the group's channel to another pad since
+            channel = self.choke_channels.pop(choke)
+            group_sounds = [self.sounds[p] for p, group in self.choke_groups.items() if group == choke and p in self.sounds]
+            if any(channel.get_sound() is sound for sound in group_sounds):
+                channel.stop()
+        
+        # force=True steals the longest-playing channel when all are busy.
+        # pygame can't rank by loudness, so "quietest" also steals the oldest.
+        channel = pygame.mixer.find_channel(True)
+        channel.play(sound)
+        if choke:
+            self.choke_channels[choke] = channel
+
+    def get_metrics(self):
+        # SDL mixes on its own thread and exposes no timing
+        return None
 
     def get_pad_state(self, pad_id):
         return self.pad_states.get(pad_id, None)
@@ -99,13 +151,27 @@ class AudioEngine:
             'states': self.pad_states
         }
 
-    def load_state(self, state):
+    def prepare_state(self, state):
+        """Decode the samples `state` names, for `load_state`. Safe without the core lock."""
+        prepared = {}
+        for pad_id_str, path in state.get('paths', {}).items():
+            try:
+                prepared[int(pad_id_str)] = self._prepare_sample(path)
+            except Exception:
+                pass # load_state loads it again and reports the error
+        return prepared
+
+    def load_state(self, state, prepared=None):
         paths = state.get('paths', {})
         states = state.get('states', {})
+        prepared = prepared or {}
         
         for pad_id_str, path in paths.items():
             pad_id = int(pad_id_str)
-            self.load_sample(pad_id, path)
+            if pad_id in prepared:
+                self._install_sample(pad_id, path, prepared[pad_id])
+            else:
+                self.load_sample(pad_id, path)
             
         for pad_id_str, pad_state in states.items():
             pad_id = int(pad_id_str)
@@ -116,24 +182,19 @@ class AudioEngine:
     def cycle_sample(self, pad_id, direction):
         if pad_id not in self.pad_paths:
             return
-        
-        current_path = self.pad_paths[pad_id]
-        directory = os.path.dirname(current_path)
-        filename = os.path.basename(current_path)
-        
+        # Step on from a load still in flight, so repeated presses keep moving
+        current_path = self.loader.requested_path(pad_id) or self.pad_paths[pad_id]
         try:
-            files = sorted([f for f in os.listdir(directory) if f.lower().endswith('.wav')])
-            if not files:
-                return
-                
-            if filename in files:
-                idx = files.index(filename)
-                new_idx = (idx + direction) % len(files)
-            else:
-                new_idx = 0
-                
-            new_path = os.path.join(directory, files[new_idx])
-            self.load_sample(pad_id, new_path)
-            
+            new_path = self.loader.neighbour(current_path, direction)
         except OSError as e:
-            print(f"Error cycling samples: {e}")
\ No newline at end of file
+            print(f"Error cycling samples: {e}")
+            return
+        if new_path is not None:
+            self.loader.request(pad_id, new_path)
+
+    def poll_loads(self):
+        """Install samples the background loader has finished. Call from the core thread."""
+        self.loader.poll()
+
+    def is_loading(self, pad_id):
+        return self.loader.is_loading(pad_id)
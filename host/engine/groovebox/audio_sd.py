@@ -1,29 +1,87 @@
-import sounddevice as sd
-import soundfile as sf
 import numpy as np
-import os
+from collections import deque
+from time import perf_counter
 from config import GrooveboxConfig
+from sample_store import get_store
+from sample_loader import SampleLoader
+from sample_library import get_library
+try:
+    import sounddevice as sd
+except (ImportError, OSError):
+    # Offline rendering does not need PortAudio
+    sd = None
+
+DELAY_MAX_SECONDS = 4.0
+
+# Callback time histogram: bin 0 is < 1 us, bin i covers [2^(i-1), 2^i) us, the last bin is open
+CALLBACK_HIST_BINS = 20
 
 class AudioEngineSD:
-    def __init__(self, config: GrooveboxConfig):
-        self.sample_rate = 44100
+    def __init__(self, config: GrooveboxConfig, start_stream: bool = True):
+        self.sample_rate = config.sample_rate
         self.block_size = 512
         self.channels = 2
         
-        self.raw_samples = {} # pad_id -> original numpy array
-        self.processed_samples = {} # pad_id -> processed (trimmed/reversed)
+        self.store = get_store()
+        self.raw_samples = {} # pad_id -> original sample, a read-only memmap from the store
+        self.processed_samples = {} # pad_id -> view of the raw sample as played (trimmed/reversed)
+        self.pad_gains = {} # pad_id -> normalize gain, applied per voice
+        self.peak_tables = {} # pad_id -> PeakTable, for normalize
+        self.peak_pyramids = {} # pad_id -> PeakPyramid of the raw sample, for the UI
+        self.waveform_views = {} # pad_id -> (start, end, reverse, gain) of the raw sample as played
         self.pad_states = {}
         self.pad_paths = {}
+        # Prefetched neighbours only need the store's data and peaks, not a full prepare
+        self.loader = SampleLoader(self._prepare_sample, self._install_sample, library=get_library(),
+                                   warm=lambda path: self.store.peaks(path, self.sample_rate))
+        
+        # Fixed-capacity voice pool (struct of arrays), only touched by the audio thread.
+        # A voice plays frames [start, end) of the sample clock; end is pulled in when choked.
+        self.polyphony = config.polyphony
+        self.voice_steal = config.voice_steal
+        self.voice_active = np.zeros(self.polyphony, dtype=bool)
+        self.voice_start = np.zeros(self.polyphony, dtype=np.int64)
+        self.voice_end = np.zeros(self.polyphony, dtype=np.int64)
+        self.voice_gain = np.zeros((self.polyphony, 3), dtype=np.float32) # dry, reverb, delay
+        self.voice_choke = np.zeros(self.polyphony, dtype=np.int32)
+        self.voice_serial = np.zeros(self.polyphony, dtype=np.int64) # trigger order, for stealing
+        self.voice_pad = np.zeros(self.polyphony, dtype=np.int64)
+        self.voice_version = np.zeros(self.polyphony, dtype=np.int64)
+        self.voice_rate = np.ones(self.polyphony, dtype=np.float64) # playback rate from pitch
+        self.next_serial = 0
+        self.choke_groups = {pad.id: pad.choke_group for pad in config.pads}
         
-        self.active_voices = [] # list of dicts
+        self.pending_voices = deque() # voices queued from other threads
+        self.frame_pos = 0 # frames rendered so far, the sample clock
+        
+        # Sample slots: voices read each pad's trimmed/reversed view of its memmap
+        # from the store, so nothing is copied and an edit touches only that pad.
+        # Set on the core thread and handed to the audio thread through
+        # pending_samples, which keeps only the latest per pad.
+        self.sample_versions = {} # pad_id -> edit counter
+        self.pad_slots = {} # pad_id -> (view, gain, version), audio thread's copy
+        self.pending_samples = {} # pad_id -> (view, gain, version) not yet installed
+        
+        # "auto" mixes few voices one by one and switches to the batched mixer above
+        # batch_min_voices, "serial"/"batched" force one path (benchmarks)
+        self.mixer = 'auto'
+        self.batch_min_voices = 4
         
         # Effects
-        # Delay
-        self.delay_len = int(self.sample_rate * 2.0) # 2 seconds max
+        # Delay: tempo-synced, the time is delay_division beats at the current tempo.
+        # Power-of-two ring, so read positions wrap with a mask. The time glides
+        # to its target (read with linear interpolation) so tempo changes bend
+        # instead of clicking.
+        self.delay_len = 1 << int(np.ceil(np.log2(self.sample_rate * DELAY_MAX_SECONDS + 2)))
+        self.delay_mask = self.delay_len - 1
         self.delay_buffer = np.zeros((self.delay_len, 2), dtype=np.float32)
         self.delay_write_pos = 0
-        self.delay_time_samples = int(self.sample_rate * 0.375) # 3/8 note approx at 120bpm?
         self.delay_feedback = 0.5
+        self.delay_division = config.delay_division
+        self.delay_glide = 1.0 - np.exp(-1.0 / (0.05 * self.sample_rate)) # ~50 ms
+        self.bpm = config.bpm
+        self._update_delay_time()
+        self.delay_time = self.delay_target # current delay in frames
         
         # Reverb (Schroeder-like: 4 comb filters in parallel -> 2 allpass in series)
         # Simplified: Just a long feedback loop with some modulation or just a simple decay for now
@@ -32,9 +90,31 @@ class AudioEngineSD:
         self.reverb_write_pos = 0
         self.reverb_feedback = 0.8
         
+        # Pre-allocate buffers for callback (before the stream can call us)
+        self.mix_buffer = np.zeros((self.block_size, 2), dtype=np.float32)
+        self.reverb_in = np.zeros((self.block_size, 2), dtype=np.float32)
+        self.delay_in = np.zeros((self.block_size, 2), dtype=np.float32)
+        self._alloc_batch_buffers(self.block_size)
+        self._alloc_delay_buffers(self.block_size)
+        
+        # Realtime metrics. Only the audio callback writes them; reading the
+        # attributes from the UI thread needs no lock.
+        self.metrics_histogram = np.zeros(CALLBACK_HIST_BINS, dtype=np.int64)
+        self.reset_metrics()
+        
         for pad in config.pads:
             self.load_sample(pad.id, pad.sample, pad.name)
-            
+        
+        self.stream = None
+        if start_stream:
+            self.start()
+
+    def start(self):
+        if self.stream is not None:
+            return
+        if sd is None:
+            print("Failed to initialize sounddevice: PortAudio not available")
+            return
         try:
             self.stream = sd.OutputStream(
                 samplerate=self.sample_rate,
@@ -46,24 +126,40 @@ class AudioEngineSD:
             self.stream.start()
         except Exception as e:
             print(f"Failed to initialize sounddevice: {e}")
-            
-        # Pre-allocate buffers for callback
-        self.mix_buffer = np.zeros((self.block_size, 2), dtype=np.float32)
-        self.reverb_in = np.zeros((self.block_size, 2), dtype=np.float32)
-        self.delay_in = np.zeros((self.block_size, 2), dtype=np.float32)
+
+    def reset(self):
+        """Drop all voices and clear effect tails, e.g. before an offline render."""
+        self.voice_active.fill(False)
+        self.next_serial = 0
+        self.pending_voices.clear()
+        self.frame_pos = 0
+        self.delay_buffer.fill(0)
+        self.delay_write_pos = 0
+        self.delay_time = self.delay_target
+        self.reverb_buffer.fill(0)
+        self.reverb_write_pos = 0
 
     def load_sample(self, pad_id, file_path, pad_name="Unknown"):
         try:
-            data, fs = sf.read(file_path, always_2d=True, dtype='float32')
-            # Simple resampling if needed (nearest neighbor or just speed change)
-            # For now assume 44100 or close enough
-            self.raw_samples[pad_id] = data
-            self.pad_states[pad_id] = { 'trim_start': 0.0, 'trim_end': 1.0, 'reverse': False, 'normalized': False }
-            self.pad_paths[pad_id] = file_path
-            self.update_sound(pad_id)
+            self._install_sample(pad_id, file_path, self._prepare_sample(file_path))
         except Exception as e:
             print(f"Warning: Could not load sample for pad '{pad_name}' ({file_path}): {e}")
 
+    def _prepare_sample(self, file_path):
+        # Memory-mapped and shared, resampled to the engine rate. Safe on a loader thread.
+        data = self.store.load(file_path, self.sample_rate)
+        peak_table, pyramid = self.store.peaks(file_path, self.sample_rate) # cached beside the data
+        return data, peak_table, pyramid
+
+    def _install_sample(self, pad_id, file_path, prepared):
+        data, peak_table, pyramid = prepared
+        self.raw_samples[pad_id] = data
+        self.peak_tables[pad_id] = peak_table
+        self.peak_pyramids[pad_id] = pyramid
+        self.pad_states[pad_id] = { 'trim_start': 0.0, 'trim_end': 1.0, 'reverse': False, 'normalized': False }
+        self.pad_paths[pad_id] = file_path
+        self.update_sound(pad_id)
+
     def update_sound(self, pad_id):
         if pad_id not in self.raw_samples:
             return
@@ -78,17 +174,35 @@ class AudioEngineSD:
             start_idx = 0
             end_idx = len(data)
             
-        sliced = data[start_idx:end_idx]
+        # A view of the memmap; mono stays one channel and broadcasts when mixed
+        sliced = data[start_idx:end_idx, :2]
         
         if state['reverse']:
             sliced = sliced[::-1]
             
+        gain = 1.0
         if state['normalized']:
-            max_val = np.max(np.abs(sliced))
+            max_val = self.peak_tables[pad_id].peak(start_idx, end_idx)
             if max_val > 0:
-                sliced = sliced / max_val * 0.95
+                gain = 0.95 / max_val
         
-        self.processed_samples[pad_id] = np.ascontiguousarray(sliced)
+        version = self.sample_versions.get(pad_id, 0) + 1
+        self.processed_samples[pad_id] = sliced
+        self.pad_gains[pad_id] = gain
+        self.waveform_views[pad_id] = (start_idx, end_idx, state['reverse'], gain)
+        self.sample_versions[pad_id] = version
+        # Replaces any install of this pad still pending, so edits without a
+        # running stream don't pile up
+        self.pending_samples[pad_id] = (sliced, gain, version)
+
+    def _install_samples(self):
+        # Audio thread only. Pop each pad separately: an edit landing meanwhile
+        # is either popped here or left for the next block.
+        for pad_id in list(self.pending_samples):
+            slot = self.pending_samples.pop(pad_id)
+            # Cut the pad's voices that play the sample this replaces
+            self.voice_active &= ~((self.voice_pad == pad_id) & (self.voice_version != slot[2]))
+            self.pad_slots[pad_id] = slot
 
     def set_trim(self, pad_id, start, end):
         if pad_id in self.pad_states:
@@ -106,6 +220,14 @@ class AudioEngineSD:
             self.pad_states[pad_id]['normalized'] = not self.pad_states[pad_id]['normalized']
             self.update_sound(pad_id)
 
+    def get_waveform_envelope(self, pad_id, width):
+        """`(mins, maxs)` of the pad's sample as it plays, in `width` columns, or None."""
+        if pad_id not in self.waveform_views:
+            return None
+        start, end, reverse, gain = self.waveform_views[pad_id]
+        mins, maxs = self.peak_pyramids[pad_id].envelope(start, end, width, reverse)
+        return mins * gain, maxs * gain
+
     def get_waveform(self, pad_id):
         # Return int16 array for UI compatibility (pygame.sndarray.array returns int16 usually?)
         # ui_pygame expects something it can plot.
@@ -113,20 +235,112 @@ class AudioEngineSD:
         # ui_pygame: `py = center_y - samp * scale`. `scale = (height / 2) / max_amp`. `max_amp = 32768.0`.
         # So ui_pygame expects int16 range.
         if pad_id in self.processed_samples:
-            return (self.processed_samples[pad_id] * 32767).astype(np.int16)
+            return (self.processed_samples[pad_id] * (self.pad_gains[pad_id] * 32767)).astype(np.int16)
         return None
 
-    def play_sound(self, pad_id: int, velocity: float = 1.0, reverb_send: float = 0.0, delay_send: float = 0.0, sample_offset: float = 0.0):
+    def play_sound(self, pad_id: int, velocity: float = 1.0, reverb_send: float = 0.0, delay_send: float = 0.0, sample_offset: float = 0.0, pitch: float = 0.0):
+        delay_frames = int(round(sample_offset * self.sample_rate))
+        self.play_sound_at(pad_id, self.frame_pos + delay_frames, velocity, reverb_send, delay_send, pitch)
+
+    def play_sound_at(self, pad_id: int, frame: int, velocity: float = 1.0, reverb_send: float = 0.0, delay_send: float = 0.0, pitch: float = 0.0):
+        """Start a voice at an absolute position on the sample clock (see `get_frame_position`).
+
+        `pitch` is in semitones; pitched voices are read with linear interpolation.
+        """
         if pad_id in self.processed_samples:
-            delay_frames = int(sample_offset * self.sample_rate)
-            self.active_voices.append({
-                'sample': self.processed_samples[pad_id],
-                'pos': 0,
-                'velocity': velocity,
-                'reverb': reverb_send,
-                'delay': delay_send,
-                'start_delay': delay_frames
-            })
+            self.pending_voices.append((pad_id, int(frame), velocity, reverb_send, delay_send, pitch))
+
+    def _start_voice(self, pad_id, start_frame, velocity, reverb_send, delay_send, pitch):
+        # Audio thread only
+        entry = self.pad_slots.get(pad_id)
+        if entry is None or not len(entry[0]):
+            return
+        sample, gain, version = entry
+        length = len(sample)
+        
+        choke = self.choke_groups.get(pad_id, 0)
+        if choke:
+            # Cut earlier voices in the same group where the new one starts
+            choked = self.voice_active & (self.voice_choke == choke) & (self.voice_start <= start_frame)
+            np.minimum(self.voice_end, start_frame, out=self.voice_end, where=choked)
+        
+        free = np.flatnonzero(~self.voice_active)
+        if len(free):
+            i = free[0]
+        else:
+            i = self._steal_voice()
+        
+        rate = 2.0 ** (pitch / 12.0)
+        self.voice_active[i] = True
+        self.voice_start[i] = start_frame
+        # Output frames until the read position passes the last sample frame
+        self.voice_end[i] = start_frame + (length if rate == 1.0 else int((length - 1) // rate) + 1)
+        self.voice_rate[i] = rate
+        level = velocity * gain
+        self.voice_gain[i] = (level, level * reverb_send, level * delay_send)
+        self.voice_choke[i] = choke
+        self.voice_serial[i] = self.next_serial
+        self.voice_pad[i] = pad_id
+        self.voice_version[i] = version
+        self.next_serial += 1
+
+    def _steal_voice(self):
+        if self.voice_steal == 'quietest':
+            # Approximate loudness as velocity scaled by how much of the sample is left
+            remaining = (self.voice_end - np.maximum(self.frame_pos, self.voice_start)) / np.maximum(1, self.voice_end - self.voice_start)
+            return int(np.argmin(self.voice_gain[:, 0] * remaining))
+        return int(np.argmin(self.voice_serial))
+
+    def set_tempo(self, bpm: float):
+        """Follow the sequencer tempo; the delay time glides to the new length."""
+        self.bpm = bpm
+        self._update_delay_time()
+
+    def set_delay_params(self, division: float = None, feedback: float = None):
+        """Set the delay length in beats (0.75 = dotted eighth) and/or its feedback (0..0.99)."""
+        if division is not None:
+            self.delay_division = division
+            self._update_delay_time()
+        if feedback is not None:
+            self.delay_feedback = min(max(feedback, 0.0), 0.99)
+
+    def _update_delay_time(self):
+        seconds = self.delay_division * 60.0 / self.bpm
+        # Whole chunks of up to a block are read before they are written, so the delay must exceed a block
+        self.delay_target = min(max(seconds * self.sample_rate, self.block_size + 1.0),
+                                DELAY_MAX_SECONDS * self.sample_rate)
+
+    def active_voice_count(self):
+        return int(np.count_nonzero(self.voice_active))
+
+    def reset_metrics(self):
+        self.metrics_blocks = 0
+        self.metrics_callback_us = 0.0
+        self.metrics_callback_us_max = 0.0
+        self.metrics_dsp_load = 0.0 # smoothed, percent of the block duration
+        self.metrics_underruns = 0
+        self.metrics_active_voices = 0
+        self.metrics_peak = 0.0
+        self.metrics_histogram.fill(0)
+
+    def get_metrics(self):
+        """Snapshot of the realtime counters; cheap enough to call every UI frame."""
+        return {
+            'blocks': self.metrics_blocks,
+            'callback_us': self.metrics_callback_us,
+            'callback_us_max': self.metrics_callback_us_max,
+            'dsp_load': self.metrics_dsp_load,
+            'underruns': self.metrics_underruns,
+            'active_voices': self.metrics_active_voices,
+            'peak': self.metrics_peak,
+            'histogram': self.metrics_histogram.tolist(),
+        }
+
+    def get_frame_position(self):
+        """Frames rendered so far, or None if no stream is driving the clock."""
+        if self.stream is None:
+            return None
+        return self.frame_pos
 
     def get_pad_state(self, pad_id):
         return self.pad_states.get(pad_id, None)
@@ -137,13 +351,27 @@ class AudioEngineSD:
             'states': self.pad_states
         }
 
-    def load_state(self, state):
+    def prepare_state(self, state):
+        """Decode the samples `state` names, for `load_state`. Safe without the core lock."""
+        prepared = {}
+        for pad_id_str, path in state.get('paths', {}).items():
+            try:
+                prepared[int(pad_id_str)] = self._prepare_sample(path)
+            except Exception:
+                pass # load_state loads it again and reports the error
+        return prepared
+
+    def load_state(self, state, prepared=None):
         paths = state.get('paths', {})
         states = state.get('states', {})
+        prepared = prepared or {}
         
         for pad_id_str, path in paths.items():
             pad_id = int(pad_id_str)
-            self.load_sample(pad_id, path)
+            if pad_id in prepared:
+                self._install_sample(pad_id, path, prepared[pad_id])
+            else:
+                self.load_sample(pad_id, path)
             
         for pad_id_str, pad_state in states.items():
             pad_id = int(pad_id_str)
@@ -154,32 +382,194 @@ class AudioEngineSD:
     def cycle_sample(self, pad_id, direction):
         if pad_id not in self.pad_paths:
             return
-        
-        current_path = self.pad_paths[pad_id]
-        directory = os.path.dirname(current_path)
-        filename = os.path.basename(current_path)
-        
+        # Step on from a load still in flight, so repeated presses keep moving
+        current_path = self.loader.requested_path(pad_id) or self.pad_paths[pad_id]
         try:
-            files = sorted([f for f in os.listdir(directory) if f.lower().endswith('.wav')])
-            if not files:
-                return
-                
-            if filename in files:
-                idx = files.index(filename)
-                new_idx = (idx + direction) % len(files)
-            else:
-                new_idx = 0
-                
-            new_path = os.path.join(directory, files[new_idx])
-            self.load_sample(pad_id, new_path)
-            
+            new_path = self.loader.neighbour(current_path, direction)
         except OSError as e:
             print(f"Error cycling samples: {e}")
+            return
+        if new_path is not None:
+            self.loader.request(pad_id, new_path)
+
+    def poll_loads(self):
+        """Install samples the background loader has finished. Call from the core thread."""
+        self.loader.poll()
+
+    def is_loading(self, pad_id):
+        return self.loader.is_loading(pad_id)
+
+    def _alloc_batch_buffers(self, frames):
+        self.block_frames = np.arange(frames, dtype=np.int64)
+        self.batch_pos = np.zeros(self.polyphony * frames, dtype=np.int64)
+        self.batch_outside = np.zeros(self.polyphony * frames, dtype=bool)
+        self.batch_segments = np.zeros(self.polyphony * frames * 2, dtype=np.float32)
+
+    def _alloc_delay_buffers(self, frames):
+        self.delay_pos = np.zeros(frames, dtype=np.float64)
+        self.delay_frac = np.zeros((frames, 1), dtype=np.float32)
+        self.delay_idx = np.zeros(frames, dtype=np.int64)
+        self.delay_idx_next = np.zeros(frames, dtype=np.int64)
+        self.delay_out = np.zeros((frames, 2), dtype=np.float32)
+        self.delay_next = np.zeros((frames, 2), dtype=np.float32)
+
+    def _process_delay(self, frames, mix_view, delay_view):
+        # Each chunk is read before it is written, which is only safe while it
+        # is shorter than the delay (at least block_size + 1 frames). Offline
+        # renders may pass longer blocks, so split those up.
+        for start in range(0, frames, self.block_size):
+            end = min(start + self.block_size, frames)
+            self._process_delay_chunk(end - start, mix_view[start:end], delay_view[start:end])
+
+    def _process_delay_chunk(self, frames, mix_view, delay_view):
+        # Glide the delay time over the chunk, then read each frame at
+        # (write position + frame - delay) with linear interpolation
+        t0 = self.delay_time
+        t1 = self.delay_target + (t0 - self.delay_target) * (1.0 - self.delay_glide) ** frames
+        self.delay_time = t1
+        
+        pos = self.delay_pos[:frames]
+        frac = self.delay_frac[:frames]
+        idx = self.delay_idx[:frames]
+        idx_next = self.delay_idx_next[:frames]
+        np.multiply(self.block_frames[:frames], 1.0 - (t1 - t0) / frames, out=pos)
+        pos += self.delay_write_pos - t0 + self.delay_len
+        np.copyto(idx, pos, casting='unsafe') # floor, pos is positive
+        np.subtract(pos, idx, out=frac[:, 0], casting='unsafe')
+        idx &= self.delay_mask
+        np.add(idx, 1, out=idx_next)
+        idx_next &= self.delay_mask
+        
+        delayed_sig = self.delay_out[:frames]
+        next_sig = self.delay_next[:frames]
+        np.take(self.delay_buffer, idx, axis=0, out=delayed_sig)
+        np.take(self.delay_buffer, idx_next, axis=0, out=next_sig)
+        next_sig -= delayed_sig
+        next_sig *= frac
+        delayed_sig += next_sig
+        
+        # Write input + feedback; the delay is longer than a chunk, so this
+        # never overwrites frames read above
+        input_sig = delay_view
+        input_sig += delayed_sig * self.delay_feedback
+        w = self.delay_write_pos
+        if w + frames <= self.delay_len:
+            self.delay_buffer[w:w + frames] = input_sig
+        else:
+            part1_len = self.delay_len - w
+            self.delay_buffer[w:] = input_sig[:part1_len]
+            self.delay_buffer[:frames - part1_len] = input_sig[part1_len:]
+        self.delay_write_pos = (w + frames) & self.delay_mask
+        
+        mix_view += delayed_sig
+
+    def _mix_voices_serial(self, active, frames, mix_view, reverb_view, delay_view):
+        # A few NumPy calls per voice; cheapest when only a handful are playing
+        block_start = self.frame_pos
+        block_end = block_start + frames
+        
+        for i in active.tolist():
+            start = int(self.voice_start[i])
+            
+            # Voices start at an absolute frame, which may be inside or after this block
+            a = max(start, block_start)
+            b = min(int(self.voice_end[i]), block_end)
+            if b <= a:
+                continue
+            
+            dry, rev, dly = self.voice_gain[i].tolist()
+            sample = self.pad_slots[int(self.voice_pad[i])][0]
+            segment = sample[a - start:b - start]
+            out = slice(a - block_start, b - block_start)
+            
+            mix_view[out] += segment * dry
+            if rev:
+                reverb_view[out] += segment * rev
+            if dly:
+                delay_view[out] += segment * dly
+
+    def _mix_voices_pitched(self, active, frames, mix_view, reverb_view, delay_view):
+        # Voices at a rate other than 1 read between sample frames (linear interpolation)
+        block_start = self.frame_pos
+        block_end = block_start + frames
+        
+        for i in active.tolist():
+            start = int(self.voice_start[i])
+            a = max(start, block_start)
+            b = min(int(self.voice_end[i]), block_end)
+            if b <= a:
+                continue
+            
+            sample = self.pad_slots[int(self.voice_pad[i])][0]
+            pos = (self.block_frames[a - block_start:b - block_start] + (block_start - start)) * self.voice_rate[i]
+            idx = pos.astype(np.int64)
+            frac = (pos - idx).astype(np.float32)[:, None]
+            x0 = sample[idx]
+            x1 = sample[np.minimum(idx + 1, len(sample) - 1)]
+            segment = x0 + (x1 - x0) * frac
+            
+            dry, rev, dly = self.voice_gain[i].tolist()
+            out = slice(a - block_start, b - block_start)
+            mix_view[out] += segment * dry
+            if rev:
+                reverb_view[out] += segment * rev
+            if dly:
+                delay_view[out] += segment * dly
+
+    def _mix_voices_batched(self, active, frames, mix_view, reverb_view, delay_view):
+        # A few NumPy calls per pad playing rather than per voice: gather every
+        # voice's block from its pad's sample, then one (3 x V) @ (V x frames*2)
+        # product gives the dry, reverb and delay buses at once.
+        n = len(active)
+        if n == 0:
+            return
+        
+        start = self.voice_start[active]
+        length = self.voice_end[active] - start
+        
+        # Position of each output frame within each voice's sample
+        pos = self.batch_pos[:n * frames].reshape(n, frames)
+        np.subtract(self.block_frames[:frames] + self.frame_pos, start[:, None], out=pos)
+        
+        # Frames before the start (negative, so huge when unsigned) or past the end are silent
+        outside = self.batch_outside[:n * frames].reshape(n, frames)
+        np.greater_equal(pos.view(np.uint64), length.astype(np.uint64)[:, None], out=outside)
+        np.copyto(pos, 0, where=outside)
+        
+        segments = self.batch_segments[:n * frames * 2].reshape(n, frames, 2)
+        pads = self.voice_pad[active]
+        for pad_id in np.unique(pads).tolist():
+            rows = np.flatnonzero(pads == pad_id)
+            segments[rows] = np.take(self.pad_slots[pad_id][0], pos[rows], axis=0)
+        segments[outside] = 0
+        
+        buses = self.voice_gain[active].T @ segments.reshape(n, frames * 2)
+        mix_view += buses[0].reshape(frames, 2)
+        reverb_view += buses[1].reshape(frames, 2)
+        delay_view += buses[2].reshape(frames, 2)
 
     def audio_callback(self, outdata, frames, time, status):
-        # if status:
-        #     print(status)
+        t0 = perf_counter()
+        if status and status.output_underflow:
+            self.metrics_underruns += 1
+        
+        self.render_block(outdata, frames)
         
+        elapsed_us = (perf_counter() - t0) * 1e6
+        load = elapsed_us / (frames * 1e6 / self.sample_rate) * 100.0
+        self.metrics_blocks += 1
+        self.metrics_callback_us = elapsed_us
+        self.metrics_callback_us_max = max(self.metrics_callback_us_max, elapsed_us)
+        self.metrics_dsp_load += 0.1 * (load - self.metrics_dsp_load)
+        self.metrics_active_voices = int(np.count_nonzero(self.voice_active))
+        self.metrics_peak = float(max(outdata.max(), -outdata.min()))
+        self.metrics_histogram[min(CALLBACK_HIST_BINS - 1, int(elapsed_us).bit_length())] += 1
+
+    def render_block(self, outdata, frames):
+        """Mix the next `frames` frames of all voices and effects into `outdata`.
+
+        Called from the sounddevice callback, and directly by the offline renderer.
+        """
         outdata.fill(0)
         
         # Ensure buffers are large enough (if frames > block_size, which shouldn't happen with fixed blocksize)
@@ -187,6 +577,8 @@ class AudioEngineSD:
              self.mix_buffer = np.zeros((frames, 2), dtype=np.float32)
              self.reverb_in = np.zeros((frames, 2), dtype=np.float32)
              self.delay_in = np.zeros((frames, 2), dtype=np.float32)
+             self._alloc_batch_buffers(frames)
+             self._alloc_delay_buffers(frames)
         
         # Use views
         mix_view = self.mix_buffer[:frames]
@@ -197,101 +589,26 @@ class AudioEngineSD:
         reverb_view.fill(0)
         delay_view.fill(0)
         
-        active_voices_next = []
-        
-        for voice in self.active_voices:
-            # Handle start delay
-            if voice.get('start_delay', 0) > 0:
-                if voice['start_delay'] >= frames:
-                    voice['start_delay'] -= frames
-                    active_voices_next.append(voice)
-                    continue
-                else:
-                    # Partial delay
-                    # We need to start mixing at offset
-                    # But for simplicity in this vectorized version, let's just skip the delay amount
-                    # and start mixing from the beginning of the block?
-                    # No, we need to mix into the buffer starting at 'start_delay'
-                    # This breaks the simple vectorization if we have multiple voices with different delays.
-                    # We can slice the destination buffer.
-                    
-                    start_offset = voice['start_delay']
-                    voice['start_delay'] = 0
-                    
-                    # Adjust destination views
-                    dest_mix = mix_view[start_offset:]
-                    dest_rev = reverb_view[start_offset:]
-                    dest_dly = delay_view[start_offset:]
-                    
-                    # Adjust count
-                    frames_to_mix = frames - start_offset
-                    
-                    sample = voice['sample']
-                    pos = voice['pos']
-                    remain = len(sample) - pos
-                    
-                    if remain > 0:
-                        count = min(frames_to_mix, remain)
-                        chunk = sample[pos:pos+count] * voice['velocity']
-                        
-                        dest_mix[:count] += chunk
-                        dest_rev[:count] += chunk * voice['reverb']
-                        dest_dly[:count] += chunk * voice['delay']
-                        
-                        voice['pos'] += count
-                        if voice['pos'] < len(sample):
-                            active_voices_next.append(voice)
-                    continue
-
-            sample = voice['sample']
-            pos = voice['pos']
-            remain = len(sample) - pos
-            
-            if remain > 0:
-                count = min(frames, remain)
-                chunk = sample[pos:pos+count] * voice['velocity']
-                
-                mix_view[:count] += chunk
-                reverb_view[:count] += chunk * voice['reverb']
-                delay_view[:count] += chunk * voice['delay']
-                
-                voice['pos'] += count
-                if voice['pos'] < len(sample):
-                    active_voices_next.append(voice)
-        
-        self.active_voices = active_voices_next
-        
-        # Vectorized Delay Processing
-        # This is tricky with feedback, but for short blocks we can approximate or use Python loop
-        # Python loop is slow. Let's try to vectorize if possible, but feedback makes it recursive.
-        # However, if delay time >> block size, we can read from buffer and write to buffer in chunks.
-        
-        # Delay Read
-        # We need to read 'frames' samples from delay_buffer starting at read_pos
-        read_pos = (self.delay_write_pos - self.delay_time_samples + self.delay_len) % self.delay_len
-        
-        # Handle wrap-around for reading
-        if read_pos + frames <= self.delay_len:
-            delayed_sig = self.delay_buffer[read_pos:read_pos+frames]
-        else:
-            part1 = self.delay_buffer[read_pos:]
-            part2 = self.delay_buffer[:frames - len(part1)]
-            delayed_sig = np.concatenate((part1, part2))
-            
-        # Delay Write (Input + Feedback)
-        input_sig = delay_view + delayed_sig * self.delay_feedback
+        if self.pending_samples:
+            self._install_samples()
+        while self.pending_voices:
+            self._start_voice(*self.pending_voices.popleft())
         
-        # Handle wrap-around for writing
-        if self.delay_write_pos + frames <= self.delay_len:
-            self.delay_buffer[self.delay_write_pos:self.delay_write_pos+frames] = input_sig
+        active = np.flatnonzero(self.voice_active)
+        pitched = self.voice_rate[active] != 1.0
+        unpitched = active[~pitched] if pitched.any() else active
+        if self.mixer == 'serial' or (self.mixer == 'auto' and len(unpitched) < self.batch_min_voices):
+            self._mix_voices_serial(unpitched, frames, mix_view, reverb_view, delay_view)
         else:
-            part1_len = self.delay_len - self.delay_write_pos
-            self.delay_buffer[self.delay_write_pos:] = input_sig[:part1_len]
-            self.delay_buffer[:frames - part1_len] = input_sig[part1_len:]
-            
-        self.delay_write_pos = (self.delay_write_pos + frames) % self.delay_len
+            self._mix_voices_batched(unpitched, frames, mix_view, reverb_view, delay_view)
+        if len(unpitched) < len(active):
+            self._mix_voices_pitched(active[pitched], frames, mix_view, reverb_view, delay_view)
         
-        mix_view += delayed_sig
+        # Free voices that finished in this block
+        block_end = self.frame_pos + frames
+        self.voice_active[active[self.voice_end[active] <= block_end]] = False
+        
+        self._process_delay(frames, mix_view, delay_view)
 
         # Vectorized Reverb Processing
         # Same logic as delay
@@ -318,3 +635,4 @@ class AudioEngineSD:
         mix_view += reverb_sig * 0.5
 
         outdata[:] = mix_view
+        self.frame_pos += frames
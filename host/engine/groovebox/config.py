@@ -7,12 +7,17 @@ class PadConfig:
     key: str 
     name: str
     sample: str
+    choke_group: int = 0 # pads sharing a non-zero group cut each other off
 
 @dataclass
 class GrooveboxConfig:
     bpm: float
     beats_per_bar: int
     pads: list[PadConfig]
+    polyphony: int = 32 # max simultaneous voices per engine
+    voice_steal: str = "oldest" # "oldest" or "quietest" when the pool is full
+    delay_division: float = 0.75 # delay time in beats, 0.75 = dotted eighth
+    sample_rate: int = 44100 # engine rate; samples are resampled to it on load
 
 def load_groovebox_config(config_path: str) -> GrooveboxConfig:
     with open(config_path, 'r') as f:
@@ -23,5 +28,9 @@ def load_groovebox_config(config_path: str) -> GrooveboxConfig:
     return GrooveboxConfig(
         bpm=data['bpm'],
         beats_per_bar=data['beats_per_bar'],
-        pads=pads
+        pads=pads,
+        polyphony=data.get('polyphony', 32),
+        voice_steal=data.get('voice_steal', 'oldest'),
+        delay_division=data.get('delay_division', 0.75),
+        sample_rate=data.get('sample_rate', 44100)
     )
\ No newline at end of file
@@ -0,0 +1,207 @@
+import json
+import threading
+import session
+from contextlib import contextmanager
+from dataclasses import dataclass
+from audio import AudioEngine
+from config import GrooveboxConfig
+from sequencer import Sequencer, make_empty_pattern
+
+@dataclass(frozen=True)
+class StepSnapshot:
+    state: int
+    offset: float
+    reverb_send: float
+    delay_send: float
+    pitch: float
+
+@dataclass(frozen=True)
+class TrackSnapshot:
+    pad_id: int
+    pattern_key: str # pattern the track plays now
+    next_pattern_key: str # pattern queued for the next bar
+    mute: bool
+    solo: bool
+    probability: float
+    steps: tuple[StepSnapshot, ...]
+
+@dataclass(frozen=True)
+class SequencerSnapshot:
+    """Read-only copy of what the UI shows, taken between two core ticks."""
+    playing: bool
+    recording: bool
+    fill_active: bool
+    bpm: float
+    swing: float
+    quantise_strength: float
+    audible_steps: int
+    song_position: int # chain entry playing in song mode, else -1
+    song_length: int # entries in the chain
+    tracks: tuple[TrackSnapshot, ...] # active track per pad, in pad order
+
+    def track(self, pad_id: int) -> TrackSnapshot:
+        return next(t for t in self.tracks if t.pad_id == pad_id)
+
+class GrooveboxCore:
+    """The sequencer and audio engine, driven by their own timing thread.
+
+    The core thread ticks the sequencer, installs loaded samples and polls
+    input devices every `tick_interval` seconds, so the beat doesn't wait on
+    a UI frame. Clients change state inside `edit()`, which holds the core's
+    lock, and read it back through `snapshot()`. Without a UI the core runs
+    on its own (see `main.py --headless`).
+    """
+
+    def __init__(self, config: GrooveboxConfig, audio=None, tick_interval: float = 0.002):
+        self.config = config
+        self.audio = audio if audio is not None else AudioEngine(config)
+        self.seq = Sequencer(make_empty_pattern(config), make_empty_pattern(config),
+                             make_empty_pattern(config), self.audio)
+        self.tick_interval = tick_interval
+        self.input_devices = []
+        self.lock = threading.RLock()
+        self.version = 0 # bumped by every edit, so snapshots know when to rebuild the tracks
+        self._tracks_key = None
+        self._tracks = ()
+        self._track_rows = {} # pad_id -> (copy of the step array, its StepSnapshots), see _track_snapshot
+        self._stop = threading.Event()
+        self._thread = None
+        self.session_path = None # binary session being autosaved, see open_session
+        self._session_writer = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="groovebox-core", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def load_session(self, path: str):
+        """Load a JSON session with 'sequencer' and 'audio' state (see render.py)."""
+        with open(path, 'r') as f:
+            data = json.load(f)
+        # Decoding samples is slow, so it happens before taking the lock
+        prepared = self.audio.prepare_state(data['audio']) if 'audio' in data else {}
+        with self.edit():
+            if 'audio' in data:
+                self.audio.load_state(data['audio'], prepared)
+            if 'sequencer' in data:
+                self.seq.load_state(data['sequencer'])
+
+    def open_session(self, path: str, recover: bool = True):
+        """Open a binary session (see session.py) and autosave every later edit
+        to its journal. With `recover`, edits journaled since the last save are
+        replayed (crash recovery); without, they are dropped (revert to saved).
+        A path that doesn't exist yet starts a new session there."""
+        fields, save_id, journal_end = session.load(path, recover)
+        prepared = session.prepare_fields(fields, self.audio) # decode samples before taking the lock
+        if self._session_writer is None:
+            self._session_writer = session.SessionWriter(self)
+        with self.edit():
+            if fields:
+                session.restore_fields(fields, self.seq, self.audio, prepared)
+            self._session_writer.open(path, fields, save_id, journal_end)
+            self.session_path = path
+
+    def save_session(self, path: str = None):
+        """Snapshot the session to `path` (default: the open one) on the writer
+        thread. Returns at once; later edits journal onto the new snapshot."""
+        path = path or self.session_path
+        if path is None:
+            raise ValueError("No session path to save to")
+        if path != self.session_path:
+            # Save as: the current state goes to the new file, nothing is read from it
+            if self._session_writer is None:
+                self._session_writer = session.SessionWriter(self)
+            self._session_writer.open(path, {}, 0, 0)
+            self.session_path = path
+        self._session_writer.save()
+
+    def close_session(self):
+        """Write pending journal records and stop autosaving."""
+        if self._session_writer is not None:
+            self._session_writer.close()
+            self._session_writer = None
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        while not self._stop.wait(self.tick_interval):
+            self.tick()
+
+    def tick(self):
+        """One pass of the core loop. Called by the core thread; call it directly when not started."""
+        events = [event for device in self.input_devices for event in device.poll_events()]
+        with self.edit(changed=bool(events)):
+            for event in events:
+                if event.pressed:
+                    self.seq.handle_pad_press(event.pad_id)
+            self.audio.poll_loads()
+            self.seq.tick()
+
+    @contextmanager
+    def edit(self, changed: bool = True):
+        """Hold the core lock to change sequencer or engine state."""
+        with self.lock:
+            try:
+                yield self.seq
+            finally:
+                if changed:
+                    self.mark_changed()
+
+    def mark_changed(self):
+        """Note a change made under `edit(changed=False)`, for snapshots and the journal."""
+        with self.lock:
+            self.version += 1
+            if self._session_writer is not None:
+                self._session_writer.notify()
+
+    def snapshot(self) -> SequencerSnapshot:
+        with self.lock:
+            seq = self.seq
+            # Tracks only change with an edit, a pattern switch or the fill
+            key = (self.version, seq.fill_active, seq.current_pattern_key,
+                   tuple(seq.track_pattern_keys.items()), tuple(seq.next_track_pattern_keys.items()))
+            if key != self._tracks_key:
+                self._tracks = tuple(self._track_snapshot(track) for track in seq.get_active_tracks())
+                self._tracks_key = key
+            return SequencerSnapshot(
+                playing=seq.playing,
+                recording=seq.recording,
+                fill_active=seq.fill_active,
+                bpm=seq.pattern.bpm,
+                swing=seq.swing,
+                quantise_strength=seq.quantise_strength,
+                audible_steps=seq.audible_steps(),
+                song_position=seq.song_position if seq.song_mode else -1,
+                song_length=len(seq.chain),
+                tracks=self._tracks,
+            )
+
+    def _track_snapshot(self, track) -> TrackSnapshot:
+        pad_id = track.pad_id
+        pattern_key = self.seq.track_pattern_keys.get(pad_id, 'A')
+        # Rows whose steps are unchanged keep their StepSnapshots, so an edit
+        # (e.g. a recorded hit) only converts the rows it touched
+        array = track.step_array
+        cached = self._track_rows.get(pad_id)
+        if cached is not None and cached[0].shape == array.shape and (cached[0] == array).all():
+            steps = cached[1]
+        else:
+            steps = tuple(StepSnapshot(*values) for values in array.tolist())
+            self._track_rows[pad_id] = (array.copy(), steps)
+        return TrackSnapshot(
+            pad_id=pad_id,
+            pattern_key=pattern_key,
+            next_pattern_key=self.seq.next_track_pattern_keys.get(pad_id, pattern_key),
+            mute=track.mute,
+            solo=track.solo,
+            probability=track.probability,
+            steps=steps,
+        )
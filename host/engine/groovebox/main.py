@@ -1,9 +1,51 @@
+import argparse
+import signal
+import threading
 from config import load_groovebox_config
-from ui_pygame import GrooveboxUI
 from pathlib import Path
 
+DEFAULT_SESSION = "session.gbx"
+
+def open_session(core, path):
+    """JSON sessions (as render.py takes) are only loaded; binary ones are autosaved."""
+    if path.endswith('.json'):
+        core.load_session(path)
+    else:
+        core.open_session(path)
+
+def run_headless(cfg, args):
+    """Run the sequencer and audio core without a window until interrupted."""
+    from core import GrooveboxCore
+    core = GrooveboxCore(cfg)
+    if args.session:
+        open_session(core, args.session)
+    if args.play:
+        with core.edit() as seq:
+            seq.toggle_play()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    core.start()
+    print("Groovebox core running headless, Ctrl+C to stop")
+    try:
+        while not stop.wait(0.5):
+            pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        core.stop()
+        core.close_session()
+
 def main():
-    config_path = "config/pad.json"
+    parser = argparse.ArgumentParser(description="GrooveBox engine")
+    parser.add_argument("--config", default="config/pad.json")
+    parser.add_argument("--headless", action="store_true", help="Run the sequencer and audio without the UI")
+    parser.add_argument("--session", help="Session to open: binary, autosaved and created if missing, "
+                        f"or a JSON session to load (default: {DEFAULT_SESSION} with the UI, none headless)")
+    parser.add_argument("--play", action="store_true", help="Start the transport at once (headless only)")
+    args = parser.parse_args()
+
+    config_path = args.config
     try:
         cfg = load_groovebox_config(config_path)
     except (FileNotFoundError, ValueError) as e:
@@ -11,8 +53,14 @@ def main():
         print("Please ensure the configuration file exists and is valid JSON.")
         return
 
+    if args.headless:
+        run_headless(cfg, args)
+        return
+
+    from ui_pygame import GrooveboxUI
     ui = GrooveboxUI(cfg)
+    open_session(ui.core, args.session or DEFAULT_SESSION)
     ui.run()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
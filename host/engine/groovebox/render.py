@@ -0,0 +1,141 @@
+import argparse
+import json
+import math
+import os
+from contextlib import ExitStack
+import soundfile as sf
+import numpy as np
+from config import load_groovebox_config
+from audio_sd import AudioEngineSD
+import audio_cpp
+from sequencer import Sequencer, make_empty_pattern
+import session
+
+class OfflineRenderer:
+    """Bounces a sequencer + engine to a WAV file as fast as the CPU allows.
+
+    The sequencer is driven in sample time (`Sequencer.advance`) rather than
+    `time.monotonic()`, so identical sessions render bit-identical files.
+    """
+
+    def __init__(self, seq: Sequencer, engine, block_size: int = None):
+        self.seq = seq
+        self.engine = engine
+        self.sample_rate = engine.sample_rate
+        self.block_size = block_size or engine.block_size
+        self.out_buffer = np.zeros((self.block_size, 2), dtype=np.float32)
+
+    def bar_seconds(self, bars: float) -> float:
+        # Swing only moves steps within a pair, so a bar is always the straight length
+        pattern = self.seq.patterns['A']
+        step = 60.0 / pattern.bpm / pattern.beats_per_bar * 4
+        return bars * pattern.beats_per_bar * step
+
+    def render(self, path: str, seconds: float, tail_seconds: float = 0.0,
+               subtype: str = 'PCM_24', seed: int = 0, stems_dir: str = None) -> int:
+        """Render `seconds` of the loop (plus an effect tail) to `path`.
+
+        With `stems_dir`, the same pass also writes one file per stem the
+        engine offers (`stem_names()`; each pad's channel strip and the effect
+        returns) into that directory. Returns the number of frames written.
+        """
+        total_frames = int(math.ceil(seconds * self.sample_rate))
+        tail_frames = int(math.ceil(tail_seconds * self.sample_rate))
+
+        self.engine.reset()
+        self.seq.rng.seed(seed)
+        self.seq.rewind()
+        self.seq.playing = True
+
+        stems = stem_files = None
+        written = 0
+        with ExitStack() as files:
+            f = files.enter_context(sf.SoundFile(path, 'w', samplerate=self.sample_rate, channels=2, subtype=subtype))
+            if stems_dir:
+                if not hasattr(self.engine, 'stem_names'):
+                    raise ValueError(f"{type(self.engine).__name__} has no stem outputs")
+                os.makedirs(stems_dir, exist_ok=True)
+                names = self.engine.stem_names()
+                stems = np.zeros((len(names), self.block_size, 2), dtype=np.float32)
+                # Stems are taken before the master soft clip; float files keep
+                # them whole so they still sum to the mix
+                clip_stems = subtype.startswith('PCM')
+                stem_files = [files.enter_context(sf.SoundFile(os.path.join(stems_dir, name + ".wav"), 'w',
+                                                               samplerate=self.sample_rate, channels=2,
+                                                               subtype=subtype))
+                              for name in names]
+            while written < total_frames + tail_frames:
+                frames = min(self.block_size, total_frames + tail_frames - written)
+                if written >= total_frames:
+                    # Let delay/reverb ring out without triggering new steps
+                    self.seq.playing = False
+                out = self.out_buffer[:frames]
+                self.seq.advance(frames, self.sample_rate)
+                if stems is None:
+                    self.engine.render_block(out, frames)
+                else:
+                    # The engine writes stems in place, so the short last block needs its own array
+                    block_stems = stems if frames == self.block_size else np.zeros((len(stems), frames, 2), np.float32)
+                    self.engine.render_block(out, frames, block_stems)
+                    for stem, stem_file in zip(block_stems, stem_files):
+                        stem_file.write(np.clip(stem[:frames], -1.0, 1.0) if clip_stems else stem[:frames])
+                # Clip like the DAC would; integer subtypes would wrap otherwise
+                np.clip(out, -1.0, 1.0, out=out)
+                f.write(out)
+                written += frames
+
+        self.seq.playing = False
+        return written
+
+def load_session(path: str, seq: Sequencer, engine):
+    """Load a JSON session as produced by `get_state` on the sequencer and engine,
+    or a binary one (see session.py) with its journal."""
+    if not path.endswith('.json'):
+        fields, _, _ = session.load(path)
+        session.restore_fields(fields, seq, engine)
+        return
+    with open(path, 'r') as f:
+        data = json.load(f)
+    if 'audio' in data:
+        engine.load_state(data['audio'])
+    if 'sequencer' in data:
+        seq.load_state(data['sequencer'])
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a groovebox loop to a WAV file")
+    parser.add_argument("output", help="WAV file to write")
+    parser.add_argument("--config", default="config/pad.json")
+    parser.add_argument("--session", help="JSON session with 'sequencer' and 'audio' state, or a binary session")
+    parser.add_argument("--bars", type=float, default=4)
+    parser.add_argument("--seconds", type=float, help="Length in seconds (overrides --bars)")
+    parser.add_argument("--tail", type=float, default=0.0, help="Seconds of effect tail after the loop")
+    parser.add_argument("--block-size", type=int, default=1024)
+    # FLOAT files carry a timestamped PEAK chunk, so only PCM output is byte-identical
+    parser.add_argument("--subtype", default="PCM_24", help="soundfile subtype, e.g. PCM_16, PCM_24, FLOAT")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for step probability")
+    parser.add_argument("--engine", choices=['sd', 'cpp'], default='sd',
+                        help="Engine to render with; only cpp has channel strips and stems")
+    parser.add_argument("--stems", metavar="DIR", help="Also write each pad's strip and the effect returns to DIR")
+    args = parser.parse_args()
+    if args.stems and args.engine != 'cpp':
+        parser.error("--stems needs --engine cpp")
+    if args.engine == 'cpp' and not audio_cpp.AVAILABLE:
+        parser.error("the C++ engine extension is not built")
+
+    cfg = load_groovebox_config(args.config)
+    if args.engine == 'cpp':
+        engine = audio_cpp.AudioEngineCpp(cfg, start_stream=False)
+    else:
+        engine = AudioEngineSD(cfg, start_stream=False)
+    seq = Sequencer(make_empty_pattern(cfg), make_empty_pattern(cfg), make_empty_pattern(cfg), engine)
+    if args.session:
+        load_session(args.session, seq, engine)
+
+    renderer = OfflineRenderer(seq, engine, block_size=args.block_size)
+    seconds = args.seconds if args.seconds is not None else renderer.bar_seconds(args.bars)
+    frames = renderer.render(args.output, seconds, tail_seconds=args.tail, subtype=args.subtype, seed=args.seed,
+                             stems_dir=args.stems)
+    print(f"Rendered {frames / engine.sample_rate:.2f}s to {args.output}")
+
+if __name__ == "__main__":
+    main()
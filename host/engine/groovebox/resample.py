@@ -0,0 +1,56 @@
+from functools import lru_cache
+from math import gcd
+import numpy as np
+
+MAX_PHASES = 1024 # ratios needing more phases round to the nearest of these
+ZERO_CROSSINGS = 16 # per side of the sinc, at the narrower of the two rates
+KAISER_BETA = 8.6 # ~ -90 dB stopband
+CHUNK_FRAMES = 16384
+
+@lru_cache(maxsize=16)
+def _kernel_bank(phases: int, taps: int, cutoff: float) -> np.ndarray:
+    """Windowed-sinc filter for each of `phases` sub-sample offsets, shape (phases, taps).
+
+    Row p interpolates at p / phases of the way from input frame `taps // 2 - 1`
+    to the next. Rows are normalised to unity DC gain.
+    """
+    half = taps // 2
+    offsets = np.arange(phases)[:, None] / phases
+    d = np.arange(taps)[None, :] - (half - 1) - offsets # distance in input frames
+    window = np.i0(KAISER_BETA * np.sqrt(np.clip(1.0 - (d / half) ** 2, 0.0, 1.0))) / np.i0(KAISER_BETA)
+    bank = cutoff * np.sinc(cutoff * d) * window
+    bank /= bank.sum(axis=1, keepdims=True)
+    return bank.astype(np.float32)
+
+def resample(data: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    """Band-limited polyphase resampling of a `(frames, channels)` float array.
+
+    Each output frame is a dot product of `taps` input frames with one row of a
+    precomputed kernel bank, evaluated a chunk of frames at a time.
+    """
+    if src_rate == dst_rate:
+        return np.ascontiguousarray(data, dtype=np.float32)
+    g = gcd(src_rate, dst_rate)
+    up, down = dst_rate // g, src_rate // g
+    phases = min(up, MAX_PHASES)
+    # Downsampling lowers the cutoff, which widens the kernel in input frames
+    cutoff = min(1.0, dst_rate / src_rate)
+    taps = 2 * int(np.ceil(ZERO_CROSSINGS / cutoff))
+    bank = _kernel_bank(phases, taps, cutoff)
+
+    frames, channels = data.shape
+    out_frames = -(-frames * up // down)
+    half = taps // 2
+    padded = np.zeros((frames + taps + 1, channels), dtype=np.float32)
+    padded[half:half + frames] = data
+    out = np.empty((out_frames, channels), dtype=np.float32)
+    tap_range = np.arange(taps)
+
+    for start in range(0, out_frames, CHUNK_FRAMES):
+        n = np.arange(start, min(start + CHUNK_FRAMES, out_frames), dtype=np.int64)
+        # Output frame n sits at n * down / up input frames, in 1/phases steps
+        q = (n * down * phases + up // 2) // up
+        base, phase = np.divmod(q, phases)
+        window = padded[(base + 1)[:, None] + tap_range] # (n, taps, channels)
+        out[start:start + len(n)] = np.einsum('nt,ntc->nc', bank[phase], window)
+    return out
@@ -0,0 +1,187 @@
+import os
+import sqlite3
+import threading
+import numpy as np
+import soundfile as sf
+from sample_store import default_cache_dir
+
+THUMBNAIL_POINTS = 64 # per-bucket peaks, 0..255
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    path TEXT PRIMARY KEY,      -- absolute
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    frames INTEGER,             -- NULL if the file could not be decoded
+    sample_rate INTEGER,
+    channels INTEGER,
+    duration REAL,
+    peak REAL,
+    rms REAL,
+    thumbnail BLOB
+);
+CREATE INDEX IF NOT EXISTS samples_dir_name ON samples (dir, name);
+CREATE INDEX IF NOT EXISTS samples_name ON samples (name);
+"""
+
+def default_db_path():
+    return os.path.join(os.path.dirname(default_cache_dir()), "library.sqlite")
+
+def analyse(path: str) -> dict:
+    """Decode a file once and summarise it for the index."""
+    data, sample_rate = sf.read(path, always_2d=True, dtype='float32')
+    frames, channels = data.shape
+    level = np.abs(data).max(axis=1) if frames else np.zeros(0, dtype=np.float32)
+    thumbnail = np.zeros(THUMBNAIL_POINTS, dtype=np.uint8)
+    if frames:
+        edges = np.linspace(0, frames, THUMBNAIL_POINTS + 1).astype(np.int64)
+        # Short files have empty buckets; repeat the previous frame for those
+        starts = np.minimum(edges[:-1], frames - 1)
+        buckets = np.maximum.reduceat(level, starts)
+        thumbnail = np.round(np.clip(buckets, 0.0, 1.0) * 255).astype(np.uint8)
+    return {
+        'frames': frames,
+        'sample_rate': sample_rate,
+        'channels': channels,
+        'duration': frames / sample_rate,
+        'peak': float(level.max()) if frames else 0.0,
+        'rms': float(np.sqrt(np.mean(np.square(data, dtype=np.float64)))) if frames else 0.0,
+        'thumbnail': thumbnail.tobytes(),
+    }
+
+class SampleLibrary:
+    """Persistent index of every .wav under `root`.
+
+    `scan()` walks the tree and re-analyses only files whose size or mtime
+    changed, so a startup rescan of an unchanged library is one stat per file.
+    Queries go to SQLite, so browsing and filtering don't touch the disk tree.
+    Each thread gets its own connection; scanning on a background thread while
+    the UI queries is safe (WAL journal).
+    """
+
+    def __init__(self, root: str = "samples", db_path: str = None):
+        self.root = os.path.abspath(root)
+        self.db_path = db_path or default_db_path()
+        self._local = threading.local()
+        self._scan_thread = None
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def scan(self) -> dict:
+        """Bring the index up to date with the tree. Returns counts of what changed."""
+        conn = self._conn()
+        prefix = self.root + os.sep
+        known = {row['path']: (row['mtime_ns'], row['size'])
+                 for row in conn.execute("SELECT path, mtime_ns, size FROM samples WHERE path >= ? AND path < ?",
+                                         (prefix, prefix[:-1] + chr(ord(os.sep) + 1)))}
+        counts = {'added': 0, 'updated': 0, 'removed': 0, 'unchanged': 0}
+        seen = set()
+        pending = 0
+        for path, st in self._walk(self.root):
+            seen.add(path)
+            previous = known.get(path)
+            if previous == (st.st_mtime_ns, st.st_size):
+                counts['unchanged'] += 1
+                continue
+            try:
+                meta = analyse(path)
+            except (RuntimeError, OSError, ValueError):
+                meta = dict.fromkeys(('frames', 'sample_rate', 'channels', 'duration', 'peak', 'rms', 'thumbnail'))
+            conn.execute(
+                "INSERT OR REPLACE INTO samples (path, dir, name, mtime_ns, size, frames, sample_rate, channels, "
+                "duration, peak, rms, thumbnail) VALUES (:path, :dir, :name, :mtime_ns, :size, :frames, "
+                ":sample_rate, :channels, :duration, :peak, :rms, :thumbnail)",
+                dict(meta, path=path, dir=os.path.dirname(path), name=os.path.basename(path),
+                     mtime_ns=st.st_mtime_ns, size=st.st_size))
+            counts['updated' if previous else 'added'] += 1
+            pending += 1
+            if pending >= 200:
+                conn.commit()
+                pending = 0
+
+        removed = [(path,) for path in known.keys() - seen]
+        conn.executemany("DELETE FROM samples WHERE path = ?", removed)
+        counts['removed'] = len(removed)
+        conn.commit()
+        return counts
+
+    def scan_in_background(self):
+        if self._scan_thread is None or not self._scan_thread.is_alive():
+            self._scan_thread = threading.Thread(target=self.scan, name="library-scan", daemon=True)
+            self._scan_thread.start()
+
+    def _walk(self, directory: str):
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from self._walk(entry.path)
+            elif entry.name.lower().endswith('.wav'):
+                try:
+                    yield entry.path, entry.stat()
+                except OSError:
+                    continue
+
+    def files_in(self, directory: str):
+        """Sorted .wav names in `directory`, or None if it isn't indexed yet."""
+        try:
+            names = [row['name'] for row in self._conn().execute(
+                "SELECT name FROM samples WHERE dir = ? AND frames IS NOT NULL ORDER BY name",
+                (os.path.abspath(directory),))]
+        except sqlite3.Error:
+            return None # e.g. unwritable cache dir; callers fall back to listing
+        return names or None
+
+    def info(self, path: str):
+        row = self._conn().execute("SELECT * FROM samples WHERE path = ?", (os.path.abspath(path),)).fetchone()
+        return dict(row) if row else None
+
+    def thumbnail(self, path: str):
+        info = self.info(path)
+        if not info or info['thumbnail'] is None:
+            return None
+        return np.frombuffer(info['thumbnail'], dtype=np.uint8)
+
+    def search(self, text: str = "", directory: str = None, min_seconds: float = None,
+               max_seconds: float = None, limit: int = 200) -> list:
+        """Indexed samples whose name contains `text`, optionally within a directory tree and length range."""
+        clauses = ["frames IS NOT NULL"]
+        args = []
+        if text:
+            clauses.append("name LIKE ? ESCAPE '\\'")
+            args.append("%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        if directory:
+            prefix = os.path.abspath(directory) + os.sep
+            clauses.append("path >= ? AND path < ?")
+            args += [prefix, prefix[:-1] + chr(ord(os.sep) + 1)]
+        if min_seconds is not None:
+            clauses.append("duration >= ?")
+            args.append(min_seconds)
+        if max_seconds is not None:
+            clauses.append("duration <= ?")
+            args.append(max_seconds)
+        query = ("SELECT path, name, duration, sample_rate, channels, peak, rms FROM samples WHERE "
+                 + " AND ".join(clauses) + " ORDER BY dir, name LIMIT ?")
+        return [dict(row) for row in self._conn().execute(query, args + [limit])]
+
+_default_library = None
+
+def get_library() -> SampleLibrary:
+    """The process-wide index of the `samples/` tree."""
+    global _default_library
+    if _default_library is None:
+        _default_library = SampleLibrary()
+    return _default_library
@@ -0,0 +1,91 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+def sample_files(directory: str, library=None) -> list:
+    # The library answers from its index; unindexed directories are listed directly
+    files = library.files_in(directory) if library is not None else None
+    if files is None:
+        files = sorted(f for f in os.listdir(directory) if f.lower().endswith('.wav'))
+    return files
+
+def neighbour_paths(path: str, offsets, library=None) -> list:
+    """The .wav files at each of `offsets` places from `path` in its directory (wrapping)."""
+    directory = os.path.dirname(path)
+    files = sample_files(directory, library)
+    if not files:
+        return []
+    name = os.path.basename(path)
+    idx = files.index(name) if name in files else None
+    # A path that isn't in the listing steps to the first file
+    return [os.path.join(directory, files[0 if idx is None else (idx + offset) % len(files)])
+            for offset in offsets]
+
+class SampleLoader:
+    """Prepares samples on worker threads and installs them on the caller's thread.
+
+    `prepare(path)` runs on the pool (decode, map, analyse). `poll()` must be
+    called from the thread that owns the engine -- the core thread -- and passes
+    each finished result to `install(pad_id, path, prepared)`, so an engine
+    only ever swaps in a complete sample and its command queue keeps a single
+    producer. A newer request for a pad supersedes an older one.
+
+    With `warm(path)`, which should only fill caches (the sample store and its
+    peaks), each request also warms the files either side of it, so stepping
+    through a directory finds the next sample already decoded.
+    """
+
+    def __init__(self, prepare, install, library=None, workers: int = 2, prefetch: int = 1, warm=None):
+        self.prepare = prepare
+        self.install = install
+        self.warm = warm
+        self.library = library
+        self.prefetch = prefetch
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sample-loader")
+        self.pending = {} # pad_id -> (path, future), newest request only
+
+    def request(self, pad_id: int, path: str):
+        self.pending[pad_id] = (path, self.executor.submit(self.prepare, path))
+        if self.warm is None:
+            return
+        offsets = [o for n in range(1, self.prefetch + 1) for o in (n, -n)]
+        try:
+            neighbours = neighbour_paths(path, offsets, self.library)
+        except OSError:
+            return
+        for neighbour in dict.fromkeys(neighbours):
+            if neighbour != path:
+                self.executor.submit(self._warm, neighbour)
+
+    def neighbour(self, path: str, offset: int):
+        """The .wav `offset` places after `path` in its directory, or None if there are none."""
+        paths = neighbour_paths(path, [offset], self.library)
+        return paths[0] if paths else None
+
+    def is_loading(self, pad_id: int) -> bool:
+        return pad_id in self.pending
+
+    def requested_path(self, pad_id: int):
+        """Path of the load in flight for `pad_id`, or None."""
+        entry = self.pending.get(pad_id)
+        return entry[0] if entry else None
+
+    def poll(self):
+        for pad_id, (path, future) in list(self.pending.items()):
+            if not future.done():
+                continue
+            del self.pending[pad_id]
+            try:
+                prepared = future.result()
+            except Exception as e:
+                print(f"Warning: Could not load sample for pad {pad_id} ({path}): {e}")
+                continue
+            self.install(pad_id, path, prepared)
+
+    def _warm(self, path: str):
+        try:
+            self.warm(path)
+        except Exception:
+            pass # only a cache warm-up; a real request reports the error
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
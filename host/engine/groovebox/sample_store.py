@@ -0,0 +1,197 @@
+import hashlib
+import os
+import tempfile
+import threading
+import numpy as np
+import soundfile as sf
+from resample import resample
+
+def default_cache_dir():
+    return os.environ.get("GROOVEBOX_SAMPLE_CACHE",
+                          os.path.join(os.path.expanduser("~"), ".cache", "groovebox", "samples"))
+
+class SampleStore:
+    """Decodes each sample file once and shares it between all engines.
+
+    The first load of a file decodes it (and resamples it, if a rate is asked
+    for) to a float32 `.npy` in the cache directory; every later load
+    (including in other processes) memory-maps that file. Arrays are read-only `(frames, channels)` memmaps, so trims and
+    reverses are plain slices of the mapped pages rather than copies. The peak
+    analysis the engines need (`peaks`) is cached beside it the same way.
+    """
+
+    def __init__(self, cache_dir: str = None):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self._arrays = {} # cache path -> memmap, shared by every caller in this process
+        self._peaks = {} # cache name -> (PeakTable, PeakPyramid)
+        self._lock = threading.Lock()
+
+    def load(self, file_path: str, sample_rate: int = None) -> np.ndarray:
+        """The file's frames, resampled to `sample_rate` if given and different.
+
+        Resampled versions are cached per (file, rate) like the decoded file.
+        """
+        key = self._cache_key(file_path)
+        if sample_rate is None:
+            return self._entry(key + ".npy", lambda: sf.read(file_path, always_2d=True, dtype='float32')[0])
+        
+        resampled_path = f"{key}@{sample_rate}.npy"
+        with self._lock:
+            data = self._arrays.get(os.path.join(self.cache_dir, resampled_path))
+        if data is not None:
+            return data
+        file_rate = sf.info(file_path).samplerate
+        if file_rate == sample_rate:
+            return self.load(file_path)
+        return self._entry(resampled_path, lambda: resample(self.load(file_path), file_rate, sample_rate))
+
+    def peaks(self, file_path: str, sample_rate: int = None):
+        """`(PeakTable, PeakPyramid)` of `load(file_path, sample_rate)`.
+
+        Both are built from their finest level, which is cached on disk under
+        the sample's key, so a cache hit never scans the whole sample.
+        """
+        data = self.load(file_path, sample_rate)
+        name = self._cache_key(file_path) + (f"@{sample_rate}" if sample_rate else "")
+        with self._lock:
+            peaks = self._peaks.get(name)
+        if peaks is not None:
+            return peaks
+        table_peaks = self._entry(name + ".peaks.npy", lambda: PeakTable(data).peaks)
+        envelope = self._entry(name + ".envelope.npy", lambda: np.stack(PeakPyramid(data).levels[0]))
+        peaks = (PeakTable(data, peaks=table_peaks), PeakPyramid(data, level0=envelope))
+        with self._lock:
+            return self._peaks.setdefault(name, peaks)
+
+    def _cache_key(self, file_path: str) -> str:
+        # Editing the file changes its size or mtime, which gives it a new entry
+        st = os.stat(file_path)
+        key = f"{os.path.abspath(file_path)}|{st.st_size}|{st.st_mtime_ns}"
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def _entry(self, name: str, produce) -> np.ndarray:
+        cache_path = os.path.join(self.cache_dir, name)
+        with self._lock:
+            data = self._arrays.get(cache_path)
+        if data is not None:
+            return data
+
+        if not os.path.exists(cache_path):
+            self._write(cache_path, produce())
+        data = np.load(cache_path, mmap_mode='r')
+        with self._lock:
+            return self._arrays.setdefault(cache_path, data)
+
+    def _write(self, cache_path: str, data: np.ndarray):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Write beside the target and rename, so a reader never maps a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, data)
+            os.replace(tmp_path, cache_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+class PeakTable:
+    """Absolute peak of every `block` frames of a sample.
+
+    `peak(start, end)` scans the table plus at most two partial blocks, so
+    re-normalizing after each trim step doesn't touch the whole sample.
+    """
+
+    def __init__(self, data: np.ndarray, block: int = 256, peaks: np.ndarray = None):
+        self.data = data
+        self.block = block
+        if peaks is None:
+            whole = len(data) // block
+            blocks = np.asarray(data[:whole * block]).reshape(whole, -1)
+            peaks = np.abs(blocks).max(axis=1) if whole else np.zeros(0, dtype=np.float32)
+        self.peaks = peaks # from SampleStore.peaks when cached
+
+    def peak(self, start: int, end: int) -> float:
+        if end <= start:
+            return 0.0
+        first = -(-start // self.block) # first whole block in the range
+        last = end // self.block
+        if first >= last:
+            return float(np.abs(self.data[start:end]).max())
+        peak = self.peaks[first:last].max()
+        if start < first * self.block:
+            peak = max(peak, np.abs(self.data[start:first * self.block]).max())
+        if last * self.block < end:
+            peak = max(peak, np.abs(self.data[last * self.block:end]).max())
+        return float(peak)
+
+class PeakPyramid:
+    """Min/max envelope of a sample's channel mix at every power-of-two zoom.
+
+    Level 0 holds the min and max of each `base` frames, and each level above
+    halves the one below, so drawing any range at any width reads at most
+    about two buckets per column. Built once per loaded sample; `level0`, the
+    `(mins, maxs)` of level 0 from an earlier build, skips the pass over the frames.
+    """
+
+    def __init__(self, data: np.ndarray, base: int = 64, level0=None):
+        self.data = data
+        self.base = base
+        self.frames = len(data)
+        if level0 is None:
+            mono = np.asarray(data).mean(axis=1, dtype=np.float32) if data.ndim > 1 else np.asarray(data, dtype=np.float32)
+            whole = -(-len(mono) // base)
+            padded = np.empty(whole * base, dtype=np.float32)
+            padded[:len(mono)] = mono
+            padded[len(mono):] = mono[-1] if len(mono) else 0.0 # repeat the last frame, so padding adds no extremes
+            blocks = padded.reshape(whole, base)
+            level0 = (blocks.min(axis=1), blocks.max(axis=1))
+        self.levels = [tuple(level0)]
+        while len(self.levels[-1][0]) > 1:
+            mins, maxs = self.levels[-1]
+            if len(mins) % 2:
+                mins, maxs = np.append(mins, mins[-1]), np.append(maxs, maxs[-1])
+            self.levels.append((mins.reshape(-1, 2).min(axis=1), maxs.reshape(-1, 2).max(axis=1)))
+
+    def __len__(self):
+        return self.frames
+
+    def envelope(self, start: int, end: int, width: int, reverse: bool = False):
+        """`(mins, maxs)` of frames [start, end) in `width` columns (fewer if the range is shorter)."""
+        start, end = max(0, start), min(self.frames, end)
+        if end <= start or width <= 0:
+            empty = np.zeros(0, dtype=np.float32)
+            return empty, empty
+        width = min(width, end - start)
+        per_column = (end - start) / width
+        if per_column < self.base:
+            # Zoomed in past level 0: read the frames themselves
+            mono = np.asarray(self.data[start:end], dtype=np.float32)
+            mins = maxs = mono.mean(axis=1) if mono.ndim > 1 else mono
+            block = 1
+            offset = start
+        else:
+            level = min(int(np.log2(per_column / self.base)), len(self.levels) - 1)
+            block = self.base << level
+            offset = start // block * block
+            first, last = start // block, -(-end // block)
+            mins, maxs = (a[first:last] for a in self.levels[level])
+        columns = start + np.arange(width + 1) * per_column - offset
+        edges = (columns[:-1] // block).astype(np.int64)
+        # A column also takes the bucket its last frame falls in, which
+        # reduceat otherwise leaves to the next column
+        tails = np.ceil(columns[1:] / block).astype(np.int64) - 1
+        tails = np.minimum(tails, len(mins) - 1)
+        mins = np.minimum(np.minimum.reduceat(mins, edges), mins[tails])
+        maxs = np.maximum(np.maximum.reduceat(maxs, edges), maxs[tails])
+        if reverse:
+            mins, maxs = mins[::-1], maxs[::-1]
+        return mins, maxs
+
+_default_store = None
+
+def get_store() -> SampleStore:
+    """The process-wide store used by the audio engines."""
+    global _default_store
+    if _default_store is None:
+        _default_store = SampleStore()
+    return _default_store
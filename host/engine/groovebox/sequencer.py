@@ -1,42 +1,355 @@
-from dataclasses import dataclass, asdict
+from collections.abc import Sequence
+import functools
 import time
 import random
+from collections import deque
+import numpy as np
 from audio import AudioEngine
+from undo import TrackEdit, UndoHistory
+
+LAUNCH_BARS = (1, 2, 4) # launch quantisation choices, in bars
+BANK_SIZE = 26 * 27 # patterns the UI steps through, A to ZZ
+
+# Packed layout of one step. Sends and pitch stay float64 so values round-trip
+# through sessions exactly.
+STEP_DTYPE = np.dtype([
+    ('state', np.int8), # 0 = off, 1 = normal, 2 = accented
+    ('offset', np.float64), # -0.5 to 0.5, fraction of a step duration
+    ('reverb_send', np.float64),
+    ('delay_send', np.float64),
+    ('pitch', np.float64), # semitones, changes the playback rate
+])
+
+def _step_field(name, cast):
+    def get(self):
+        return cast(self._pattern.steps[name][self._row, self._col])
+    def set(self, value):
+        self._pattern.steps[name][self._row, self._col] = value
+        self._pattern.version += 1
+    return property(get, set)
+
+def _track_field(name, cast):
+    def get(self):
+        return cast(getattr(self._pattern, name)[self._row])
+    def set(self, value):
+        getattr(self._pattern, name)[self._row] = value
+        self._pattern.version += 1
+    return property(get, set)
 
-@dataclass
 class Step:
-    state: int = 0
-    # 0 = off, 1 = normal, 2 = accented
-    offset: float = 0.0
-    # -0.5 to 0.5, fraction of a step duration
-    reverb_send: float = 0.0
-    delay_send: float = 0.0
+    """One step, read and written in place in its pattern's `steps` array.
+
+    `Step(...)` on its own holds its values in a pattern of its own, e.g. to
+    build a `Track`.
+    """
+    __slots__ = ('_pattern', '_row', '_col')
+
+    def __init__(self, state=0, offset=0.0, reverb_send=0.0, delay_send=0.0, pitch=0.0):
+        self._pattern = Pattern.packed([(-1, [(state, offset, reverb_send, delay_send, pitch)], False, False, 1.0)])
+        self._row = self._col = 0
+
+    @classmethod
+    def _view(cls, pattern, row, col):
+        step = cls.__new__(cls)
+        step._pattern, step._row, step._col = pattern, row, col
+        return step
+
+    state = _step_field('state', int)
+    offset = _step_field('offset', float)
+    reverb_send = _step_field('reverb_send', float)
+    delay_send = _step_field('delay_send', float)
+    pitch = _step_field('pitch', float)
+
+    def astuple(self):
+        return self._pattern.steps[self._row, self._col].item()
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={value!r}" for name, value in zip(STEP_DTYPE.names, self.astuple()))
+        return f"Step({fields})"
+
+class StepList(Sequence):
+    """The steps of a track, as `Step` views. Slicing returns a list."""
+    __slots__ = ('_pattern', '_row')
+
+    def __init__(self, pattern, row):
+        self._pattern, self._row = pattern, row
+
+    def __len__(self):
+        return int(self._pattern.lengths[self._row])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError(index)
+        return Step._view(self._pattern, self._row, index)
 
-
-@dataclass
 class Track:
-    pad_id: int
-    steps: list[Step]
-    mute: bool = False
-    solo: bool = False
-    probability: float = 1.0
+    """One pad's row of a `Pattern`. Attributes read and write the packed arrays.
+
+    `Track(...)` on its own holds its values in a pattern of its own; assign
+    tracks to `Pattern.tracks` (or pass them to `Pattern`) to pack them.
+    """
+    __slots__ = ('_pattern', '_row')
+
+    def __init__(self, pad_id: int, steps, mute: bool = False, solo: bool = False, probability: float = 1.0):
+        self._pattern = Pattern.packed([(pad_id, [step.astuple() for step in steps], mute, solo, probability)])
+        self._row = 0
+
+    @classmethod
+    def _view(cls, pattern, row):
+        track = cls.__new__(cls)
+        track._pattern, track._row = pattern, row
+        return track
+
+    pad_id = property(lambda self: int(self._pattern.pad_ids[self._row]))
+    mute = _track_field('mute', bool)
+    solo = _track_field('solo', bool)
+    probability = _track_field('probability', float)
+
+    @property
+    def steps(self) -> StepList:
+        return StepList(self._pattern, self._row)
+
+    @steps.setter
+    def steps(self, steps):
+        values = [step.astuple() for step in steps] # copy first, `steps` may view this track
+        self.resize(len(values))
+        if values:
+            self.step_array[:] = values
+            self._pattern.version += 1
+
+    @property
+    def step_array(self) -> np.ndarray:
+        """The track's steps as a live STEP_DTYPE array; stale once the track is resized.
+        Writing through it doesn't bump the pattern's `version`; callers do."""
+        return self._pattern.steps[self._row, :self._pattern.lengths[self._row]]
+
+    def resize(self, length: int):
+        """Truncate, or extend with empty steps."""
+        self._pattern.resize_track(self._row, length)
+
+    def to_dict(self):
+        return {
+            'pad_id': self.pad_id,
+            'steps': [dict(zip(STEP_DTYPE.names, values)) for values in self.step_array.tolist()],
+            'mute': self.mute,
+            'solo': self.solo,
+            'probability': self.probability,
+        }
+
+    def __repr__(self):
+        return (f"Track(pad_id={self.pad_id}, steps={len(self.steps)}, mute={self.mute}, "
+                f"solo={self.solo}, probability={self.probability})")
 
-@dataclass
 class Pattern:
-    tracks: list[Track]
-    bpm: float
-    beats_per_bar: int
+    """Tracks packed into NumPy arrays, one row per track.
+
+    `steps` is a (tracks, capacity) STEP_DTYPE array; a track's steps are the
+    first `lengths[row]` columns of its row. Per-track settings are arrays
+    alongside it, and `index` maps pad_id -> row. The sequencer reads a whole
+    step column with one fancy-index per tick; `Track` and `Step` are views for
+    editing, so edits need no rebuild.
+    """
+
+    def __init__(self, tracks, bpm: float, beats_per_bar: int):
+        self.bpm = bpm
+        self.beats_per_bar = beats_per_bar
+        self.layout = 0 # bumped whenever rows are rebuilt, so cached row lookups can tell
+        self.version = 0 # bumped by every change to the data, so the session writer copies only changed patterns
+        self.tracks = tracks
+
+    @classmethod
+    def packed(cls, rows, bpm: float = 0.0, beats_per_bar: int = 0):
+        """Pattern from `(pad_id, step tuples, mute, solo, probability)` rows."""
+        pattern = cls([], bpm, beats_per_bar)
+        pattern._pack(rows)
+        return pattern
+
+    @property
+    def tracks(self) -> list[Track]:
+        return [Track._view(self, row) for row in range(len(self.pad_ids))]
+
+    @tracks.setter
+    def tracks(self, tracks):
+        self._pack([(t.pad_id, t.step_array.tolist(), t.mute, t.solo, t.probability) for t in tracks])
+
+    def _pack(self, rows):
+        width = max((len(steps) for _, steps, _, _, _ in rows), default=0)
+        self.steps = np.zeros((len(rows), width), dtype=STEP_DTYPE)
+        self.lengths = np.array([len(steps) for _, steps, _, _, _ in rows], dtype=np.int64)
+        self.pad_ids = np.array([pad_id for pad_id, _, _, _, _ in rows], dtype=np.int64)
+        self.mute = np.array([mute for _, _, mute, _, _ in rows], dtype=bool)
+        self.solo = np.array([solo for _, _, _, solo, _ in rows], dtype=bool)
+        self.probability = np.array([p for _, _, _, _, p in rows], dtype=np.float64)
+        for row, (_, steps, _, _, _) in enumerate(rows):
+            if steps:
+                self.steps[row, :len(steps)] = steps
+        self._index_rows()
+
+    def _index_rows(self):
+        self.index = {}
+        for row, pad_id in enumerate(self.pad_ids.tolist()):
+            self.index.setdefault(pad_id, row) # the first track for a pad wins
+        self.layout += 1
+        self.version += 1
+
+    def track(self, pad_id: int):
+        """The pad's track, or None if the pattern has none."""
+        row = self.index.get(pad_id)
+        return None if row is None else Track._view(self, row)
+
+    def resize_track(self, row: int, length: int):
+        if length > self.steps.shape[1]:
+            grown = np.zeros((len(self.steps), max(length, 2 * self.steps.shape[1])), dtype=STEP_DTYPE)
+            grown[:, :self.steps.shape[1]] = self.steps
+            self.steps = grown
+        # Steps past the end go back to empty, so growing again starts clean
+        self.steps[row, length:] = 0
+        self.lengths[row] = length
+        self.version += 1
+
+    def blank(self):
+        """An empty pattern with the same pads and tempo, each track one bar long."""
+        pattern = Pattern([], self.bpm, self.beats_per_bar)
+        pattern.steps = np.zeros((len(self.pad_ids), self.beats_per_bar), dtype=STEP_DTYPE)
+        pattern.lengths = np.full(len(self.pad_ids), self.beats_per_bar, dtype=np.int64)
+        pattern.pad_ids = self.pad_ids.copy()
+        pattern.mute = np.zeros(len(self.pad_ids), dtype=bool)
+        pattern.solo = np.zeros(len(self.pad_ids), dtype=bool)
+        pattern.probability = np.ones(len(self.pad_ids))
+        pattern._index_rows()
+        return pattern
+
+    def copy(self):
+        pattern = Pattern([], self.bpm, self.beats_per_bar)
+        for name in ('steps', 'lengths', 'pad_ids', 'mute', 'solo', 'probability'):
+            setattr(pattern, name, getattr(self, name).copy())
+        pattern.index = dict(self.index)
+        return pattern
+
+    def to_dict(self):
+        return {
+            'tracks': [track.to_dict() for track in self.tracks],
+            'bpm': self.bpm,
+            'beats_per_bar': self.beats_per_bar,
+        }
+
+    def to_arrays(self):
+        """Copies of the packed arrays, steps cut to the longest track (see session.py)."""
+        return {
+            'steps': self.steps[:, :int(self.lengths.max(initial=0))].copy(),
+            'lengths': self.lengths.copy(),
+            'pad_ids': self.pad_ids.copy(),
+            'mute': self.mute.copy(),
+            'solo': self.solo.copy(),
+            'probability': self.probability.copy(),
+            'tempo': np.array([self.bpm, self.beats_per_bar], dtype=np.float64),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        bpm, beats_per_bar = arrays['tempo'].tolist()
+        pattern = cls([], bpm, int(beats_per_bar))
+        steps = arrays['steps']
+        pattern.steps = np.zeros(steps.shape, dtype=STEP_DTYPE)
+        # Fields are matched by name, so files with fewer or extra fields still load
+        for name in STEP_DTYPE.names:
+            if name in steps.dtype.names:
+                pattern.steps[name] = steps[name]
+        pattern.lengths = arrays['lengths'].astype(np.int64)
+        pattern.pad_ids = arrays['pad_ids'].astype(np.int64)
+        pattern.mute = arrays['mute'].astype(bool)
+        pattern.solo = arrays['solo'].astype(bool)
+        pattern.probability = arrays['probability'].astype(np.float64)
+        pattern._index_rows()
+        return pattern
+
+    @classmethod
+    def from_dict(cls, p_data):
+        rows = []
+        for t_data in p_data['tracks']:
+            steps = [tuple(s.get(name, 0) for name in STEP_DTYPE.names) for s in t_data['steps']]
+            rows.append((t_data['pad_id'], steps, t_data.get('mute', False),
+                         t_data.get('solo', False), t_data.get('probability', 1.0)))
+        return cls.packed(rows, p_data['bpm'], p_data['beats_per_bar'])
+
+def _undoable(method):
+    """Record what an edit method changes in the pad's active track as one undo entry."""
+    @functools.wraps(method)
+    def wrapper(self, pad_id, *args, **kwargs):
+        pattern = self._pattern_for_pad(pad_id)
+        row = pattern.index.get(pad_id)
+        if row is None:
+            return method(self, pad_id, *args, **kwargs)
+        length = int(pattern.lengths[row])
+        before = pattern.steps[row, :length].copy()
+        try:
+            return method(self, pad_id, *args, **kwargs)
+        finally:
+            edit = TrackEdit.diff(pattern, row, length, before)
+            if edit is not None:
+                self.history.push(edit)
+                pattern.version += 1 # edits may write through step_array
+    return wrapper
+
+def pattern_name(index: int) -> str:
+    """Bank name of pattern `index`: A to Z, then AA, AB and so on."""
+    name = ''
+    index += 1
+    while index:
+        index, letter = divmod(index - 1, 26)
+        name = chr(ord('A') + letter) + name
+    return name
+
+def pattern_index(name: str):
+    """Inverse of `pattern_name`, or None for names outside the bank's order."""
+    if not name.isascii() or not name.isalpha() or not name.isupper() or name == 'FILL':
+        return None
+    index = 0
+    for letter in name:
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+class PatternBank(dict):
+    """Patterns by name ('A', 'B', 'FILL', or any other string).
+
+    Looking up a name that has no pattern yet gives it a blank one shaped like
+    'A', so a session can address hundreds of patterns while only those played
+    or edited take memory. `in`, `get` and iteration see only those.
+    """
+
+    def __init__(self, patterns: dict):
+        super().__init__(patterns)
+        self.version = 0 # bumped when a name gets a different pattern
+
+    def __missing__(self, name):
+        pattern = self['A'].blank()
+        self[name] = pattern
+        return pattern
+
+    def __setitem__(self, name, pattern):
+        super().__setitem__(name, pattern)
+        self.version += 1
+
+    def replace(self, patterns: dict):
+        """Hold just `patterns`, keeping 'A' if they lack it."""
+        pattern_a = patterns.get('A', self['A'])
+        self.clear()
+        self['A'] = pattern_a
+        for name, pattern in patterns.items():
+            self[name] = pattern
 
 def make_empty_pattern(config) -> Pattern:
-    tracks = []
-    for pad in config.pads:
-        steps = [Step() for _ in range(config.beats_per_bar)]
-        tracks.append(Track(pad_id=pad.id, steps=steps))
-    return Pattern(tracks=tracks, bpm=config.bpm, beats_per_bar=config.beats_per_bar)
+    rows = [(pad.id, [(0, 0.0, 0.0, 0.0, 0.0)] * config.beats_per_bar, False, False, 1.0) for pad in config.pads]
+    return Pattern.packed(rows, config.bpm, config.beats_per_bar)
 
 class Sequencer:
     def __init__(self, pattern_a: Pattern, pattern_b: Pattern, pattern_fill: Pattern, audio: AudioEngine):
-        self.patterns = {'A': pattern_a, 'B': pattern_b, 'FILL': pattern_fill}
+        self.patterns = PatternBank({'A': pattern_a, 'B': pattern_b, 'FILL': pattern_fill})
         self.current_pattern_key = 'A'
         self.next_pattern_key = 'A'
         self.pattern = pattern_a
@@ -58,8 +371,21 @@ class Sequencer:
         self.swing = 0.0  # 0.0 to 0.5
         self.quantise_strength = 0.0 # 0.0 = raw, 1.0 = grid
         self.last_tick_time = time.monotonic()
-        self.undo_stack = []
+        self.rng = random.Random()
+        
+        # Sample clock scheduling. Steps are queued `lookahead_seconds` ahead of
+        # the audio engine's clock with exact frame timestamps.
+        self.lookahead_seconds = 0.1
+        self.frame_pos = 0 # only used by `advance` (offline render)
+        self.next_step_frame = 0.0
+        self.clock_resync = True
+        self.step_history = deque(maxlen=64) # (step number, frame) of queued steps
+        self.history = UndoHistory(levels=500)
         self.suppressed_steps = set() # (pad_id, step_idx) to skip playing once
+        self._routing_version = 0 # bumped when track_pattern_keys change
+        self._active_key = None
+        self._active = None
+        self._active_layouts = ()
         
         # Scenes
         self.scenes = {} # index (int) -> dict {pad_id: pattern_key}
@@ -68,23 +394,51 @@ class Sequencer:
         
         # Fill
         self.fill_auto_revert = False
+        self.fill_queued_bars = 0 # length of a fill waiting for its bar, see trigger_fill
+        self.fill_end_bar = 0 # bar at which an auto-reverting fill stops
+
+        # Queued scenes and pattern switches launch on boundaries of this many bars
+        self.launch_bars = 1
+
+        # Song mode plays the chain's (pattern_key, bars) entries in turn, looping
+        self.chain = []
+        self.song_mode = False
+        self.song_position = 0
+        self.song_bars_left = 0
 
     def set_bpm(self, bpm: float):
         # Update all patterns to keep BPM synced for now
         for p in self.patterns.values():
             p.bpm = bpm
+            p.version += 1
+        self._sync_tempo()
+
+    def _sync_tempo(self):
+        # Tempo-synced effects follow pattern A, like the step clock
+        set_tempo = getattr(self.audio, 'set_tempo', None)
+        if set_tempo is not None:
+            set_tempo(self.patterns['A'].bpm)
 
     def toggle_play(self):
         self.playing = not self.playing
+        if self.playing:
+            self.clock_resync = True
 
     def toggle_record(self):
         self.recording = not self.recording
     
     def set_fill(self, active: bool):
         self.fill_active = active
+        self.fill_auto_revert = False
+
+    def set_launch_bars(self, bars: int):
+        if bars not in LAUNCH_BARS:
+            raise ValueError(f"Launch quantisation must be one of {LAUNCH_BARS} bars")
+        self.launch_bars = bars
     
     def queue_pattern_switch(self, pattern_key: str, pad_id: int = None):
-        if pattern_key not in self.patterns or pattern_key == 'FILL':
+        # Any name but the fill's; patterns not in the bank yet start blank
+        if not pattern_key or pattern_key == 'FILL':
             return
 
         if pad_id is not None:
@@ -96,6 +450,38 @@ class Sequencer:
             for pid in self.next_track_pattern_keys:
                 self.next_track_pattern_keys[pid] = pattern_key
 
+    def append_to_chain(self, pattern_key: str, bars: int = 1):
+        """Add `pattern_key` for `bars` bars to the end of the song."""
+        if not pattern_key or pattern_key == 'FILL':
+            return
+        self.chain.append((pattern_key, max(1, bars)))
+
+    def clear_chain(self):
+        self.chain = []
+        self.song_mode = False
+
+    def start_song(self, position: int = 0):
+        """Play the chain from entry `position`. It takes over from the next
+        bar, or from this one if the transport is on a downbeat (e.g. after a
+        rewind). Each entry switches all tracks, regardless of `launch_bars`."""
+        if not self.chain:
+            return
+        self.song_mode = True
+        self.song_position = (position - 1) % len(self.chain)
+        self.song_bars_left = 0
+        if self.current_step == 0:
+            self._next_song_entry()
+
+    def stop_song(self):
+        """Leave song mode; the patterns playing carry on."""
+        self.song_mode = False
+
+    def _next_song_entry(self):
+        self.song_position = (self.song_position + 1) % len(self.chain)
+        pattern_key, self.song_bars_left = self.chain[self.song_position]
+        self.queue_pattern_switch(pattern_key)
+        self._apply_pattern_switches()
+
     def _step_duration_seconds(self) -> float:
         # Use BPM from pattern A as master
         base = 60.0 / self.patterns['A'].bpm / self.patterns['A'].beats_per_bar * 4
@@ -108,117 +494,248 @@ class Sequencer:
             return base * (1.0 - self.swing)
 
     def tick(self):
-        """Call this from the main loop, it advances steps at the right time."""
+        """Call this from the main loop, it advances steps at the right time.
+
+        If the audio backend exposes a sample clock, steps are scheduled ahead
+        with exact frame timestamps, so timing doesn't depend on how often
+        this is called. Otherwise falls back to polling `time.monotonic()`.
+        """
         if not self.playing:
             return
 
+        now_frame = self._audio_frame_position()
+        if now_frame is not None:
+            sample_rate = self.audio.sample_rate
+            if self.clock_resync:
+                self.clock_resync = False
+                self.next_step_frame = float(now_frame)
+                self.step_history.clear()
+            self.schedule(now_frame + self.lookahead_seconds * sample_rate, sample_rate)
+            return
+
         now = time.monotonic()
         seconds_per_step = self._step_duration_seconds()
         if now - self.last_tick_time >= seconds_per_step:
             self.last_tick_time = now
             self._play_step()
-            # Use beats_per_bar from pattern A as master
-            beats_per_bar = self.patterns['A'].beats_per_bar
-            self.current_step = (self.current_step + 1) % beats_per_bar
-            self.total_steps += 1
-            
-            if self.current_step == 0:
-                # Bar wrapped, check for pattern switch
-                if self.next_pattern_key != self.current_pattern_key:
-                    self.current_pattern_key = self.next_pattern_key
-                    self.pattern = self.patterns[self.current_pattern_key]
-                
-                # Update per-track patterns
-                for pid, key in self.next_track_pattern_keys.items():
-                    self.track_pattern_keys[pid] = key
-
-    def _play_step(self):
-        # We need to iterate over all available pad_ids.
-        # Assuming all patterns have the same set of pad_ids.
-        # We can use pattern A's tracks as the source of pad_ids.
-        
-        # Determine global solo state (if any track in ANY active pattern is soloed?)
-        # Or just check if any track in the CURRENTLY PLAYING mix is soloed.
+            self._advance_step()
+
+    def schedule(self, horizon_frame: float, sample_rate: int):
+        """Queue every step that starts before `horizon_frame` on the audio sample clock."""
+        while self.next_step_frame < horizon_frame:
+            self.step_history.append((self.total_steps, self.next_step_frame))
+            self._play_step(at_frame=self.next_step_frame, sample_rate=sample_rate)
+            self._advance_step()
+            self.next_step_frame += self._step_duration_seconds() * sample_rate
+
+    def rewind(self):
+        """Move the transport back to the first step of the bar."""
+        self.current_step = 0
+        self.total_steps = 0
+        self.frame_pos = 0
+        self.next_step_frame = 0.0
+        self.step_history.clear()
+        self.suppressed_steps.clear()
+
+    def advance(self, frames: int, sample_rate: int):
+        """Advance the transport by `frames` frames of audio time.
+
+        Used instead of `tick` when the caller owns the clock (offline render).
+        The engine's clock must start at the same frame as ours.
+        """
+        if self.playing:
+            self.schedule(self.frame_pos + frames, sample_rate)
+        self.frame_pos += frames
+
+    def _audio_frame_position(self):
+        get_frame_position = getattr(self.audio, 'get_frame_position', None)
+        if get_frame_position is None:
+            return None
+        return get_frame_position()
+
+    def _playhead(self):
+        """Returns (number of the last step that sounded, fraction of the way to the next)."""
+        now_frame = self._audio_frame_position()
+        if now_frame is None or not self.step_history:
+            elapsed = time.monotonic() - self.last_tick_time
+            return self.total_steps - 1, elapsed / self._step_duration_seconds()
+
+        next_frame = self.next_step_frame
+        for number, frame in reversed(self.step_history):
+            if frame <= now_frame:
+                return number, (now_frame - frame) / max(1.0, next_frame - frame)
+            next_frame = frame
+        # Nothing queued has sounded yet
+        return self.step_history[0][0] - 1, 1.0
+
+    def audible_steps(self) -> int:
+        """Steps that have actually sounded, i.e. the playhead for display.
+
+        `total_steps` runs up to `lookahead_seconds` ahead of what is heard.
+        """
+        return self._playhead()[0] + 1
+
+    def _advance_step(self):
+        # Use beats_per_bar from pattern A as master
+        beats_per_bar = self.patterns['A'].beats_per_bar
+        self.current_step = (self.current_step + 1) % beats_per_bar
+        self.total_steps += 1
         
-        # First, gather the active tracks for this step
-        active_tracks = []
-        for ref_track in self.patterns['A'].tracks:
-            pad_id = ref_track.pad_id
-            
-            if self.fill_active:
-                pattern_key = 'FILL'
-            else:
-                pattern_key = self.track_pattern_keys.get(pad_id, 'A')
-            
-            # Find the track in the target pattern
-            # Optimization: Could cache map of pad_id -> track for each pattern
-            target_pattern = self.patterns[pattern_key]
-            track = next((t for t in target_pattern.tracks if t.pad_id == pad_id), None)
-            
-            if track:
-                active_tracks.append(track)
+        if self.current_step == 0:
+            self._start_bar(self.total_steps // beats_per_bar)
+
+    def _start_bar(self, bar: int):
+        """Apply the fills, song entries, scenes and pattern switches due at the start of `bar`.
+
+        This runs as the bar's first step is queued, i.e. on the sample clock
+        `lookahead_seconds` ahead of playback, so every transition takes effect
+        exactly on that downbeat however late the UI or core thread is.
+        """
+        if self.fill_auto_revert and bar >= self.fill_end_bar:
+            self.fill_active = False
+            self.fill_auto_revert = False
+        # A triggered fill plays the last bars before a launch boundary
+        if self.fill_queued_bars and (bar + self.fill_queued_bars) % self.launch_bars == 0:
+            self.fill_active = True
+            self.fill_auto_revert = True
+            self.fill_end_bar = bar + self.fill_queued_bars
+            self.fill_queued_bars = 0
+
+        if self.song_mode:
+            self.song_bars_left -= 1
+            if not self.chain:
+                self.song_mode = False
+            elif self.song_bars_left <= 0:
+                self._next_song_entry()
+
+        if bar % self.launch_bars:
+            return
 
-        any_solo = any(t.solo for t in active_tracks)
+        if self.next_scene_index is not None:
+            self.next_track_pattern_keys.update(self.scenes[self.next_scene_index])
+            self.current_scene_index = self.next_scene_index
+            self.next_scene_index = None
 
-        for track in active_tracks:
-            if not track.steps:
-                continue
-            
-            if any_solo:
-                if not track.solo:
-                    continue
-            elif track.mute:
-                continue
+        self._apply_pattern_switches()
 
-            if track.probability < 1.0 and random.random() > track.probability:
-                continue
+    def _apply_pattern_switches(self):
+        # Check for pattern switch
+        if self.next_pattern_key != self.current_pattern_key:
+            self.current_pattern_key = self.next_pattern_key
+            self.pattern = self.patterns[self.current_pattern_key]
+        
+        # Update per-track patterns
+        if self.next_track_pattern_keys != self.track_pattern_keys:
+            self.track_pattern_keys.update(self.next_track_pattern_keys)
+            self._routing_version += 1
+
+    def _active_rows(self):
+        """Where each pad's active track lives, as `[(pattern, positions, rows)]`
+        with one entry per pattern in use and `positions` in pattern A's pad order.
+
+        Cached until the fill, the per-track patterns, the bank or the rows of a
+        pattern in use change.
+        """
+        key = (self.fill_active, self._routing_version, self.patterns.version)
+        if key != self._active_key or any(p.layout != layout for p, layout in self._active_layouts):
+            groups = {}
+            for position, pad_id in enumerate(self.patterns['A'].pad_ids.tolist()):
+                pattern_key = 'FILL' if self.fill_active else self.track_pattern_keys.get(pad_id, 'A')
+                row = self.patterns[pattern_key].index.get(pad_id)
+                if row is not None:
+                    positions, rows = groups.setdefault(pattern_key, ([], []))
+                    positions.append(position)
+                    rows.append(row)
+            self._active = [(self.patterns[k], np.array(positions, dtype=np.int64), np.array(rows, dtype=np.int64))
+                            for k, (positions, rows) in groups.items()]
+            self._active_layouts = [(p, p.layout) for p in {self.patterns['A'], *(p for p, _, _ in self._active)}]
+            # Patterns first used above joined the bank, so take the key again
+            self._active_key = (self.fill_active, self._routing_version, self.patterns.version)
+        return self._active
+
+    def _play_step(self, at_frame: float = None, sample_rate: int = None):
+        # Gather this step of every pad's active track (from the bank or FILL) in
+        # pattern A's pad order, one fancy-index per pattern in use
+        pad_ids = self.patterns['A'].pad_ids
+        count = len(pad_ids)
+        playable = np.zeros(count, dtype=bool) # has a track with steps
+        mute = np.zeros(count, dtype=bool)
+        solo = np.zeros(count, dtype=bool)
+        probability = np.ones(count)
+        step_idx = np.zeros(count, dtype=np.int64)
+        steps = np.zeros(count, dtype=STEP_DTYPE)
+        for pattern, positions, rows in self._active_rows():
+            lengths = pattern.lengths[rows]
+            idx = self.total_steps % np.maximum(lengths, 1)
+            playable[positions] = lengths > 0
+            mute[positions] = pattern.mute[rows]
+            solo[positions] = pattern.solo[rows]
+            probability[positions] = pattern.probability[rows]
+            step_idx[positions] = idx
+            if pattern.steps.shape[1]: # zero wide when every track is empty; nothing to gather
+                steps[positions] = pattern.steps[rows, idx]
+
+        audible = playable & (solo if solo.any() else ~mute)
+
+        # One draw per audible track with a probability, in pad order
+        chance = np.flatnonzero(audible & (probability < 1.0))
+        if len(chance):
+            draws = np.array([self.rng.random() for _ in range(len(chance))])
+            audible[chance] = draws <= probability[chance]
+
+        if self.suppressed_steps:
+            for position in np.flatnonzero(audible).tolist():
+                key = (int(pad_ids[position]), int(step_idx[position]))
+                if key in self.suppressed_steps:
+                    self.suppressed_steps.remove(key)
+                    audible[position] = False
+
+        hits = np.flatnonzero(audible & (steps['state'] > 0))
+        if not len(hits):
+            return
 
-            step_idx = self.total_steps % len(track.steps)
-            
-            # Check suppression
-            if (track.pad_id, step_idx) in self.suppressed_steps:
-                self.suppressed_steps.remove((track.pad_id, step_idx))
-                continue
-
-            step = track.steps[step_idx]
-            if step.state > 0:
-                velocity = 0.7 if step.state == 1 else 1.0
-                
-                # Calculate micro-timing delay
-                # step.offset is fraction of step duration (-0.5 to 0.5)
-                # We only support positive delay (late notes)
-                step_duration = self._step_duration_seconds()
-                delay_seconds = max(0.0, step.offset * step_duration)
-                
+        # Micro-timing: offset is a fraction of the step duration (-0.5 to 0.5).
+        # We only support positive delay (late notes)
+        step_duration = self._step_duration_seconds()
+        for pad_id, (state, offset, reverb_send, delay_send, pitch) in zip(pad_ids[hits].tolist(), steps[hits].tolist()):
+            velocity = 0.7 if state == 1 else 1.0
+            delay_seconds = max(0.0, offset * step_duration)
+
+            if at_frame is None:
                 self.audio.play_sound(
-                    track.pad_id, 
-                    velocity=velocity, 
-                    reverb_send=step.reverb_send, 
-                    delay_send=step.delay_send,
-                    sample_offset=delay_seconds
+                    pad_id,
+                    velocity=velocity,
+                    reverb_send=reverb_send,
+                    delay_send=delay_send,
+                    sample_offset=delay_seconds,
+                    pitch=pitch
+                )
+            else:
+                self.audio.play_sound_at(
+                    pad_id,
+                    int(round(at_frame + delay_seconds * sample_rate)),
+                    velocity=velocity,
+                    reverb_send=reverb_send,
+                    delay_send=delay_send,
+                    pitch=pitch
                 )
 
+    @_undoable
     def handle_pad_press(self, pad_id: int):
         # live play
         self.audio.play_sound(pad_id)
 
         # record into pattern if in record mode
         if self.recording and self.playing:
-            self.push_undo()
             track = self._track_for_pad(pad_id)
             if not track.steps:
                 return
             
             # Calculate which step we are closest to
-            now = time.monotonic()
-            step_duration = self._step_duration_seconds()
-            time_since_last_tick = now - self.last_tick_time
+            last_step, offset = self._playhead() # offset 0.0 to 1.0 (approx)
             
-            # self.total_steps points to the NEXT step to be played
-            next_step_idx = self.total_steps % len(track.steps)
-            prev_step_idx = (self.total_steps - 1) % len(track.steps)
-            
-            offset = time_since_last_tick / step_duration # 0.0 to 1.0 (approx)
+            next_step_idx = (last_step + 1) % len(track.steps)
+            prev_step_idx = last_step % len(track.steps)
             
             target_step_idx = next_step_idx
             recorded_offset = 0.0
@@ -233,8 +750,12 @@ class Sequencer:
                 recorded_offset = offset - 1.0
                 
                 # If we are recording into the upcoming step, suppress it from playing
-                # so we don't hear a double trigger (flam)
-                self.suppressed_steps.add((pad_id, target_step_idx))
+                # so we don't hear a double trigger (flam). Once the lookahead has
+                # queued it, suppressing would skip the new hit on the next loop
+                # instead. If it was already on, that queued hit still flams with
+                # the live one and can't be taken back.
+                if last_step + 1 >= self.total_steps:
+                    self.suppressed_steps.add((pad_id, target_step_idx))
             
             # Apply quantise strength
             # If strength is 1.0, offset becomes 0.0
@@ -247,8 +768,8 @@ class Sequencer:
 
 
 
+    @_undoable
     def clear_last_bar(self, pad_id: int):
-        self.push_undo()
         track = self._track_for_pad(pad_id)
         if not track.steps:
             return
@@ -283,30 +804,23 @@ class Sequencer:
         # Or use beats_per_bar
         steps_to_clear = self.pattern.beats_per_bar
         
-        current_idx = self.total_steps % track_len
+        current_idx = self.audible_steps() % track_len
         
         # We want to clear the previous 'steps_to_clear' steps ending at current_idx.
-        for i in range(steps_to_clear):
-            idx = (current_idx - 1 - i) % track_len
-            track.steps[idx].state = 0
-            track.steps[idx].offset = 0.0
+        cleared = (current_idx - 1 - np.arange(steps_to_clear)) % track_len
+        values = track.step_array
+        values['state'][cleared] = 0
+        values['offset'][cleared] = 0.0
 
+    @_undoable
     def resize_track(self, pad_id: int, new_length: int):
-        self.push_undo()
         track = self._track_for_pad(pad_id)
-        current_len = len(track.steps)
-        if new_length == current_len:
-            return
-        
-        if new_length > current_len:
-            # Extend with empty steps
-            track.steps.extend([Step() for _ in range(new_length - current_len)])
-        else:
-            # Truncate
-            track.steps = track.steps[:new_length]
+        if new_length != len(track.steps):
+            # Extends with empty steps or truncates
+            track.resize(new_length)
 
+    @_undoable
     def randomize_track(self, pad_id: int):
-        self.push_undo()
         track = self._track_for_pad(pad_id)
         for step in track.steps:
             if random.random() < 0.3:
@@ -314,105 +828,77 @@ class Sequencer:
             else:
                 step.state = 0
 
+    @_undoable
     def rotate_track(self, pad_id: int, shift: int):
-        self.push_undo()
         track = self._track_for_pad(pad_id)
         if not track.steps:
             return
-        shift = shift % len(track.steps)
-        track.steps = track.steps[-shift:] + track.steps[:-shift]
+        values = track.step_array
+        values[:] = np.roll(values, shift)
 
+    @_undoable
     def euclidean_fill(self, pad_id: int, pulses: int):
-        self.push_undo()
         track = self._track_for_pad(pad_id)
         steps_len = len(track.steps)
         pulses = max(0, min(steps_len, pulses))
         
-        for i in range(steps_len):
-            is_hit = ((i * pulses) % steps_len) < pulses
-            track.steps[i].state = 1 if is_hit else 0
+        is_hit = (np.arange(steps_len) * pulses) % max(steps_len, 1) < pulses
+        track.step_array['state'] = np.where(is_hit, 1, 0)
 
-    def _track_for_pad(self, pad_id: int) -> Track:
+    def _pattern_for_pad(self, pad_id: int) -> Pattern:
         # Determine which pattern is active for this pad
         if self.fill_active:
             pattern_key = 'FILL'
         else:
             pattern_key = self.track_pattern_keys.get(pad_id, 'A')
-            
-        pattern = self.patterns[pattern_key]
-        for t in pattern.tracks:
-            if t.pad_id == pad_id:
-                return t
-        raise KeyError(pad_id)
+        return self.patterns[pattern_key]
+
+    def _track_for_pad(self, pad_id: int) -> Track:
+        track = self._pattern_for_pad(pad_id).track(pad_id)
+        if track is None:
+            raise KeyError(pad_id)
+        return track
 
     def get_state(self):
         return {
-            'patterns': {k: asdict(v) for k, v in self.patterns.items()},
+            'patterns': {k: v.to_dict() for k, v in self.patterns.items()},
             'swing': self.swing,
-            'quantise_strength': self.quantise_strength
+            'quantise_strength': self.quantise_strength,
+            'chain': self.chain,
         }
 
     def load_state(self, state):
         self.swing = state.get('swing', 0.0)
         self.quantise_strength = state.get('quantise_strength', 1.0)
+        self.set_chain(state.get('chain', []))
         patterns_data = state.get('patterns', {})
-        for key, p_data in patterns_data.items():
-            if key in self.patterns:
-                tracks = []
-                for t_data in p_data['tracks']:
-                    steps = [Step(**s) for s in t_data['steps']]
-                    tracks.append(Track(
-                        pad_id=t_data['pad_id'],
-                        steps=steps,
-                        mute=t_data.get('mute', False),
-                        solo=t_data.get('solo', False),
-                        probability=t_data.get('probability', 1.0)
-                    ))
-                self.patterns[key] = Pattern(
-                    tracks=tracks,
-                    bpm=p_data['bpm'],
-                    beats_per_bar=p_data['beats_per_bar']
-                )
+        self.set_patterns({key: Pattern.from_dict(p_data) for key, p_data in patterns_data.items()})
+
+    def set_patterns(self, patterns: dict):
+        """Replace the bank with `patterns` by name, e.g. from a loaded session.
+        Names they lack start blank again."""
+        self.patterns.replace(patterns)
         self.pattern = self.patterns[self.current_pattern_key]
+        self.history.clear() # entries point into the patterns just replaced
+        self._sync_tempo()
 
-    def _restore_pattern(self, p_data):
-        tracks = []
-        for t_data in p_data['tracks']:
-            steps = [Step(**s) for s in t_data['steps']]
-            tracks.append(Track(
-                pad_id=t_data['pad_id'],
-                steps=steps,
-                mute=t_data.get('mute', False),
-                solo=t_data.get('solo', False),
-                probability=t_data.get('probability', 1.0)
-            ))
-        return Pattern(
-            tracks=tracks,
-            bpm=p_data['bpm'],
-            beats_per_bar=p_data['beats_per_bar']
-        )
-
-    def push_undo(self):
-        self.undo_stack.append(asdict(self.pattern))
-        if len(self.undo_stack) > 10:
-            self.undo_stack.pop(0)
+    def set_chain(self, chain):
+        """Replace the song, e.g. from a loaded session (JSON gives lists for the pairs)."""
+        self.chain = [(str(pattern_key), max(1, int(bars))) for pattern_key, bars in chain]
+        if not self.chain:
+            self.song_mode = False
 
     def undo(self):
-        if not self.undo_stack:
-            return
-        p_data = self.undo_stack.pop()
-        self.pattern = self._restore_pattern(p_data)
-        self.patterns[self.current_pattern_key] = self.pattern
+        """Revert the last track edit, in whichever pattern it was made."""
+        self.history.undo()
+
+    def redo(self):
+        self.history.redo()
 
     def get_active_tracks(self) -> list[Track]:
-        """Returns the list of tracks currently active (A, B, or FILL) for each pad."""
-        tracks = []
+        """Returns the list of tracks currently active (from the bank, or FILL) for each pad."""
         # Use pattern A as the reference for order of pads
-        for ref_track in self.patterns['A'].tracks:
-            pad_id = ref_track.pad_id
-            track = self._track_for_pad(pad_id)
-            tracks.append(track)
-        return tracks
+        return [self._track_for_pad(pad_id) for pad_id in self.patterns['A'].pad_ids.tolist()]
     
     def get_track(self, pad_id: int) -> Track:
         """Returns the currently active track for the given pad_id."""
@@ -424,11 +910,11 @@ class Sequencer:
         self.current_scene_index = index
         
     def queue_scene_switch(self, index: int):
-        """Queue a scene switch for the next bar."""
+        """Queue a scene switch for the next launch boundary (see `launch_bars`)."""
         if index in self.scenes:
             self.next_scene_index = index
             
-    def trigger_fill(self):
-        """Trigger a 1-bar fill that auto-reverts."""
-        self.fill_active = True
-        self.fill_auto_revert = True
+    def trigger_fill(self, bars: int = 1):
+        """Queue a fill of `bars` bars that auto-reverts. It plays the last bars
+        before the next launch boundary, leading into any queued switch."""
+        self.fill_queued_bars = max(1, bars)
@@ -0,0 +1,312 @@
+"""Binary sessions: a versioned NumPy .npz snapshot plus an autosave journal.
+
+A session is a flat dict of named arrays ("fields"): each banked pattern's packed
+arrays (`patterns/<key>/<name>`, see `Pattern.to_arrays`) and two small JSON
+documents, `sequencer` (swing, quantise, scenes, launch bars, song chain) and `audio` (the engine's
+`get_state`: sample paths, trim state, channel strips).
+
+Saving writes every field to `<path>`. Every edit after that is appended to
+`<path>.journal` as the fields that changed since the last record, with only
+the changed rows for the 2-D step arrays, and a `<name>@removed` marker for
+fields that are gone (patterns dropped from the bank). Loading reads the snapshot and
+replays the journal. A record cut short by a crash fails its CRC, so replay
+stops before it and at most that record is lost. All writing happens on the
+`SessionWriter` thread; the core lock is held only to copy the fields.
+"""
+import io
+import json
+import os
+import struct
+import threading
+import zlib
+import numpy as np
+from sequencer import Pattern
+
+SESSION_VERSION = 1
+JOURNAL_MAGIC = b'GBXJ'
+_JOURNAL_HEADER = struct.Struct('<4sIQ') # magic, version, save id of the snapshot it extends
+_RECORD_HEADER = struct.Struct('<II') # payload length, crc32 of the payload
+
+def session_fields(seq, audio, cache: dict = None) -> dict:
+    """The session as named arrays. Call with the core lock held; arrays are copies.
+
+    `cache` (pattern key -> (pattern, version, arrays)) keeps the copies from
+    the last call: patterns whose `version` hasn't moved since reuse them, so
+    the time under the lock grows with what was edited, not with the bank.
+    """
+    fields = {
+        'sequencer': np.array(json.dumps({
+            'swing': seq.swing,
+            'quantise_strength': seq.quantise_strength,
+            'scenes': seq.scenes,
+            'launch_bars': seq.launch_bars,
+            'chain': seq.chain,
+        })),
+        'audio': np.array(json.dumps(audio.get_state())),
+    }
+    # Only patterns that were played or edited are in the bank (see PatternBank)
+    cache = {} if cache is None else cache
+    for key in list(cache):
+        if key not in seq.patterns:
+            del cache[key]
+    for key, pattern in seq.patterns.items():
+        entry = cache.get(key)
+        if entry is None or entry[0] is not pattern or entry[1] != pattern.version:
+            entry = cache[key] = (pattern, pattern.version, pattern.to_arrays())
+        for name, array in entry[2].items():
+            fields[f"patterns/{key}/{name}"] = array
+    return fields
+
+def prepare_fields(fields: dict, audio) -> dict:
+    """Decode the samples `fields` name, for `restore_fields`. Slow; call without the core lock."""
+    if 'audio' not in fields:
+        return {}
+    return audio.prepare_state(json.loads(str(fields['audio'])))
+
+def restore_fields(fields: dict, seq, audio, prepared: dict = None):
+    """Load `fields` into the sequencer and engine. Call with the core lock held."""
+    if 'audio' in fields:
+        audio.load_state(json.loads(str(fields['audio'])), prepared)
+    if 'sequencer' in fields:
+        state = json.loads(str(fields['sequencer']))
+        seq.swing = state.get('swing', 0.0)
+        seq.quantise_strength = state.get('quantise_strength', 1.0)
+        # JSON object keys are strings
+        seq.scenes = {int(index): {int(pad_id): key for pad_id, key in scene.items()}
+                      for index, scene in state.get('scenes', {}).items()}
+        seq.launch_bars = state.get('launch_bars', 1)
+        seq.set_chain(state.get('chain', []))
+    patterns = {}
+    for field in fields:
+        if field.startswith('patterns/') and field.endswith('/steps'):
+            key = field[len('patterns/'):-len('/steps')]
+            prefix = f"patterns/{key}/"
+            patterns[key] = Pattern.from_arrays({name[len(prefix):]: array for name, array in fields.items()
+                                                 if name.startswith(prefix)})
+    seq.set_patterns(patterns)
+
+def diff_fields(old: dict, new: dict) -> dict:
+    """Journal record that turns `old` into `new`. 2-D fields of unchanged shape
+    are stored as `<name>@rows` and `<name>@data`, just the rows that differ;
+    fields missing from `new` as an empty `<name>@removed`."""
+    delta = {name + '@removed': np.zeros(0, dtype=bool) for name in old if name not in new}
+    for name, array in new.items():
+        prev = old.get(name)
+        if prev is array:
+            continue # reused from the last copy, see session_fields
+        if prev is None or prev.shape != array.shape or prev.dtype != array.dtype:
+            delta[name] = array
+        elif array.ndim == 2:
+            rows = np.flatnonzero((prev != array).any(axis=1))
+            if len(rows):
+                delta[name + '@rows'] = rows
+                delta[name + '@data'] = array[rows]
+        elif not np.array_equal(prev, array):
+            delta[name] = array
+    return delta
+
+def apply_delta(fields: dict, delta: dict):
+    for name, array in delta.items():
+        if name.endswith('@rows'):
+            base = name[:-len('@rows')]
+            fields[base] = fields[base].copy()
+            fields[base][array] = delta[base + '@data']
+        elif name.endswith('@removed'):
+            fields.pop(name[:-len('@removed')], None)
+        elif not name.endswith('@data'):
+            fields[name] = array
+
+def _encode(arrays: dict) -> bytes:
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+def _decode(payload: bytes) -> dict:
+    with np.load(io.BytesIO(payload), allow_pickle=False) as data:
+        return {name: data[name] for name in data.files}
+
+def journal_path(path: str) -> str:
+    return path + '.journal'
+
+def write_snapshot(path: str, fields: dict, save_id: int):
+    """Write the whole session to `path`, replacing it atomically."""
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(_encode({'version': np.array(SESSION_VERSION), 'save_id': np.array(save_id, dtype=np.uint64), **fields}))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def read_snapshot(path: str):
+    """Returns `(fields, save_id)`."""
+    with open(path, 'rb') as f:
+        fields = _decode(f.read())
+    version = int(fields.pop('version'))
+    if version > SESSION_VERSION:
+        raise ValueError(f"{path} is session version {version}, newer than this build ({SESSION_VERSION})")
+    return fields, int(fields.pop('save_id'))
+
+def read_journal(path: str, save_id: int):
+    """Returns `(deltas, end)`: the records of a journal that extends snapshot
+    `save_id`, and the file offset after the last whole one. A journal for
+    another snapshot gives no records."""
+    deltas = []
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return deltas, 0
+    if len(data) < _JOURNAL_HEADER.size:
+        return deltas, 0
+    magic, version, journal_save_id = _JOURNAL_HEADER.unpack_from(data)
+    if magic != JOURNAL_MAGIC or version > SESSION_VERSION or journal_save_id != save_id:
+        return deltas, 0
+    end = _JOURNAL_HEADER.size
+    while end + _RECORD_HEADER.size <= len(data):
+        length, crc = _RECORD_HEADER.unpack_from(data, end)
+        start = end + _RECORD_HEADER.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break # torn by a crash mid-write
+        deltas.append(_decode(payload))
+        end = start + length
+    return deltas, end
+
+def load(path: str, recover: bool = True):
+    """Returns `(fields, save_id, journal_end)` for the session at `path`: the
+    snapshot, plus the journal replayed on top with `recover`. A session that
+    was never saved has save id 0 and may exist as a journal alone."""
+    if os.path.exists(path):
+        fields, save_id = read_snapshot(path)
+    else:
+        fields, save_id = {}, 0
+    journal_end = 0
+    if recover:
+        deltas, journal_end = read_journal(journal_path(path), save_id)
+        for delta in deltas:
+            apply_delta(fields, delta)
+    return fields, save_id, journal_end
+
+class SessionWriter:
+    """Writes a core's session on its own thread: journal records after edits
+    (`notify`), and full snapshots (`save`), so disk I/O never blocks the core
+    or the UI. Consecutive edits are coalesced into one record."""
+
+    def __init__(self, core):
+        self.core = core
+        self.path = None
+        self._cond = threading.Condition()
+        self._commands = []
+        self._dirty = False
+        self._journal = None
+        self._save_id = 0
+        self._fields = {} # what snapshot + journal on disk add up to
+        self._patterns = {} # session_fields cache: patterns copied into _fields
+        self._thread = threading.Thread(target=self._run, name="groovebox-session", daemon=True)
+        self._thread.start()
+
+    def open(self, path: str, fields: dict, save_id: int, journal_end: int):
+        """Journal onto the session at `path`, whose snapshot plus the first
+        `journal_end` bytes of journal hold `fields` (0 starts a new journal)."""
+        self._send(('open', path, fields, save_id, journal_end))
+
+    def save(self):
+        self._send(('save',))
+
+    def notify(self):
+        with self._cond:
+            self._dirty = True
+            self._cond.notify()
+
+    def close(self):
+        """Write what is pending and stop the thread."""
+        self._send(('close',))
+        self._thread.join()
+
+    def _send(self, command):
+        with self._cond:
+            self._commands.append(command)
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._commands and not self._dirty:
+                    self._cond.wait()
+                commands, self._commands = self._commands, []
+                dirty, self._dirty = self._dirty, False
+            closing = False
+            for command in commands:
+                try:
+                    if command[0] == 'open':
+                        self._open(*command[1:])
+                    elif command[0] == 'save':
+                        self._save()
+                    elif command[0] == 'close':
+                        closing = True
+                except OSError as e:
+                    print(f"Warning: Could not write session {self.path}: {e}")
+            try:
+                if (dirty or closing) and self._journal is not None:
+                    self._append()
+            except OSError as e:
+                print(f"Warning: Could not write session journal for {self.path}: {e}")
+            if closing:
+                if self._journal is not None:
+                    self._journal.close()
+                return
+
+    def _snapshot(self):
+        # Copies only patterns edited since the last snapshot; diffing happens after, without the lock
+        with self.core.lock:
+            return session_fields(self.core.seq, self.core.audio, self._patterns)
+
+    def _open(self, path, fields, save_id, journal_end):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        self.path = path
+        self._fields = fields
+        self._patterns.clear()
+        self._save_id = save_id
+        if journal_end:
+            # Carry on after the last whole record
+            self._journal = open(journal_path(path), 'r+b')
+            self._journal.truncate(journal_end)
+            self._journal.seek(journal_end)
+        else:
+            self._journal = self._new_journal(path, save_id)
+
+    def _new_journal(self, path, save_id):
+        tmp = journal_path(path) + '.tmp'
+        journal = open(tmp, 'w+b')
+        journal.write(_JOURNAL_HEADER.pack(JOURNAL_MAGIC, SESSION_VERSION, save_id))
+        journal.flush()
+        os.fsync(journal.fileno())
+        os.replace(tmp, journal_path(path))
+        return journal
+
+    def _save(self):
+        self._patterns.clear() # a full snapshot copies everything afresh
+        fields = self._snapshot()
+        save_id = int.from_bytes(os.urandom(8), 'little') or 1
+        write_snapshot(self.path, fields, save_id)
+        # A crash before the new journal is in place leaves the old one, which
+        # names the previous snapshot and so is ignored
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = self._new_journal(self.path, save_id)
+        self._fields = fields
+        self._save_id = save_id
+        print(f"Saved session to {self.path}")
+
+    def _append(self):
+        fields = self._snapshot()
+        delta = diff_fields(self._fields, fields)
+        if not delta:
+            return
+        payload = _encode(delta)
+        self._journal.write(_RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._fields = fields
@@ -1,23 +1,28 @@
-from sequencer import Sequencer, Track, make_empty_pattern
+from sequencer import Track, LAUNCH_BARS, BANK_SIZE, pattern_name, pattern_index
 from input_devices import InputDevice, PadEvent
-from audio import AudioEngine
+from core import GrooveboxCore
 from config import GrooveboxConfig
+from sample_library import get_library
 import pygame
 import numpy as np
 import json
 import os
 
 class GrooveboxUI:
-    def __init__(self, config: GrooveboxConfig):
+    """Client of a GrooveboxCore: edits go through `core.edit()` and drawing
+    reads `core.snapshot()`, so a slow frame never holds up the sequencer."""
+
+    def __init__(self, config: GrooveboxConfig, core: GrooveboxCore = None):
         pygame.init()
         pygame.display.set_caption("GrooveBox Engine")
         self.screen = pygame.display.set_mode((1280, 800))
         self.config = config
-        self.audio = AudioEngine(config)
-        self.pattern_a = make_empty_pattern(config)
-        self.pattern_b = make_empty_pattern(config)
-        self.pattern_fill = make_empty_pattern(config)
-        self.seq = Sequencer(self.pattern_a, self.pattern_b, self.pattern_fill, self.audio)
+        self.core = core if core is not None else GrooveboxCore(config)
+        # For the input handlers, which run inside core.edit()
+        self.audio = self.core.audio
+        self.seq = self.core.seq
+        # Index samples/ for browsing; only files changed since the last run are re-read
+        get_library().scan_in_background()
         
         # Fonts
         self.font_large = pygame.font.SysFont("Arial", 24, bold=True)
@@ -28,6 +33,17 @@ class GrooveboxUI:
         self.selected_pad_id = None
         self.selected_step_idx = None
         self.show_help = False
+        self._revert_requested = False # Ctrl+O, handled outside the core lock, see run
+        self._fill_held = False # F is down; Shift+F fills auto-revert instead
+        self._waveform_key = None # what _waveform_surface shows
+        self._waveform_surface = None
+
+        # Retained rendering, see draw()
+        self._views = {} # region name -> (rect, view) last drawn
+        self._view_names = []
+        self._full_redraw = True
+        self._text_cache = {}
+        self._tile_cache = {}
         
         # Colors
         self.colors = {
@@ -51,234 +67,348 @@ class GrooveboxUI:
     def run(self):
         clock = pygame.time.Clock()
         running = True
+        self.core.start()
 
-        while running:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-                elif event.type == pygame.KEYDOWN:
-                    self.handle_keydown(event.key)
-                elif event.type == pygame.KEYUP:
-                    self.handle_keyup(event.key)
-                elif event.type == pygame.MOUSEBUTTONDOWN:
-                    self.handle_mouse_click(event.pos, event.button)
-            self.seq.tick()
-            self.draw()
-            clock.tick(60)
-        pygame.quit()
+        try:
+            while running:
+                events = pygame.event.get()
+                if events:
+                    # Handlers return whether they changed core state; mouse
+                    # moves and the like must not cost a snapshot rebuild or a
+                    # journal record
+                    changed = False
+                    with self.core.edit(changed=False):
+                        for event in events:
+                            if event.type == pygame.QUIT:
+                                running = False
+                            elif event.type == pygame.KEYDOWN:
+                                changed |= self.handle_keydown(event.key)
+                            elif event.type == pygame.KEYUP:
+                                changed |= self.handle_keyup(event.key)
+                            elif event.type == pygame.MOUSEBUTTONDOWN:
+                                changed |= self.handle_mouse_click(event.pos, event.button)
+                            elif event.type in (pygame.WINDOWEXPOSED, pygame.VIDEOEXPOSE):
+                                self.invalidate()
+                    if changed:
+                        self.core.mark_changed()
+                    if self._revert_requested:
+                        # Reads the session and its samples, so not under the core lock
+                        self._revert_requested = False
+                        self.core.open_session(self.core.session_path, recover=False)
+                self.draw()
+                clock.tick(60)
+        finally:
+            self.core.stop()
+            self.core.close_session()
+            pygame.quit()
 
     def draw(self):
-        self.screen.fill(self.colors['bg'])
-        
+        """Redraw the regions whose content changed since the last frame.
+
+        Each region is described by a view: a tuple of everything it shows.
+        A region is repainted only when its view differs from the one on
+        screen, and only the repainted rects are pushed to the display.
+        """
         w, h = self.screen.get_size()
         header_h = 60
         bottom_h = 180
         left_w = 400
-        
-        # Header
-        self._draw_header(0, 0, w, header_h)
-        
-        # Pads
-        self._draw_pads(20, header_h + 20, left_w - 40, h - header_h - bottom_h - 40)
-        
-        # Sequencer
-        self._draw_sequencer(left_w, header_h + 20, w - left_w - 20, h - header_h - bottom_h - 40)
-        
-        # Bottom Panel (Waveform or Step Edit)
-        self._draw_bottom_panel(20, h - bottom_h, w - 40, bottom_h - 20)
-        
+        snap = self.core.snapshot()
+
+        regions = [('header', pygame.Rect(0, 0, w, header_h + 1), self._header_view(snap), self._draw_header)]
+        metrics = self.audio.get_metrics()
+        if metrics:
+            meter_view = (int(metrics['dsp_load']), metrics['active_voices'], metrics['underruns'])
+            regions.append(('meter', pygame.Rect(550, 14, 200, 36), meter_view, self._draw_cpu_meter))
+        for rect, view in self._pad_views(snap, pygame.Rect(20, header_h + 20, left_w - 40, h - header_h - bottom_h - 40)):
+            regions.append((('pad', view[0]), rect, view, self._draw_pad))
+        for rect, view in self._row_views(snap, pygame.Rect(left_w, header_h + 20, w - left_w - 20, h - header_h - bottom_h - 40)):
+            regions.append((('row', rect.y), rect, view, self._draw_track_row))
+        regions.append(('bottom', pygame.Rect(20, h - bottom_h, w - 40, bottom_h - 20),
+                        self._bottom_view(snap, w - 40, bottom_h - 20), self._draw_bottom_panel))
         if self.show_help:
-            self._draw_help()
-            
-        pygame.display.flip()
+            regions.append(('help', self.screen.get_rect(), ('help',), lambda rect, view: self._draw_help()))
 
-    def _draw_header(self, x, y, w, h):
+        dirty = [i for i, (name, rect, view, _) in enumerate(regions) if self._views.get(name) != (rect, view)]
+        if self._full_redraw or (self.show_help and dirty) or self._view_names != [r[0] for r in regions]:
+            # The help overlay is translucent, so it is always composed over a fresh frame
+            dirty = list(range(len(regions)))
+            self.screen.fill(self.colors['bg'])
+        else:
+            # Repainting a region wipes anything drawn over it, so later regions it overlaps go too
+            for i in range(len(regions)):
+                if i not in dirty and any(regions[j][1].colliderect(regions[i][1]) for j in dirty if j < i):
+                    dirty.append(i)
+            dirty.sort()
+
+        if not dirty:
+            return
+        for i in dirty:
+            name, rect, view, draw = regions[i]
+            if name != 'help': # the overlay is drawn over the frame beneath it
+                self.screen.fill(self.colors['bg'], rect)
+            draw(rect, view)
+            self._views[name] = (rect, view)
+        self._view_names = [r[0] for r in regions]
+
+        if self._full_redraw or len(dirty) == len(regions):
+            pygame.display.flip()
+        else:
+            pygame.display.update([regions[i][1] for i in dirty])
+        self._full_redraw = False
+
+    def invalidate(self):
+        """Repaint everything on the next draw, e.g. after the window was uncovered."""
+        self._full_redraw = True
+
+    def _text(self, font, text, color):
+        # Rendering text is the most expensive thing the UI does; most labels never change
+        key = (id(font), text, color)
+        surf = self._text_cache.get(key)
+        if surf is None:
+            if len(self._text_cache) > 1024:
+                self._text_cache.clear()
+            surf = self._text_cache[key] = font.render(text, True, color)
+        return surf
+
+    def _tile(self, size, color, radius, border=None, border_width=2):
+        """A rounded rect, optionally outlined, rendered once per size and colours."""
+        key = (size, color, radius, border, border_width)
+        tile = self._tile_cache.get(key)
+        if tile is None:
+            if len(self._tile_cache) > 256:
+                self._tile_cache.clear()
+            tile = pygame.Surface(size, pygame.SRCALPHA)
+            rect = tile.get_rect()
+            pygame.draw.rect(tile, color, rect, border_radius=radius)
+            if border is not None:
+                pygame.draw.rect(tile, border, rect, border_width, border_radius=radius)
+            self._tile_cache[key] = tile
+        return tile
+
+    def _header_view(self, snap):
+        q_val = "RAW" if snap.quantise_strength == 0 else f"{int(snap.quantise_strength*100)}%"
+        status_text = "PLAYING" if snap.playing else "STOPPED"
+        status_color = (100, 255, 100) if snap.playing else (255, 100, 100)
+        if snap.recording:
+            status_text += " [REC]"
+            status_color = (255, 50, 50)
+        if snap.song_position >= 0:
+            status_text += f" [SONG {snap.song_position + 1}/{snap.song_length}]"
+        return (int(snap.bpm), int(snap.swing * 100), q_val, status_text, status_color)
+
+    def _draw_header(self, rect, view):
+        x, y, w, h = rect.x, rect.y, rect.w, rect.h - 1
+        bpm, swing, q_val, status_text, status_color = view
         pygame.draw.rect(self.screen, self.colors['panel'], (x, y, w, h))
         pygame.draw.line(self.screen, self.colors['panel_border'], (x, y+h), (x+w, y+h))
         
         # Title
-        title = self.font_large.render("GROOVEBOX", True, self.colors['accent'])
+        title = self._text(self.font_large, "GROOVEBOX", self.colors['accent'])
         self.screen.blit(title, (x + 20, y + 15))
         
         # Transport Info
         info_x = x + 200
-        
-        # BPM
-        bpm_surf = self.font.render(f"BPM: {int(self.seq.pattern.bpm)}", True, self.colors['text'])
-        self.screen.blit(bpm_surf, (info_x, y + 20))
-        
-        # Swing
-        swing_surf = self.font.render(f"SWING: {int(self.seq.swing * 100)}%", True, self.colors['text'])
-        self.screen.blit(swing_surf, (info_x + 100, y + 20))
-        
-        # Quantize
-        q_val = "RAW" if self.seq.quantise_strength == 0 else f"{int(self.seq.quantise_strength*100)}%"
-        quant_surf = self.font.render(f"QUANT: {q_val}", True, self.colors['text'])
-        self.screen.blit(quant_surf, (info_x + 220, y + 20))
+        self.screen.blit(self._text(self.font, f"BPM: {bpm}", self.colors['text']), (info_x, y + 20))
+        self.screen.blit(self._text(self.font, f"SWING: {swing}%", self.colors['text']), (info_x + 100, y + 20))
+        self.screen.blit(self._text(self.font, f"QUANT: {q_val}", self.colors['text']), (info_x + 220, y + 20))
         
         # Status
-        status_text = "PLAYING" if self.seq.playing else "STOPPED"
-        status_color = (100, 255, 100) if self.seq.playing else (255, 100, 100)
-        if self.seq.recording:
-            status_text += " [REC]"
-            status_color = (255, 50, 50)
-            
-        status_surf = self.font_large.render(status_text, True, status_color)
+        status_surf = self._text(self.font_large, status_text, status_color)
         status_rect = status_surf.get_rect(right=w - 20, centery=y + h//2)
         self.screen.blit(status_surf, status_rect)
         
         # Help Hint
-        hint = self.font_small.render("Press 'H' for Help", True, self.colors['text_dim'])
+        hint = self._text(self.font_small, "Press 'H' for Help", self.colors['text_dim'])
         self.screen.blit(hint, (w - 120, y + 40))
 
-    def _draw_pads(self, x, y, w, h):
+    def _draw_cpu_meter(self, rect, view):
+        # Sits on the header, which it repaints under itself
+        load, voices, underruns = view
+        x, y = rect.x + 10, rect.y
+        pygame.draw.rect(self.screen, self.colors['panel'], rect)
+        label = self._text(self.font_small, "DSP", self.colors['text_dim'])
+        self.screen.blit(label, (x, y + 2))
+        
+        bar_rect = pygame.Rect(x + 30, y + 4, 100, 10)
+        pygame.draw.rect(self.screen, (50, 50, 50), bar_rect, border_radius=3)
+        color = (100, 255, 100) if load < 50 else self.colors['accent'] if load < 80 else self.colors['mute']
+        fill_rect = pygame.Rect(bar_rect.x, bar_rect.y, int(bar_rect.w * min(1.0, load / 100.0)), bar_rect.h)
+        pygame.draw.rect(self.screen, color, fill_rect, border_radius=3)
+        
+        pct = self._text(self.font_small, f"{load}%", self.colors['text'])
+        self.screen.blit(pct, (bar_rect.right + 8, y + 2))
+        
+        details = f"VOICES {voices}"
+        if underruns:
+            details += f"  XRUN {underruns}"
+        detail_color = self.colors['mute'] if underruns else self.colors['text_dim']
+        self.screen.blit(self._text(self.font_small, details, detail_color), (x, y + 20))
+
+    def _pad_views(self, snap, area):
         # 2x4 Grid
         rows = 2
         cols = 4
         gap = 10
         
-        pad_w = (w - (cols-1)*gap) // cols
-        pad_h = (h - (rows-1)*gap) // rows
+        pad_w = (area.w - (cols-1)*gap) // cols
+        pad_h = (area.h - (rows-1)*gap) // rows
+        playhead = snap.audible_steps
         
         for i, pad_cfg in enumerate(self.config.pads):
             r = i // cols
             c = i % cols
+            rect = pygame.Rect(area.x + c * (pad_w + gap), area.y + r * (pad_h + gap), pad_w, pad_h)
             
-            px = x + c * (pad_w + gap)
-            py = y + r * (pad_h + gap)
-            
-            rect = pygame.Rect(px, py, pad_w, pad_h)
-            
-            # Color logic
-            color = self.colors['pad_off']
-            border = self.colors['panel_border']
-            
-            track = self._track_for_pad(pad_cfg.id)
+            track = snap.track(pad_cfg.id)
             
             # Check if playing
-            step_idx = self.seq.total_steps % len(track.steps) if track.steps else 0
-            is_playing = self.seq.playing and track.steps and track.steps[step_idx].state > 0
-            
-            if pad_cfg.id == self.selected_pad_id:
-                color = self.colors['pad_on']
-                border = self.colors['accent']
-            
-            if is_playing:
-                color = self.colors['pad_active']
-                
-            # Draw Pad
-            pygame.draw.rect(self.screen, color, rect, border_radius=6)
-            pygame.draw.rect(self.screen, border, rect, 2, border_radius=6)
-            
-            # Text
-            name = self.font.render(pad_cfg.name, True, self.colors['text'])
-            key = self.font_small.render(f"[{pad_cfg.key.upper()}]", True, self.colors['text_dim'])
-            
-            name_rect = name.get_rect(center=(rect.centerx, rect.centery - 8))
-            key_rect = key.get_rect(center=(rect.centerx, rect.centery + 12))
-            
-            self.screen.blit(name, name_rect)
-            self.screen.blit(key, key_rect)
+            step_idx = playhead % len(track.steps) if track.steps else 0
+            is_playing = bool(snap.playing and track.steps and track.steps[step_idx].state > 0)
             
-            # Mute/Solo indicators
-            if track.mute:
-                m_surf = self.font_small.render("M", True, self.colors['mute'])
-                self.screen.blit(m_surf, (rect.right - 15, rect.top + 5))
-            if track.solo:
-                s_surf = self.font_small.render("S", True, self.colors['solo'])
-                self.screen.blit(s_surf, (rect.right - 25, rect.top + 5))
-
-    def _draw_sequencer(self, x, y, w, h):
-        tracks = self.seq.get_active_tracks()
+            yield rect, (pad_cfg.id, pad_cfg.name, pad_cfg.key, pad_cfg.id == self.selected_pad_id, is_playing,
+                         self.audio.is_loading(pad_cfg.id), track.mute, track.solo)
+
+    def _draw_pad(self, rect, view):
+        _, name, key, selected, is_playing, loading, mute, solo = view
+
+        # Color logic
+        color = self.colors['pad_off']
+        border = self.colors['panel_border']
+        if selected:
+            color = self.colors['pad_on']
+            border = self.colors['accent']
+        if is_playing:
+            color = self.colors['pad_active']
+            
+        # Draw Pad
+        self.screen.blit(self._tile(rect.size, color, 6, border), rect)
+        
+        # Text
+        name = self._text(self.font, name, self.colors['text'])
+        if loading:
+            key = self._text(self.font_small, "loading...", self.colors['accent'])
+        else:
+            key = self._text(self.font_small, f"[{key.upper()}]", self.colors['text_dim'])
+        
+        name_rect = name.get_rect(center=(rect.centerx, rect.centery - 8))
+        key_rect = key.get_rect(center=(rect.centerx, rect.centery + 12))
+        
+        self.screen.blit(name, name_rect)
+        self.screen.blit(key, key_rect)
+        
+        # Mute/Solo indicators
+        if mute:
+            self.screen.blit(self._text(self.font_small, "M", self.colors['mute']), (rect.right - 15, rect.top + 5))
+        if solo:
+            self.screen.blit(self._text(self.font_small, "S", self.colors['solo']), (rect.right - 25, rect.top + 5))
+
+    def _row_views(self, snap, area):
+        tracks = snap.tracks
         num_tracks = len(tracks)
         if num_tracks == 0: return
         
-        row_h = h // num_tracks
-        gap = 2
-        grid_w = w
+        row_h = area.h // num_tracks
+        playhead = snap.audible_steps
         
         for i, track in enumerate(tracks):
-            row_y = y + i * row_h
-            
-            # Draw row background
-            bg_rect = pygame.Rect(x, row_y, grid_w, row_h - gap)
-            pygame.draw.rect(self.screen, self.colors['panel'], bg_rect, border_radius=4)
-            
-            # Highlight if selected
-            if track.pad_id == self.selected_pad_id:
-                pygame.draw.rect(self.screen, self.colors['panel_border'], bg_rect, 1, border_radius=4)
+            rect = pygame.Rect(area.x, area.y + i * row_h, area.w, row_h)
             
             # Pattern Indicator
-            pat_key = self.seq.track_pattern_keys.get(track.pad_id, 'A')
+            pat_key = track.pattern_key
             # Check if a switch is queued
-            next_key = self.seq.next_track_pattern_keys.get(track.pad_id, pat_key)
-            
-            pat_color = self.colors['text_dim']
-            if next_key != pat_key:
-                pat_key = f"{pat_key}>{next_key}"
-                pat_color = self.colors['accent']
-                
-            pat_surf = self.font_small.render(pat_key, True, pat_color)
-            self.screen.blit(pat_surf, (x + 2, row_y + 2))
+            queued = track.next_pattern_key != pat_key
+            if queued:
+                pat_key = f"{pat_key}>{track.next_pattern_key}"
 
-            # Steps
-            steps = track.steps
-            num_steps = len(steps)
-            step_w = (grid_w - 25) / num_steps # Reduce width slightly for label
+            selected = track.pad_id == self.selected_pad_id
+            num_steps = len(track.steps)
+            cursor = playhead % num_steps if snap.playing and num_steps else None
+            yield rect, (selected, pat_key, queued, tuple((s.state, s.offset) for s in track.steps), cursor,
+                         self.selected_step_idx if selected else None)
+
+    def _draw_track_row(self, rect, view):
+        selected, pat_key, queued, steps, cursor, selected_step = view
+        gap = 2
+        x, row_y, grid_w, row_h = rect.x, rect.y, rect.w, rect.h
+        
+        # Draw row background
+        bg_rect = pygame.Rect(x, row_y, grid_w, row_h - gap)
+        pygame.draw.rect(self.screen, self.colors['panel'], bg_rect, border_radius=4)
+        
+        # Highlight if selected
+        if selected:
+            pygame.draw.rect(self.screen, self.colors['panel_border'], bg_rect, 1, border_radius=4)
+        
+        pat_color = self.colors['accent'] if queued else self.colors['text_dim']
+        self.screen.blit(self._text(self.font_small, pat_key, pat_color), (x + 2, row_y + 2))
+
+        # Steps
+        num_steps = len(steps)
+        if num_steps == 0: return
+        step_w = (grid_w - 25) / num_steps # Reduce width slightly for label
+        
+        for s_i, (state, offset) in enumerate(steps):
+            sx = x + 20 + s_i * step_w # Shift right for label
+            sy = row_y + 4
+            sw = step_w - 2
+            sh = row_h - gap - 8
+            
+            s_rect = pygame.Rect(sx, sy, sw, sh)
+            
+            color = self.colors['step_off']
+            if state == 1: color = self.colors['step_on']
+            elif state == 2: color = self.colors['step_accent']
+            
+            # Cursor
+            if cursor == s_i:
+                pygame.draw.rect(self.screen, self.colors['step_cursor'], s_rect.inflate(2,2), 2, border_radius=2)
+                if state > 0:
+                    color = tuple(min(255, c + 50) for c in color)
+            
+            # Selection
+            if s_i == selected_step:
+                pygame.draw.rect(self.screen, self.colors['accent'], s_rect.inflate(4,4), 2, border_radius=2)
+
+            self.screen.blit(self._tile(s_rect.size, color, 2), s_rect)
             
-            for s_i, step in enumerate(steps):
-                sx = x + 20 + s_i * step_w # Shift right for label
-                sy = row_y + 4
-                sw = step_w - 2
-                sh = row_h - gap - 8
-                
-                s_rect = pygame.Rect(sx, sy, sw, sh)
-                
-                color = self.colors['step_off']
-                if step.state == 1: color = self.colors['step_on']
-                elif step.state == 2: color = self.colors['step_accent']
-                
-                # Cursor
-                if self.seq.playing and (self.seq.total_steps % num_steps) == s_i:
-                    pygame.draw.rect(self.screen, self.colors['step_cursor'], s_rect.inflate(2,2), 2, border_radius=2)
-                    if step.state > 0:
-                        color = tuple(min(255, c + 50) for c in color)
-                
-                # Selection
-                if track.pad_id == self.selected_pad_id and s_i == self.selected_step_idx:
-                    pygame.draw.rect(self.screen, self.colors['accent'], s_rect.inflate(4,4), 2, border_radius=2)
+            # Micro-timing indicator
+            if state > 0 and abs(offset) > 0.01:
+                off_x = sx + sw/2 + (offset * sw)
+                pygame.draw.line(self.screen, (255,0,0), (off_x, sy+sh-2), (off_x, sy+sh), 2)
 
-                pygame.draw.rect(self.screen, color, s_rect, border_radius=2)
-                
-                # Micro-timing indicator
-                if step.state > 0 and abs(step.offset) > 0.01:
-                    off_x = sx + sw/2 + (step.offset * sw)
-                    pygame.draw.line(self.screen, (255,0,0), (off_x, sy+sh-2), (off_x, sy+sh), 2)
+    def _bottom_view(self, snap, w, h):
+        if self.selected_pad_id is None:
+            return ('none',)
+        if self.selected_step_idx is not None:
+            track = snap.track(self.selected_pad_id)
+            if self.selected_step_idx >= len(track.steps):
+                return ('empty',)
+            step = track.steps[self.selected_step_idx]
+            return ('step', self.selected_step_idx, step.reverb_send, step.delay_send, step.offset, step.pitch)
+        return ('wave', self._waveform_signature(w, h))
 
-    def _draw_bottom_panel(self, x, y, w, h):
+    def _draw_bottom_panel(self, rect, view):
+        x, y, w, h = rect
         pygame.draw.rect(self.screen, self.colors['panel'], (x, y, w, h), border_radius=8)
         pygame.draw.rect(self.screen, self.colors['panel_border'], (x, y, w, h), 2, border_radius=8)
         
-        if self.selected_pad_id is None:
-            title = self.font.render("SELECT A PAD TO EDIT", True, self.colors['text_dim'])
+        if view[0] == 'none':
+            title = self._text(self.font, "SELECT A PAD TO EDIT", self.colors['text_dim'])
             self.screen.blit(title, (x + 20, y + h//2 - 10))
-            return
-
-        if self.selected_step_idx is not None:
-            self._draw_step_edit(x, y, w, h)
-        else:
-            self._draw_waveform(x, y, w, h)
+        elif view[0] == 'step':
+            self._draw_step_edit(x, y, view)
+        elif view[0] == 'wave':
+            self._draw_waveform(x, y, w, h, view[1])
 
-    def _draw_step_edit(self, x, y, w, h):
-        track = self._track_for_pad(self.selected_pad_id)
-        if self.selected_step_idx >= len(track.steps): return
-        step = track.steps[self.selected_step_idx]
+    def _draw_step_edit(self, x, y, view):
+        _, step_idx, reverb_send, delay_send, offset, pitch = view
         
-        title = self.font.render(f"STEP EDIT: {self.selected_step_idx + 1}", True, self.colors['accent'])
+        title = self._text(self.font, f"STEP EDIT: {step_idx + 1}", self.colors['accent'])
         self.screen.blit(title, (x + 20, y + 15))
         
         def draw_slider(label, value, sx, sy, sw):
-            lbl = self.font_small.render(label, True, self.colors['text'])
+            lbl = self._text(self.font_small, label, self.colors['text'])
             self.screen.blit(lbl, (sx, sy))
             
             bar_rect = pygame.Rect(sx, sy + 20, sw, 6)
@@ -288,61 +418,64 @@ class GrooveboxUI:
             fill_rect = pygame.Rect(sx, sy + 20, fill_w, 6)
             pygame.draw.rect(self.screen, self.colors['accent'], fill_rect, border_radius=3)
             
-            val_txt = self.font_small.render(f"{int(value*100)}%", True, self.colors['text_dim'])
+            val_txt = self._text(self.font_small, f"{int(value*100)}%", self.colors['text_dim'])
             self.screen.blit(val_txt, (sx + sw + 10, sy + 15))
 
-        draw_slider("REVERB SEND", step.reverb_send, x + 20, y + 50, 200)
-        draw_slider("DELAY SEND", step.delay_send, x + 20, y + 100, 200)
+        draw_slider("REVERB SEND", reverb_send, x + 20, y + 50, 200)
+        draw_slider("DELAY SEND", delay_send, x + 20, y + 100, 200)
         
-        off_norm = step.offset + 0.5
+        off_norm = offset + 0.5
         draw_slider("OFFSET", off_norm, x + 300, y + 50, 200)
-
-    def _draw_waveform(self, x, y, w, h):
-        data = self.audio.get_waveform(self.selected_pad_id)
-        if data is None: return
-            
-        # Downsample
-        if len(data.shape) > 1:
-            samples = np.mean(data, axis=1)
-        else:
-            samples = data
-            
-        if len(samples) == 0: return
-            
-        step = max(1, len(samples) // (w - 40))
-        view = samples[::step]
-        
-        max_amp = 32768.0 # Expecting int16 audio data
-        center_y = y + h // 2
-        scale = (h / 2.5) / max_amp
         
-        points = []
-        for i, samp in enumerate(view):
-            if i >= w - 40: break
-            px = x + 20 + i
-            py = center_y - samp * scale
-            points.append((px, py))
-            
-        if len(points) > 1:
-            pygame.draw.lines(self.screen, (100, 200, 100), False, points)
-            
-        # Draw trim markers
+        pitch = self._text(self.font_small, f"PITCH {pitch:+.0f} st  [-/=]", self.colors['text'])
+        self.screen.blit(pitch, (x + 300, y + 100))
+
+    def _waveform_signature(self, w, h):
         state = self.audio.get_pad_state(self.selected_pad_id)
-        if state:
-            start_x = x + 20 + int(state['trim_start'] * (w - 40))
-            end_x = x + 20 + int(state['trim_end'] * (w - 40))
-            
-            pygame.draw.line(self.screen, (255, 255, 0), (start_x, y+10), (start_x, y + h-10), 2)
-            pygame.draw.line(self.screen, (255, 0, 0), (end_x, y+10), (end_x, y + h-10), 2)
-            
-            status_text = []
-            if state['reverse']: status_text.append("REV")
-            if state['normalized']: status_text.append("NORM")
-            
-            if status_text:
-                text = " ".join(status_text)
-                surf = self.font.render(text, True, (255, 100, 100))
-                self.screen.blit(surf, (x + 20, y + 10))
+        if state is None: return None
+        path = getattr(self.audio, 'pad_paths', {}).get(self.selected_pad_id)
+        return (self.selected_pad_id, path, state['trim_start'], state['trim_end'],
+                state['reverse'], state['normalized'], w, h)
+
+    def _draw_waveform(self, x, y, w, h, key):
+        # The strip only changes with the sample or its trim/reverse/normalize,
+        # so it is drawn once to a surface and blitted from then on
+        if key is None: return
+        if self._waveform_key != key:
+            self._waveform_surface = self._render_waveform(self.audio.get_pad_state(self.selected_pad_id), w, h)
+            self._waveform_key = key
+        if self._waveform_surface is not None:
+            self.screen.blit(self._waveform_surface, (x, y))
+
+    def _render_waveform(self, state, w, h):
+        envelope = self.audio.get_waveform_envelope(self.selected_pad_id, w - 40)
+        if envelope is None: return None
+        mins, maxs = envelope
+        surface = pygame.Surface((w, h), pygame.SRCALPHA)
+
+        center_y = h // 2
+        scale = h / 2.5
+        if len(maxs) > 1:
+            xs = 20 + np.arange(len(maxs))
+            top = np.stack([xs, center_y - maxs * scale], axis=1)
+            bottom = np.stack([xs, center_y - mins * scale], axis=1)[::-1]
+            pygame.draw.polygon(surface, (100, 200, 100), np.concatenate([top, bottom]).tolist())
+
+        # Draw trim markers
+        start_x = 20 + int(state['trim_start'] * (w - 40))
+        end_x = 20 + int(state['trim_end'] * (w - 40))
+
+        pygame.draw.line(surface, (255, 255, 0), (start_x, 10), (start_x, h - 10), 2)
+        pygame.draw.line(surface, (255, 0, 0), (end_x, 10), (end_x, h - 10), 2)
+
+        status_text = []
+        if state['reverse']: status_text.append("REV")
+        if state['normalized']: status_text.append("NORM")
+
+        if status_text:
+            text = " ".join(status_text)
+            surface.blit(self._text(self.font, text, (255, 100, 100)), (20, 10))
+        return surface
 
     def _draw_help(self):
         overlay = pygame.Surface(self.screen.get_size(), pygame.SRCALPHA)
@@ -352,7 +485,9 @@ class GrooveboxUI:
         help_text = [
             "CONTROLS",
             "----------------",
-            "SPACE: Play/Pause | R: Record | TAB: Switch Pattern (A/B) | F: Fill (Hold)",
+            "SPACE: Play/Pause | R: Record | TAB: Next Pattern (+Shift: Previous) | F: Fill (Hold)",
+            "Shift+F: Fill into Next Launch | L: Launch Every 1/2/4 Bars",
+            "C: Chain Pattern into Song (+Shift to clear) | G: Song Mode On/Off",
             "UP/DOWN: BPM | LEFT/RIGHT: Swing | Q/W: Quantise",
             "1-6: Trigger Pad / Select Track",
             "",
@@ -373,7 +508,7 @@ class GrooveboxUI:
             "",
             "SESSION",
             "----------------",
-            "Ctrl+S: Save | Ctrl+O: Load | Ctrl+Z: Undo",
+            "Ctrl+S: Save | Ctrl+O: Load | Ctrl+Z: Undo | Ctrl+Y: Redo",
             "H / ?: Toggle Help"
         ]
         
@@ -387,7 +522,7 @@ class GrooveboxUI:
                 color = self.colors['accent']
                 y += 10
             
-            surf = self.font.render(line, True, color)
+            surf = self._text(self.font, line, color)
             rect = surf.get_rect(center=(self.screen.get_width() // 2, y))
             self.screen.blit(surf, rect)
             y += 30
@@ -421,17 +556,19 @@ class GrooveboxUI:
                     if button == 1:
                         self.selected_pad_id = pad_id
                         self.seq.handle_pad_press(pad_id)
+                        return True
                     elif button == 3:
                         track = self._track_for_pad(pad_id)
                         track.mute = not track.mute
-            return
+                        return True
+            return False
 
         # Sequencer
         seq_rect = pygame.Rect(left_w, header_h + 20, w - left_w - 20, h - header_h - bottom_h - 40)
         if seq_rect.collidepoint(mx, my):
             tracks = self.seq.get_active_tracks()
             num_tracks = len(tracks)
-            if num_tracks == 0: return
+            if num_tracks == 0: return False
             
             row_h = seq_rect.h // num_tracks
             rel_y = my - seq_rect.y
@@ -462,7 +599,8 @@ class GrooveboxUI:
                         elif button == 3:
                             step.state = 0
                         self.selected_step_idx = None
-            return
+                        return True
+        return False
 
     def handle_keydown(self, key):
         mods = pygame.key.get_mods()
@@ -472,7 +610,7 @@ class GrooveboxUI:
         if key == pygame.K_ESCAPE:
             self.selected_step_idx = None
             self.show_help = False
-            return
+            return False
 
         if self.selected_step_idx is not None and self.selected_pad_id is not None:
             track = self._track_for_pad(self.selected_pad_id)
@@ -482,13 +620,27 @@ class GrooveboxUI:
                 if key == pygame.K_LEFTBRACKET:
                     if shift: step.delay_send = max(0.0, step.delay_send - 0.1)
                     else: step.reverb_send = max(0.0, step.reverb_send - 0.1)
-                    return
+                    return True
                 elif key == pygame.K_RIGHTBRACKET:
                     if shift: step.delay_send = min(1.0, step.delay_send + 0.1)
                     else: step.reverb_send = min(1.0, step.reverb_send + 0.1)
-                    return
+                    return True
+                elif key == pygame.K_MINUS:
+                    step.pitch = max(-24.0, step.pitch - 1.0)
+                    return True
+                elif key == pygame.K_EQUALS:
+                    step.pitch = min(24.0, step.pitch + 1.0)
+                    return True
 
-        if key == pygame.K_SPACE:
+        if key == pygame.K_s and ctrl:
+            # The writer thread copies the session itself
+            self.core.save_session()
+            return False
+        elif key == pygame.K_o and ctrl:
+            # Revert to the last save, dropping the journaled edits (see run)
+            self._revert_requested = self.core.session_path is not None
+            return False
+        elif key == pygame.K_SPACE:
             self.seq.toggle_play()
         elif key == pygame.K_r:
             self.seq.toggle_record()
@@ -528,16 +680,35 @@ class GrooveboxUI:
             else:
                 self.seq.swing = min(0.5, self.seq.swing + 0.05)
         elif key == pygame.K_TAB:
-            # Toggle pattern for selected pad, or global if none selected
+            # Step through the bank (Shift steps back) for the selected pad, or globally if none selected
             if self.selected_pad_id is not None:
-                current_key = self.seq.track_pattern_keys.get(self.selected_pad_id, 'A')
-                next_pat = 'B' if current_key == 'A' else 'A'
-                self.seq.queue_pattern_switch(next_pat, self.selected_pad_id)
+                current_key = self.seq.next_track_pattern_keys.get(self.selected_pad_id, 'A')
+            else:
+                current_key = self.seq.next_pattern_key
+            index = pattern_index(current_key)
+            index = 0 if index is None else (index + (-1 if shift else 1)) % BANK_SIZE
+            self.seq.queue_pattern_switch(pattern_name(index), self.selected_pad_id)
+        elif key == pygame.K_c:
+            # Chain the queued (or playing) pattern onto the song; Shift clears it
+            if shift:
+                self.seq.clear_chain()
             else:
-                next_pat = 'B' if self.seq.next_pattern_key == 'A' else 'A'
-                self.seq.queue_pattern_switch(next_pat)
+                self.seq.append_to_chain(self.seq.next_pattern_key, self.seq.launch_bars)
+        elif key == pygame.K_g:
+            if self.seq.song_mode:
+                self.seq.stop_song()
+            else:
+                self.seq.start_song()
         elif key == pygame.K_f:
-            self.seq.set_fill(True)
+            if shift:
+                self.seq.trigger_fill()
+            else:
+                self.seq.set_fill(True)
+                self._fill_held = True
+        elif key == pygame.K_l:
+            # Cycle the launch quantisation for queued scenes and pattern switches
+            index = LAUNCH_BARS.index(self.seq.launch_bars) if self.seq.launch_bars in LAUNCH_BARS else -1
+            self.seq.set_launch_bars(LAUNCH_BARS[(index + 1) % len(LAUNCH_BARS)])
         elif key == pygame.K_LEFTBRACKET:
             if self.selected_pad_id is not None:
                 if shift:
@@ -591,18 +762,29 @@ class GrooveboxUI:
             if self.selected_pad_id is not None:
                 self.audio.cycle_sample(self.selected_pad_id, 1)
         elif key == pygame.K_z and ctrl:
-            self.seq.undo()
+            if shift:
+                self.seq.redo()
+            else:
+                self.seq.undo()
+        elif key == pygame.K_y and ctrl:
+            self.seq.redo()
         elif key == pygame.K_h or key == pygame.K_SLASH:
             self.show_help = not self.show_help
+            return False
         else:
             pad_id = self._pad_from_key(key)
-            if pad_id is not None:
-                self.selected_pad_id = pad_id
-                self.seq.handle_pad_press(pad_id)
+            if pad_id is None:
+                return False
+            self.selected_pad_id = pad_id
+            self.seq.handle_pad_press(pad_id)
+        return True
 
     def handle_keyup(self, key):
-        if key == pygame.K_f:
+        if key == pygame.K_f and self._fill_held:
+            self._fill_held = False
             self.seq.set_fill(False)
+            return True
+        return False
 
     def _pad_from_key(self, key):
         char = pygame.key.name(key)
@@ -0,0 +1,77 @@
+from collections import deque
+import numpy as np
+
+class TrackEdit:
+    """The steps one edit changed in one track: their columns, values before
+    and after, and the track length before and after."""
+    __slots__ = ('pattern', 'row', 'length_before', 'length_after', 'cols', 'before', 'after')
+
+    def __init__(self, pattern, row, length_before, length_after, cols, before, after):
+        self.pattern = pattern
+        self.row = row
+        self.length_before = length_before
+        self.length_after = length_after
+        self.cols = cols
+        self.before = before
+        self.after = after
+
+    @classmethod
+    def diff(cls, pattern, row, length_before, before):
+        """The edit that turned `before` (the first `length_before` steps of the
+        row) into the row as it is now, or None if nothing changed."""
+        length_after = int(pattern.lengths[row])
+        width = max(length_before, length_after)
+        old = np.zeros(width, dtype=before.dtype)
+        old[:length_before] = before
+        # Steps past a track's length are always empty, so this covers truncation too
+        new = pattern.steps[row, :width]
+        cols = np.flatnonzero(old != new)
+        if not len(cols) and length_before == length_after:
+            return None
+        return cls(pattern, row, length_before, length_after, cols, old[cols], new[cols].copy())
+
+    def undo(self):
+        self._apply(self.length_before, self.before)
+
+    def redo(self):
+        self._apply(self.length_after, self.after)
+
+    def _apply(self, length, values):
+        # Rows never shrink, so both lengths fit; resizing empties what lies past
+        # `length` and bumps the pattern's version
+        self.pattern.steps[self.row, self.cols] = values
+        self.pattern.resize_track(self.row, length)
+
+class UndoHistory:
+    """Undo and redo stacks of `TrackEdit`s, `levels` deep.
+
+    Entries hold only the changed steps, so deep histories stay small.
+    """
+
+    def __init__(self, levels: int = 500):
+        self.undo_stack = deque(maxlen=levels)
+        self.redo_stack = []
+
+    def push(self, edit: TrackEdit):
+        self.undo_stack.append(edit)
+        self.redo_stack.clear()
+
+    def undo(self) -> bool:
+        if not self.undo_stack:
+            return False
+        edit = self.undo_stack.pop()
+        edit.undo()
+        self.redo_stack.append(edit)
+        return True
+
+    def redo(self) -> bool:
+        if not self.redo_stack:
+            return False
+        edit = self.redo_stack.pop()
+        edit.redo()
+        self.undo_stack.append(edit)
+        return True
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
@@ -0,0 +1,19 @@
+import os
+import sys
+import tempfile
+import pytest
+
+ENGINE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_ROOT = os.path.dirname(os.path.dirname(ENGINE_DIR))
+sys.path.insert(0, os.path.join(ENGINE_DIR, "groovebox"))
+
+# Keep the decoded-sample cache out of the user's home directory
+_cache_dir = tempfile.TemporaryDirectory()
+os.environ["GROOVEBOX_SAMPLE_CACHE"] = _cache_dir.name
+
+@pytest.fixture
+def config(monkeypatch):
+    """The stock pad config, with the repo root as the working directory so its sample paths resolve."""
+    from config import load_groovebox_config
+    monkeypatch.chdir(REPO_ROOT)
+    return load_groovebox_config("config/pad.json")
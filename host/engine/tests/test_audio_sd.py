@@ -0,0 +1,18 @@
+import numpy as np
+from audio_sd import AudioEngineSD
+
+def _render_delay(config, block, blocks):
+    engine = AudioEngineSD(config, start_stream=False)
+    engine.set_delay_params(division=0.01, feedback=0.7) # clamped to the shortest delay, under 1024 frames
+    engine.reset()
+    engine.play_sound_at(0, 0, velocity=1.0, delay_send=1.0)
+    out = np.zeros((block * blocks, 2), dtype=np.float32)
+    for i in range(blocks):
+        engine.render_block(out[i * block:(i + 1) * block], block)
+    return engine, out
+
+def test_delay_shorter_than_long_offline_blocks(config):
+    engine, long_blocks = _render_delay(config, 1024, 8)
+    assert engine.delay_target < 1024
+    _, stream_blocks = _render_delay(config, engine.block_size, 8 * 1024 // engine.block_size)
+    np.testing.assert_allclose(long_blocks, stream_blocks, atol=1e-6)
@@ -0,0 +1,21 @@
+from audio_sd import AudioEngineSD
+from core import GrooveboxCore
+
+def test_snapshot_rebuilds_only_edited_rows(config):
+    core = GrooveboxCore(config, audio=AudioEngineSD(config, start_stream=False))
+    before = core.snapshot()
+    with core.edit() as seq:
+        seq.get_track(1).steps[3].state = 2
+    after = core.snapshot()
+    assert after.track(1).steps[3].state == 2
+    assert after.track(1).steps is not before.track(1).steps
+    for old, new in zip(before.tracks, after.tracks):
+        if new.pad_id != 1:
+            assert new.steps is old.steps
+
+    with core.edit() as seq:
+        seq.get_track(1).resize(4)
+        seq.get_track(2).mute = True
+    resized = core.snapshot()
+    assert len(resized.track(1).steps) == 4
+    assert resized.track(2).mute and resized.track(2).steps is after.track(2).steps
@@ -0,0 +1,27 @@
+import os
+import numpy as np
+import pytest
+import soundfile as sf
+import audio_cpp
+from render import OfflineRenderer
+from sequencer import Sequencer, make_empty_pattern
+
+@pytest.mark.skipif(not audio_cpp.AVAILABLE, reason="the C++ engine extension is not built")
+def test_float_stems_sum_to_unclipped_mix(config, tmp_path):
+    engine = audio_cpp.AudioEngineCpp(config, start_stream=False)
+    seq = Sequencer(make_empty_pattern(config), make_empty_pattern(config), make_empty_pattern(config), engine)
+    for track in seq.patterns['A'].tracks:
+        for i in range(0, len(track.steps), 2):
+            track.steps[i].state = 2 # accented hits on every pad, hot enough to clip
+        track.steps[0].reverb_send = 0.8
+        track.steps[0].delay_send = 0.8
+
+    mix_path = os.path.join(tmp_path, "mix.wav")
+    stems_dir = os.path.join(tmp_path, "stems")
+    OfflineRenderer(seq, engine).render(mix_path, 2.0, tail_seconds=0.5, subtype='FLOAT', stems_dir=stems_dir)
+
+    mix, _ = sf.read(mix_path, dtype='float32')
+    stems = sum(sf.read(os.path.join(stems_dir, name + ".wav"), dtype='float32')[0] for name in engine.stem_names())
+    assert np.abs(stems).max() > 1.0, "the session should drive the mix past full scale"
+    # The master is the tanh soft clip of the unclipped sum
+    np.testing.assert_allclose(np.tanh(stems), mix, atol=1e-5)
@@ -0,0 +1,18 @@
+import os
+import time
+from sample_loader import SampleLoader
+
+def test_prefetch_only_warms_the_neighbours(tmp_path):
+    for name in ("a.wav", "b.wav", "c.wav"):
+        open(os.path.join(tmp_path, name), 'wb').close()
+    prepared, warmed, installed = [], [], []
+    loader = SampleLoader(lambda path: prepared.append(path) or path, lambda *args: installed.append(args),
+                          warm=warmed.append)
+    loader.request(0, os.path.join(tmp_path, "b.wav"))
+    while loader.is_loading(0):
+        time.sleep(0.01)
+        loader.poll()
+    loader.executor.shutdown(wait=True)
+    assert prepared == [os.path.join(tmp_path, "b.wav")]
+    assert sorted(warmed) == [os.path.join(tmp_path, "a.wav"), os.path.join(tmp_path, "c.wav")]
+    assert installed == [(0, prepared[0], prepared[0])]
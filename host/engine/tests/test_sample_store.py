@@ -0,0 +1,26 @@
+import os
+import numpy as np
+import soundfile as sf
+from sample_store import SampleStore, PeakTable, PeakPyramid
+
+def test_peaks_are_cached_beside_the_sample(tmp_path):
+    path = os.path.join(tmp_path, "noise.wav")
+    rng = np.random.default_rng(0)
+    sf.write(path, rng.uniform(-1, 1, (44100, 2)).astype(np.float32), 44100, subtype='FLOAT')
+    cache_dir = os.path.join(tmp_path, "cache")
+
+    SampleStore(cache_dir).peaks(path, 48000)
+    cached = os.listdir(cache_dir)
+    assert sum(name.endswith("@48000.peaks.npy") for name in cached) == 1
+    assert sum(name.endswith("@48000.envelope.npy") for name in cached) == 1
+
+    # A fresh store, as in another process, maps the analysis instead of rebuilding it
+    store = SampleStore(cache_dir)
+    table, pyramid = store.peaks(path, 48000)
+    assert isinstance(table.peaks, np.memmap)
+    data = store.load(path, 48000)
+    fresh_table, fresh_pyramid = PeakTable(data), PeakPyramid(data)
+    assert table.peak(100, 30000) == fresh_table.peak(100, 30000)
+    for width in (50, 400, 3000):
+        np.testing.assert_array_equal(pyramid.envelope(0, len(data), width), fresh_pyramid.envelope(0, len(data), width))
+    assert store.peaks(path, 48000)[1] is pyramid
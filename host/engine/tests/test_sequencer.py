@@ -0,0 +1,14 @@
+from audio_sd import AudioEngineSD
+from sequencer import Pattern, Sequencer, Track, make_empty_pattern
+
+def test_play_step_skips_zero_width_patterns(config):
+    engine = AudioEngineSD(config, start_stream=False)
+    empty = Pattern([Track(pad.id, []) for pad in config.pads], config.bpm, config.beats_per_bar)
+    assert empty.steps.shape[1] == 0
+    seq = Sequencer(make_empty_pattern(config), make_empty_pattern(config), make_empty_pattern(config), engine)
+    seq.patterns['A'].tracks[0].steps[0].state = 1
+    seq.patterns['B'] = empty
+    for pad in config.pads[1:]:
+        seq.track_pattern_keys[pad.id] = 'B'
+    seq._play_step()
+    assert len(engine.pending_voices) == 1
@@ -0,0 +1,32 @@
+import os
+import threading
+from types import SimpleNamespace
+import session
+from audio_sd import AudioEngineSD
+from sequencer import Sequencer, make_empty_pattern
+
+def _core(config):
+    engine = AudioEngineSD(config, start_stream=False)
+    seq = Sequencer(make_empty_pattern(config), make_empty_pattern(config), make_empty_pattern(config), engine)
+    return SimpleNamespace(lock=threading.RLock(), seq=seq, audio=engine)
+
+def test_patterns_dropped_by_a_bank_replace_stay_gone_after_recovery(config, tmp_path):
+    core = _core(config)
+    path = os.path.join(tmp_path, "song.gbx")
+    core.seq.patterns['C'].tracks[0].steps[0].state = 1
+    fields = session.session_fields(core.seq, core.audio)
+    session.write_snapshot(path, fields, 1)
+    writer = session.SessionWriter(core)
+    writer.open(path, fields, 1, 0)
+
+    # e.g. loading another session over this one
+    core.seq.set_patterns({'A': make_empty_pattern(config)})
+    writer.notify()
+    writer.close()
+
+    fields, _, _ = session.load(path)
+    assert 'patterns/C/steps' in session.read_snapshot(path)[0]
+    assert not any(name.startswith('patterns/C/') for name in fields)
+    restored = _core(config)
+    session.restore_fields(fields, restored.seq, restored.audio)
+    assert sorted(restored.seq.patterns) == sorted(core.seq.patterns)